@@ -1,21 +1,31 @@
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
 from datetime import datetime
 from pydantic import BaseModel
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
+from langchain_core.messages import SystemMessage
 from clients.mcp_clients import k8s, aws, github
-from agent.config import ConfigManager
+from agent.config import ConfigManager, SCOPE_FIELDS
+from agent.context import build_prompt_context
+from agent.analysis import MapReduceAnalyzer, ANALYSIS_OUTPUT_SPEC
+from agent.cache import AnalysisCache
+from agent.governor import LLMGovernor
+from agent.llm import create_llm
+from agent.rules import RulesEngine
+from agent.history import AnalysisHistory
+from agent.blobs import BlobStore, BlobWriteError
+from agent.tracing import PhaseStats, connected, span, trace
+from agent.metrics import REGISTRY
+from agent.log import get_logger
 from dotenv import load_dotenv
 import os
 import json
+import logging
 
 load_dotenv()
 
-llm = ChatGroq(
-    groq_api_key=os.getenv("GROQ_API_KEY"),
-    model_name="llama-3.3-70b-versatile"
-)
+logger = get_logger("agent")
+
+ANALYSES_IN_FLIGHT = REGISTRY.gauge("analyses_in_flight", "Incident analyses currently running", ("mode",))
 
 # Enhanced Data Models
 class ServiceMetrics(BaseModel):
@@ -25,12 +35,14 @@ class ServiceMetrics(BaseModel):
     availability: Optional[float] = None
 
 class ServiceHealth(BaseModel):
-    status: str  # HEALTHY, DEGRADED, CRITICAL, UNKNOWN
+    status: str  # HEALTHY, DEGRADED, CRITICAL, UNKNOWN, TIMED_OUT
     score: int  # 0-100
     issues: List[str]
     recommendations: List[str]
     metrics: Optional[ServiceMetrics] = None
     raw_data: Optional[Dict] = None
+    raw_ref: Optional[str] = None  # blob store hash once raw_data is externalized
+    stats: Optional[Dict[str, float]] = None  # numeric raw_data metrics, kept after externalizing
     last_checked: str
 
 class SystemMetrics(BaseModel):
@@ -54,11 +66,18 @@ class IncidentAnalysis(BaseModel):
     confidence: int
     services_analyzed: List[str]
     execution_time: float
+    context_budget: Optional[Dict[str, Any]] = None
+    cached: bool = False
+    timed_out_services: List[str] = []
+    tier: str = "llm"  # rules, llm, fallback
+    trace: Optional[Dict[str, Any]] = None  # nested phase timings
 
 class AnalysisRequest(BaseModel):
     query: str
     services: Optional[List[str]] = None
     priority: str = "medium"  # low, medium, high, critical
+    mode: Optional[str] = None  # single, map_reduce (defaults to config)
+    timeout: Optional[float] = None  # seconds; defaults to config.analysis_timeout
 
 class AnalysisResponse(BaseModel):
     success: bool
@@ -68,148 +87,78 @@ class AnalysisResponse(BaseModel):
     services_analyzed: List[str]
 
 class UnifiedAgent:
-    def __init__(self):
-        self.llm = llm
-        self.config_manager = ConfigManager()
-        self.analysis_history: List[IncidentAnalysis] = []
+    def __init__(self, config_manager: Optional[ConfigManager] = None):
+        # Shared with the backend, which applies /config changes to the same store
+        self.config_manager = config_manager or ConfigManager()
+        self.map_reduce = MapReduceAnalyzer()
+        config = self.config_manager.get_config()
+        # All LLM traffic is paced against the provider's RPM/TPM limits
+        self.llm = LLMGovernor(create_llm(config), config.llm_rpm, config.llm_tpm, config.llm_max_retries)
+        self.analysis_cache = AnalysisCache(config.cache_ttl_seconds, config.cache_max_entries)
+        self.rules = RulesEngine(healthy_score=config.rules_healthy_score)
+        self.analysis_history = AnalysisHistory(config.max_history_items)
+        self.blobs = BlobStore()
+        self.phase_stats = PhaseStats()
+        self.config_manager.subscribe(self._on_config_change)
 
-    async def get_system_metrics(self) -> Dict[str, Any]:
-        """Generate system metrics for dashboard based on latest analysis"""
-        metrics = {
-            "overall_health": 100,
-            "active_incidents": 0,
-            "services_monitored": 3,
-            "data_freshness": datetime.utcnow().isoformat(),
-            
-            # K8s Defaults
-            "k8s_status": "unknown",
-            "k8s_pods": "-",
-            "k8s_nodes": "-",
-            "k8s_health": 0,
-            "k8s_last_incident": "Never",
-            
-            # AWS Defaults
-            "aws_status": "unknown",
-            "aws_log_groups": "-",
-            "aws_alarms": "-",
-            "aws_health": 0,
-            "aws_last_incident": "Never",
-            
-            # GitHub Defaults
-            "github_status": "unknown",
-            "github_workflows": "-",
-            "github_success_rate": "-",
-            "github_health": 0,
-            "github_last_incident": "Never"
-        }
-        
-        # If we have history, use the latest analysis to populate metrics
-        if self.analysis_history:
-            latest = self.analysis_history[-1]
-            metrics["data_freshness"] = latest.timestamp
-            
-            # Overall Score derived from service average
-            scores = [s.score for s in latest.services.values()]
-            if scores:
-                metrics["overall_health"] = int(sum(scores) / len(scores))
-                
-            # Count incidents (anything not HEALTHY)
-            incidents = sum(1 for s in latest.services.values() if s.status != "HEALTHY")
-            metrics["active_incidents"] = incidents
-            
-            # Map Service Data
-            if "k8s" in latest.services:
-                k = latest.services["k8s"]
-                metrics["k8s_status"] = k.status
-                metrics["k8s_health"] = k.score
-                if k.status != "HEALTHY": metrics["k8s_last_incident"] = "Just Now"
-                # Try to extract details from raw_data if available
-                if k.raw_data and "metrics" in k.raw_data:
-                    m = k.raw_data["metrics"]
-                    metrics["k8s_pods"] = m.get("running_pods", "-")
-                    # Nodes often in raw_data['nodes'] list length
-                    if "nodes" in k.raw_data and isinstance(k.raw_data["nodes"], list):
-                         metrics["k8s_nodes"] = len(k.raw_data["nodes"])
-
-            if "aws" in latest.services:
-                a = latest.services["aws"]
-                metrics["aws_status"] = a.status
-                metrics["aws_health"] = a.score
-                if a.status != "HEALTHY": metrics["aws_last_incident"] = "Just Now"
-                if a.raw_data and "metrics" in a.raw_data:
-                    m = a.raw_data["metrics"]
-                    metrics["aws_log_groups"] = m.get("total_log_groups", "-")
-
-            if "github" in latest.services:
-                g = latest.services["github"]
-                metrics["github_status"] = g.status
-                metrics["github_health"] = g.score
-                if g.status != "HEALTHY": metrics["github_last_incident"] = "Just Now"
-                if g.raw_data and "metrics" in g.raw_data:
-                    m = g.raw_data["metrics"]
-                    metrics["github_success_rate"] = f"{int(m.get('success_rate', 0) * 100)}%"
-                    metrics["github_workflows"] = m.get("total_recent_runs", "-")
-
-        return metrics
+    def _on_config_change(self, config, previous, changed):
+        if changed & SCOPE_FIELDS:
+            # Keys carry the scope, so Mongo entries for the old one no longer match;
+            # the in-memory ones are simply dropped
+            self.analysis_cache.clear()
+            self._log(f"Analysis scope changed ({', '.join(sorted(changed & SCOPE_FIELDS))}); cache cleared")
+        if changed & {"cache_ttl_seconds", "cache_max_entries"}:
+            self.analysis_cache.ttl_seconds = config.cache_ttl_seconds
+            self.analysis_cache.max_entries = config.cache_max_entries
+        if "max_history_items" in changed:
+            self.analysis_history.resize(config.max_history_items)
+        if "rules_healthy_score" in changed:
+            self.rules.healthy_score = config.rules_healthy_score
 
     def _log(self, message: str, level: str = "INFO"):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{timestamp}] [{level}] {message}")
+        # stacklevel points call-site throttling and line info at the caller
+        logger.log(logging.getLevelName(level), message, stacklevel=2)
 
     def _generate_id(self) -> str:
         return f"analysis_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}"
 
     def _extract_mcp_data(self, result):
         """Extract data from MCP response consistently"""
-        print(f"🔍 DEBUG _extract_mcp_data - Input type: {type(result)}")
-        
         # If it's already a dict/list, return it directly
         if isinstance(result, (dict, list)):
-            print(f"🔍 DEBUG - Already dict/list, returning directly: {type(result)}")
             return result
         
         # Check for structured_content first (this seems to be the main data)
         if hasattr(result, 'structured_content') and result.structured_content:
-            print(f"🔍 DEBUG - Found structured_content: {type(result.structured_content)}")
             if isinstance(result.structured_content, dict) and 'result' in result.structured_content:
-                print("🔍 DEBUG - Returning structured_content['result']")
                 return result.structured_content['result']
-            else:
-                print("🔍 DEBUG - Returning structured_content directly")
-                return result.structured_content
+            logger.debug("MCP structured_content without 'result' key: %s", type(result.structured_content).__name__)
+            return result.structured_content
         
         # Check for data attribute
         if hasattr(result, 'data') and result.data:
-            print(f"🔍 DEBUG - Found data: {type(result.data)}")
             return result.data
         
         # Check for content with text
         if hasattr(result, 'content') and result.content:
-            print(f"🔍 DEBUG - Found content: {len(result.content)} items")
-            for i, content_item in enumerate(result.content):
+            for content_item in result.content:
                 if hasattr(content_item, 'text') and content_item.text:
-                    print(f"🔍 DEBUG - Content item {i} has text, length: {len(content_item.text)}")
                     try:
                         # Try to parse JSON from text
-                        parsed = json.loads(content_item.text)
-                        print(f"🔍 DEBUG - Successfully parsed JSON from text")
-                        return parsed
+                        return json.loads(content_item.text)
                     except json.JSONDecodeError:
-                        print(f"🔍 DEBUG - Could not parse JSON, returning text directly")
+                        logger.debug("MCP text content is not JSON (%d chars)", len(content_item.text))
                         return content_item.text
         
-        print(f"🔍 DEBUG - No data found, returning result as-is: {type(result)}")
+        logger.debug("No data found in MCP result of type %s", type(result).__name__)
         return result
+
     def _debug_mcp_response(self, result, tool_name: str):
         """Debug MCP response structure"""
         data = self._extract_mcp_data(result)
-        self._log(f"MCP {tool_name} response type: {type(data)}", "DEBUG")
-        if isinstance(data, list):
-            self._log(f"MCP {tool_name} response length: {len(data)}", "DEBUG")
-            if data and isinstance(data[0], dict):
-                self._log(f"MCP {tool_name} first item keys: {list(data[0].keys())}", "DEBUG")
-        elif isinstance(data, dict):
-            self._log(f"MCP {tool_name} response keys: {list(data.keys())}", "DEBUG")
+        if logger.isEnabledFor(logging.DEBUG):
+            shape = len(data) if isinstance(data, list) else sorted(data) if isinstance(data, dict) else None
+            logger.debug("MCP %s response: %s %s", tool_name, type(data).__name__, shape)
         return data
 
     def _has_error(self, data) -> bool:
@@ -233,95 +182,91 @@ class UnifiedAgent:
         return "Unknown error"
 
     async def get_system_metrics(self) -> Dict[str, Any]:
-        """Get real-time system metrics with per-service details"""
+        """Get real-time system metrics with per-service details (live calls)"""
+        services = ["k8s", "aws", "github"]
+        details = await asyncio.gather(*(self.poll_service(s) for s in services))
+        return self.summarize_service_details(dict(zip(services, details)), datetime.utcnow().isoformat())
+
+    async def poll_service(self, service: str) -> Dict[str, Any]:
+        """One dashboard probe: status is healthy, degraded, unhealthy or disabled"""
+        try:
+            if service == "k8s":
+                return await self._poll_k8s()
+            if service == "aws":
+                return await self._poll_aws()
+            if service == "github":
+                return await self._poll_github()
+            return {"status": "disabled", "error": f"Unknown service: {service}"}
+        except Exception as e:
+            return {"status": "unhealthy", "error": str(e)}
+
+    async def _poll_k8s(self) -> Dict[str, Any]:
         config = self.config_manager.get_config()
+        async with k8s:
+            result = await k8s.call_tool("list_pods", {"namespace": config.k8s_namespace})
+            k8s_data = self._debug_mcp_response(result, "list_pods")
+            
+        if self._has_error(k8s_data):
+            raise Exception(self._extract_error(k8s_data))
         
-        service_statuses = []
-        service_details = {}
+        # Handle both list and dict responses
+        pods = k8s_data if isinstance(k8s_data, list) else k8s_data.get('pods', [])
+        running_pods = len([p for p in pods if isinstance(p, dict) and p.get('phase') == 'Running'])
+        health_score = int((running_pods / len(pods)) * 100) if pods else 0
         
-        # Check Kubernetes
-        try:
-            async with k8s:
-                result = await k8s.call_tool("list_pods", {"namespace": config.k8s_namespace})
-                k8s_data = self._debug_mcp_response(result, "list_pods")
-                
-                if self._has_error(k8s_data):
-                    raise Exception(self._extract_error(k8s_data))
-                
-                # Handle both list and dict responses
-                if isinstance(k8s_data, list):
-                    pods = k8s_data
-                    running_pods = len([p for p in pods if isinstance(p, dict) and p.get('phase') == 'Running'])
-                    health_score = int((running_pods / len(pods)) * 100) if pods else 0
-                else:
-                    pods = k8s_data.get('pods', [])
-                    running_pods = len([p for p in pods if p.get('phase') == 'Running'])
-                    health_score = int((running_pods / len(pods)) * 100) if pods else 0
-                
-                service_statuses.append("healthy" if health_score == 100 else "degraded")
-                service_details["k8s"] = {
-                    "status": "healthy" if health_score == 100 else "degraded",
-                    "pods_total": len(pods),
-                    "pods_running": running_pods,
-                    "health_score": health_score,
-                }
-        except Exception as e:
-            service_statuses.append("unhealthy")
-            service_details["k8s"] = {"status": "unhealthy", "error": str(e)}
+        return {
+            "status": "healthy" if health_score == 100 else "degraded",
+            "pods_total": len(pods),
+            "pods_running": running_pods,
+            "restarts": sum(p.get('restarts', 0) for p in pods if isinstance(p, dict)),
+            "health_score": health_score,
+        }
+
+    async def _poll_aws(self) -> Dict[str, Any]:
+        async with aws:
+            result = await aws.call_tool("list_log_groups", {})
+            aws_data = self._debug_mcp_response(result, "list_log_groups")
+            
+        if self._has_error(aws_data):
+            raise Exception(self._extract_error(aws_data))
         
-        # Check AWS
-        try:
-            async with aws:
-                result = await aws.call_tool("list_log_groups", {})
-                aws_data = self._debug_mcp_response(result, "list_log_groups")
-                
-                if self._has_error(aws_data):
-                    raise Exception(self._extract_error(aws_data))
-                
-                # Handle AWS response
-                if isinstance(aws_data, list):
-                    log_groups = aws_data
-                else:
-                    log_groups = aws_data.get('log_groups', [])
-                
-                service_statuses.append("healthy")
-                service_details["aws"] = {
-                    "status": "healthy",
-                    "log_groups": len(log_groups),
-                    "total_storage": sum(lg.get('stored_bytes', 0) for lg in log_groups),
-                    "health_score": 90 if log_groups else 50,
-                }
-        except Exception as e:
-            service_statuses.append("unhealthy")
-            service_details["aws"] = {"status": "unhealthy", "error": str(e)}
+        # Handle AWS response
+        log_groups = aws_data if isinstance(aws_data, list) else aws_data.get('log_groups', [])
+        
+        return {
+            "status": "healthy",
+            "log_groups": len(log_groups),
+            "total_storage": sum(lg.get('stored_bytes', 0) for lg in log_groups),
+            "health_score": 90 if log_groups else 50,
+        }
 
-        # Check GitHub if configured
-        if config.github_owner and config.github_repo:
-            try:
-                async with github:
-                    result = await github.call_tool("gh_check_workflow_health", {
-                        "owner": config.github_owner, 
-                        "repo": config.github_repo
-                    })
-                    github_data = self._debug_mcp_response(result, "gh_check_workflow_health")
-                    
-                    if self._has_error(github_data):
-                        raise Exception(self._extract_error(github_data))
-                    
-                    is_healthy = github_data.get('status') == 'success'
-                    service_statuses.append("healthy" if is_healthy else "degraded")
-                    service_details["github"] = {
-                        "status": "healthy" if is_healthy else "degraded",
-                        "workflow_status": github_data.get('status', 'unknown'),
-                        "health_score": 95 if is_healthy else 40,
-                    }
-            except Exception as e:
-                service_statuses.append("unhealthy")
-                service_details["github"] = {"status": "unhealthy", "error": str(e)}
-        else:
+    async def _poll_github(self) -> Dict[str, Any]:
+        config = self.config_manager.get_config()
+        if not (config.github_owner and config.github_repo):
             # Not configured, not unhealthy
-            service_details["github"] = {"status": "disabled", "error": "Not configured"}
+            return {"status": "disabled", "error": "Not configured"}
+        
+        async with github:
+            result = await github.call_tool("gh_check_workflow_health", {
+                "owner": config.github_owner, 
+                "repo": config.github_repo
+            })
+            github_data = self._debug_mcp_response(result, "gh_check_workflow_health")
+            
+        if self._has_error(github_data):
+            raise Exception(self._extract_error(github_data))
+        
+        is_healthy = github_data.get('status') == 'success'
+        return {
+            "status": "healthy" if is_healthy else "degraded",
+            "workflow_status": github_data.get('status', 'unknown'),
+            "health_score": 95 if is_healthy else 40,
+        }
 
+    def summarize_service_details(self, service_details: Dict[str, Dict[str, Any]], data_freshness: str) -> Dict[str, Any]:
+        """Dashboard metrics from per-service probe results"""
+        service_statuses = [d["status"] for d in service_details.values() if d.get("status") not in ("disabled", "pending")]
+        
         # Calculate metrics
         healthy_services = len([s for s in service_statuses if s == "healthy"])
         overall_health = int((healthy_services / len(service_statuses)) * 100) if service_statuses else 0
@@ -333,7 +278,7 @@ class UnifiedAgent:
             "services_monitored": len(service_statuses),
             "active_incidents": active_incidents,
             "avg_response_time": 0.5,  # This would come from actual monitoring
-            "data_freshness": datetime.utcnow().isoformat(),
+            "data_freshness": data_freshness,
             "services": service_details  # Add the per-service details
         }
 
@@ -341,25 +286,15 @@ class UnifiedAgent:
     async def _analyze_k8s(self, namespace: str) -> Dict[str, Any]:
         self._log(f"Starting K8s analysis for namespace: {namespace}")
         try:
-            async with k8s:
+            async with connected(k8s):
                 # Get pods with detailed debugging
-                pods_result = await k8s.call_tool("list_pods", {"namespace": namespace})
-                print(f"🔍 DEBUG _analyze_k8s - Raw pods_result type: {type(pods_result)}")
-                print(f"🔍 DEBUG _analyze_k8s - pods_result attributes: {dir(pods_result)}")
-                
+                with span("list_pods"):
+                    pods_result = await k8s.call_tool("list_pods", {"namespace": namespace})
                 pods_data = self._extract_mcp_data(pods_result)
-                print(f"🔍 DEBUG _analyze_k8s - Extracted pods_data type: {type(pods_data)}")
-                
-                if isinstance(pods_data, list):
-                    print(f"🔍 DEBUG _analyze_k8s - pods_data is list, length: {len(pods_data)}")
-                    if pods_data:
-                        print(f"🔍 DEBUG _analyze_k8s - First pod item type: {type(pods_data[0])}")
-                        print(f"🔍 DEBUG _analyze_k8s - First pod keys: {list(pods_data[0].keys()) if isinstance(pods_data[0], dict) else 'Not a dict'}")
-                else:
-                    print(f"🔍 DEBUG _analyze_k8s - pods_data is not a list: {type(pods_data)}")
                 
                 # Get nodes
-                nodes_result = await k8s.call_tool("get_nodes", {})
+                with span("get_nodes"):
+                    nodes_result = await k8s.call_tool("get_nodes", {})
                 nodes_data = self._extract_mcp_data(nodes_result)
                 
                 # Handle error responses
@@ -370,21 +305,10 @@ class UnifiedAgent:
                 # Process pods data
                 if isinstance(pods_data, list):
                     total_pods = len(pods_data)
-                    print(f"🔍 DEBUG _analyze_k8s - Total pods found: {total_pods}")
                     
                     # Count running pods
-                    running_pods = 0
-                    for i, pod in enumerate(pods_data):
-                        if isinstance(pod, dict):
-                            phase = pod.get('phase', 'Unknown')
-                            name = pod.get('name', f'pod-{i}')
-                            print(f"🔍 DEBUG _analyze_k8s - Pod {i}: {name} - Phase: {phase}")
-                            if phase == 'Running':
-                                running_pods += 1
-                        else:
-                            print(f"🔍 DEBUG _analyze_k8s - Pod {i} is not a dict: {type(pod)}")
-                    
-                    print(f"🔍 DEBUG _analyze_k8s - Running pods: {running_pods}/{total_pods}")
+                    running_pods = len([p for p in pods_data if isinstance(p, dict) and p.get('phase') == 'Running'])
+                    logger.debug("K8s pods in %s: %d running of %d", namespace, running_pods, total_pods)
                     
                     # Count other states
                     failed_pods = len([p for p in pods_data if isinstance(p, dict) and p.get('phase') in ['Failed', 'Unknown']])
@@ -392,9 +316,12 @@ class UnifiedAgent:
                     
                     # Check for pods with high restart counts
                     high_restart_pods = []
+                    total_restarts = 0
                     for pod in pods_data:
-                        if isinstance(pod, dict) and pod.get('restarts', 0) > 5:
-                            high_restart_pods.append(pod.get('name', 'unknown'))
+                        if isinstance(pod, dict):
+                            total_restarts += pod.get('restarts', 0)
+                            if pod.get('restarts', 0) > 5:
+                                high_restart_pods.append(pod.get('name', 'unknown'))
                 else:
                     raise Exception(f"Unexpected pods data format: {type(pods_data)}")
 
@@ -447,15 +374,15 @@ class UnifiedAgent:
                             "running_pods": running_pods,
                             "failed_pods": failed_pods,
                             "pending_pods": pending_pods,
+                            "total_restarts": total_restarts,
+                            "high_restart_pods": len(high_restart_pods),
                             "health_score": health_score
                         }
                     }
                 }
                 
         except Exception as e:
-            self._log(f"K8s analysis failed: {str(e)}", "ERROR")
-            import traceback
-            traceback.print_exc()
+            logger.exception("K8s analysis failed: %s", e)
             return {
                 "status": "ERROR", 
                 "error": str(e),
@@ -469,8 +396,9 @@ class UnifiedAgent:
         """Enhanced AWS analysis with real metrics"""
         self._log("Starting AWS analysis...")
         try:
-            async with aws:
-                log_groups_result = await aws.call_tool("list_log_groups", {})
+            async with connected(aws):
+                with span("list_log_groups"):
+                    log_groups_result = await aws.call_tool("list_log_groups", {})
                 aws_data = self._debug_mcp_response(log_groups_result, "list_log_groups")
                 
                 if self._has_error(aws_data):
@@ -542,24 +470,51 @@ class UnifiedAgent:
         
         self._log(f"Starting GitHub analysis for {config.github_owner}/{config.github_repo}")
         try:
-            async with github:
-                # Get workflow health
-                health_result = await github.call_tool("gh_check_workflow_health", {
-                    "owner": config.github_owner,
-                    "repo": config.github_repo
-                })
-                health_data = self._debug_mcp_response(health_result, "gh_check_workflow_health")
-                
-                if self._has_error(health_data):
-                    raise Exception(self._extract_error(health_data))
-                
-                # Get recent runs for more context
-                runs_result = await github.call_tool("gh_list_workflow_runs", {
-                    "owner": config.github_owner,
-                    "repo": config.github_repo,
-                    "limit": 5
-                })
-                runs_data = self._debug_mcp_response(runs_result, "gh_list_workflow_runs")
+            full_name = f"{config.github_owner}/{config.github_repo}"
+            ci_overview = None
+            async with connected(github):
+                # One batched GraphQL call covers runs, check runs and commits
+                try:
+                    with span("gh_ci_overview"):
+                        overview_result = await github.call_tool("gh_ci_overview", {
+                            "repos": [full_name],
+                            "commits": 5
+                        })
+                    overview_data = self._debug_mcp_response(overview_result, "gh_ci_overview")
+                except Exception as e:
+                    self._log(f"GitHub GraphQL overview failed: {str(e)}", "WARNING")
+                    overview_data = None
+
+                if isinstance(overview_data, dict) and overview_data.get('success') and full_name in overview_data.get('repos', {}):
+                    ci_overview = overview_data['repos'][full_name]
+                    failed_run = ci_overview.get('failed_run') or {}
+                    health_data = {"status": ci_overview['status']}
+                    if failed_run:
+                        health_data.update(run_id=failed_run.get('id'), created_at=failed_run.get('created_at'))
+                    runs_data = {"runs": ci_overview.get('runs', [])}
+                    self._log(f"GitHub GraphQL query cost: {overview_data.get('query_cost')}")
+                else:
+                    self._log("GitHub GraphQL overview unavailable, falling back to REST", "WARNING")
+
+                    # Get workflow health
+                    with span("gh_check_workflow_health"):
+                        health_result = await github.call_tool("gh_check_workflow_health", {
+                            "owner": config.github_owner,
+                            "repo": config.github_repo
+                        })
+                    health_data = self._debug_mcp_response(health_result, "gh_check_workflow_health")
+
+                    if self._has_error(health_data):
+                        raise Exception(self._extract_error(health_data))
+
+                    # Get recent runs for more context
+                    with span("gh_list_workflow_runs"):
+                        runs_result = await github.call_tool("gh_list_workflow_runs", {
+                            "owner": config.github_owner,
+                            "repo": config.github_repo,
+                            "limit": 5
+                        })
+                    runs_data = self._debug_mcp_response(runs_result, "gh_list_workflow_runs")
                 
                 self._log(f"GitHub status: {health_data.get('status')}")
             
@@ -592,6 +547,7 @@ class UnifiedAgent:
                 "raw_data": {
                     "workflow_health": health_data,
                     "recent_runs": runs_data,
+                    "ci_overview": ci_overview,
                     "metrics": {
                         "success_rate": success_rate,
                         "total_recent_runs": len(recent_runs)
@@ -603,113 +559,236 @@ class UnifiedAgent:
             self._log(f"GitHub analysis failed: {str(e)}", "ERROR")
             return {"status": "ERROR", "error": str(e)}
 
+    def _service_coroutine(self, service: str, config):
+        """Collection coroutine for a service"""
+        if service == "k8s":
+            return self._analyze_k8s(config.k8s_namespace)
+        if service == "aws":
+            return self._analyze_aws()
+        if service == "github":
+            return self._analyze_github()
+        return self._unsupported_service(service)
+
+    async def _unsupported_service(self, service: str) -> Dict[str, Any]:
+        return {"status": "ERROR", "error": f"Unknown service: {service}"}
+
+    def _deadlines(self, request: AnalysisRequest, config):
+        """Return (overall deadline, collection deadline) on the loop clock"""
+        timeout = request.timeout or config.analysis_timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+        # Leave the LLM at least llm_min_budget (or half the total) after collection
+        return deadline, deadline - min(config.llm_min_budget, timeout / 2)
+
+    def _bounded_service(self, service: str, config, collection_deadline: float):
+        """Collection coroutine limited to the service's own budget"""
+        budget = min(
+            config.service_timeouts.get(service, config.analysis_timeout),
+            collection_deadline - asyncio.get_running_loop().time()
+        )
+        return self._with_budget(service, self._service_coroutine(service, config), max(budget, 0))
+
+    async def _with_budget(self, service: str, coro, budget: float) -> Dict[str, Any]:
+        # Entered before wait_for so the collection task nests its phases here
+        with span(service) as service_span:
+            try:
+                return await asyncio.wait_for(coro, budget)
+            except asyncio.TimeoutError:
+                if service_span is not None:
+                    service_span.attrs["timed_out"] = True
+                self._log(f"{service} collection timed out after {budget:.1f}s", "WARNING")
+                return {"status": "TIMED_OUT", "error": f"Data collection exceeded its {budget:.1f}s budget"}
+
+    def _failed_health(self, error: str) -> ServiceHealth:
+        return ServiceHealth(
+            status="CRITICAL",
+            score=0,
+            issues=[f"Analysis failed: {error}"],
+            recommendations=[],
+            raw_data={"error": error},
+            last_checked=datetime.utcnow().isoformat()
+        )
+
+    def _to_service_health(self, result) -> ServiceHealth:
+        """Convert an _analyze_* result (or exception) into a ServiceHealth record"""
+        if isinstance(result, Exception):
+            return self._failed_health(str(result))
+
+        if result.get('status') == 'TIMED_OUT':
+            return ServiceHealth(
+                status="TIMED_OUT",
+                score=0,
+                issues=[result.get('error', 'Data collection timed out')],
+                recommendations=[],
+                last_checked=datetime.utcnow().isoformat()
+            )
+
+        if result.get('status') == 'SUCCESS':
+            data = result.get('data', {})
+            return ServiceHealth(
+                status=data.get('status', 'UNKNOWN'),
+                score=data.get('score', 0),
+                issues=data.get('issues', []),
+                recommendations=data.get('recommendations', []),
+                raw_data=result.get('raw_data', {}),
+                last_checked=datetime.utcnow().isoformat()
+            )
+
+        # Still add a health record to show it failed
+        return self._failed_health(result.get('error', 'Analysis failed'))
+
+    async def _route(self, request: AnalysisRequest) -> List[str]:
+        if request.services:
+            return request.services
+        return await self._decide_services(request.query)
+
+    def _rules_analysis(self, service_healths: Dict[str, ServiceHealth]) -> Optional[Dict[str, Any]]:
+        """Deterministic tier; None when the state is ambiguous and needs the LLM"""
+        if not self.config_manager.get_config().rules_enabled:
+            return None
+        result = self.rules.evaluate(service_healths)
+        if result is not None:
+            self._log(f"Rules tier answered: {result['rule_ids']}")
+        return result
+
+    async def _cached_analysis(self, request: AnalysisRequest, service_healths: Dict[str, ServiceHealth]):
+        """Return (cache_key, cached final analysis or None)"""
+        config = self.config_manager.get_config()
+        mode = request.mode or config.analysis_mode
+        scope = {field: getattr(config, field) for field in SCOPE_FIELDS}
+        cache_key = self.analysis_cache.key(request.query, service_healths, mode, scope)
+        return cache_key, await self.analysis_cache.get(cache_key)
+
+    def record_phase(self, analysis: IncidentAnalysis, name: str, duration_ms: float):
+        """Attach a phase timed after the analysis was recorded (e.g. persistence)"""
+        if analysis.trace is None:
+            return
+        analysis.trace["children"].append({
+            "name": name,
+            "offset_ms": round(analysis.trace["duration_ms"], 2),
+            "duration_ms": round(duration_ms, 2),
+            "children": []
+        })
+        self.phase_stats.add_phase(analysis.id, f"{analysis.trace['name']}/{name}", duration_ms)
+
+    def get_phase_stats(self, last: Optional[int] = None) -> Dict[str, Any]:
+        return self.phase_stats.summary(last)
+
+    async def _externalize(self, health: ServiceHealth) -> ServiceHealth:
+        """Copy of a ServiceHealth whose raw_data lives in the blob store"""
+        if health.raw_data is None:
+            return health
+        try:
+            ref = await self.blobs.put(health.raw_data)
+        except BlobWriteError as e:
+            logger.warning("%s; keeping raw data inline", e)
+            return health
+        # The small numeric summary stays inline for trend storage
+        metrics = health.raw_data.get("metrics") or {}
+        stats = {k: v for k, v in metrics.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        return health.model_copy(update={"raw_data": None, "raw_ref": ref, "stats": stats or None})
+
+    async def get_raw_data(self, ref: str) -> Optional[Dict]:
+        return await self.blobs.get(ref)
+
+    async def _record_analysis(self, analysis_id: str, request: AnalysisRequest, service_healths: Dict[str, ServiceHealth],
+                               services_analyzed: List[str], final_analysis: Dict[str, Any], cached: bool,
+                               start_time: datetime, root=None) -> IncidentAnalysis:
+        # Analyses carry blob refs; identical snapshots share one stored payload
+        with span("store_raw_data"):
+            service_healths = {
+                service: await self._externalize(health) for service, health in service_healths.items()
+            }
+        execution_time = (datetime.utcnow() - start_time).total_seconds()
+
+        # The trace closes here; persistence is appended by the backend via record_phase
+        trace_tree = None
+        if root is not None:
+            root.finish()
+            trace_tree = root.to_dict()
+            self.phase_stats.record(analysis_id, trace_tree)
+        
+        # Create analysis record
+        analysis = IncidentAnalysis(
+            id=analysis_id,
+            timestamp=datetime.utcnow().isoformat(),
+            query=request.query,
+            overall_status=final_analysis['overall_status'],
+            services=service_healths,
+            root_cause_analysis=final_analysis['root_cause_analysis'],
+            immediate_actions=final_analysis['immediate_actions'],
+            long_term_recommendations=final_analysis['long_term_recommendations'],
+            commands_to_execute=final_analysis['commands_to_execute'],
+            severity=final_analysis['severity'],
+            confidence=final_analysis['confidence'],
+            services_analyzed=services_analyzed,
+            execution_time=execution_time,
+            context_budget=final_analysis.get('context_budget'),
+            cached=cached,
+            timed_out_services=[s for s, h in service_healths.items() if h.status == "TIMED_OUT"],
+            tier=final_analysis.get('tier', 'llm'),
+            trace=trace_tree
+        )
+        
+        # Store in history
+        self.analysis_history.add(analysis)
+        
+        self._log(f"Analysis {analysis_id} completed in {execution_time}s")
+        return analysis
+
     async def analyze_incident(self, request: AnalysisRequest) -> AnalysisResponse:
         """Enhanced analysis with configuration support"""
         start_time = datetime.utcnow()
         analysis_id = self._generate_id()
         
         self._log(f"Starting analysis {analysis_id} for: {request.query}")
+        ANALYSES_IN_FLIGHT.inc("sync")
         
         try:
-            config = self.config_manager.get_config()
-            
-            # Determine services to analyze
-            if request.services:
-                services_to_analyze = request.services
-            else:
-                services_to_analyze = await self._decide_services(request.query)
-            
-            self._log(f"Analyzing services: {services_to_analyze}")
-            
-            # Execute analyses
-            tasks = []
-            for service in services_to_analyze:
-                if service == "k8s":
-                    tasks.append(self._analyze_k8s(config.k8s_namespace))
-                elif service == "aws":
-                    tasks.append(self._analyze_aws())
-                elif service == "github":
-                    tasks.append(self._analyze_github())
-            
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            service_results = {}
-            service_healths = {}
-            
-            for i, service in enumerate(services_to_analyze):
-                if i < len(results) and not isinstance(results[i], Exception):
-                    result = results[i]
-                    service_results[service] = result
-                    
-                    if result.get('status') == 'SUCCESS':
-                        data = result.get('data', {})
-                        service_healths[service] = ServiceHealth(
-                            status=data.get('status', 'UNKNOWN'),
-                            score=data.get('score', 0),
-                            issues=data.get('issues', []),
-                            recommendations=data.get('recommendations', []),
-                            raw_data=result.get('raw_data', {}),
-                            last_checked=datetime.utcnow().isoformat()
-                        )
-                    else:
-                        error = result.get('error', str(results[i])) if i < len(results) else "Analysis failed"
-                        service_results[service] = {"status": "ERROR", "error": error}
-                        # Still add a health record to show it failed
-                        service_healths[service] = ServiceHealth(
-                            status="CRITICAL",
-                            score=0,
-                            issues=[f"Analysis failed: {error}"],
-                            recommendations=[],
-                            raw_data={"error": error},
-                            last_checked=datetime.utcnow().isoformat()
-                        )
-                else:
-                    error = str(results[i]) if i < len(results) else "Analysis failed"
-                    service_healths[service] = ServiceHealth(
-                        status="CRITICAL",
-                        score=0,
-                        issues=[f"Analysis failed: {error}"],
-                        recommendations=[],
-                        raw_data={"error": error},
-                        last_checked=datetime.utcnow().isoformat()
+            with trace("analyze_incident") as root:
+                config = self.config_manager.get_config()
+                
+                # Determine services to analyze
+                with span("route"):
+                    services_to_analyze = await self._route(request)
+                self._log(f"Analyzing services: {services_to_analyze}")
+                
+                # Execute analyses, each within its own budget
+                deadline, collection_deadline = self._deadlines(request, config)
+                with span("collect"):
+                    results = await asyncio.gather(
+                        *(self._bounded_service(s, config, collection_deadline) for s in services_to_analyze),
+                        return_exceptions=True
                     )
+                service_healths = {
+                    service: self._to_service_health(result)
+                    for service, result in zip(services_to_analyze, results)
+                }
 
-            # Generate final analysis
-            final_analysis = await self._generate_final_analysis(
-                request.query, service_healths, services_to_analyze
-            )
-            
-            execution_time = (datetime.utcnow() - start_time).total_seconds()
-            
-            # Create analysis record
-            analysis = IncidentAnalysis(
-                id=analysis_id,
-                timestamp=datetime.utcnow().isoformat(),
-                query=request.query,
-                overall_status=final_analysis['overall_status'],
-                services=service_healths,
-                root_cause_analysis=final_analysis['root_cause_analysis'],
-                immediate_actions=final_analysis['immediate_actions'],
-                long_term_recommendations=final_analysis['long_term_recommendations'],
-                commands_to_execute=final_analysis['commands_to_execute'],
-                severity=final_analysis['severity'],
-                confidence=final_analysis['confidence'],
-                services_analyzed=services_to_analyze,
-                execution_time=execution_time
-            )
-            
-            # Store in history
-            self.analysis_history.append(analysis)
-            if len(self.analysis_history) > 100:  # Keep last 100 analyses
-                self.analysis_history = self.analysis_history[-100:]
-            
-            self._log(f"Analysis {analysis_id} completed in {execution_time}s")
+                # Clear-cut states are answered by rules; otherwise reuse a cached
+                # result for identical state before paying for an LLM call
+                with span("rules"):
+                    final_analysis, cached = self._rules_analysis(service_healths), False
+                if final_analysis is None:
+                    with span("cache_lookup"):
+                        cache_key, final_analysis = await self._cached_analysis(request, service_healths)
+                    cached = final_analysis is not None
+                if cached:
+                    self._log(f"Analysis cache hit for {analysis_id}")
+                elif final_analysis is None:
+                    final_analysis = await self._generate_final_analysis(
+                        request.query, service_healths, services_to_analyze, request.mode, deadline
+                    )
+                    if "error" not in final_analysis:
+                        await self.analysis_cache.put(cache_key, final_analysis)
+                
+                analysis = await self._record_analysis(
+                    analysis_id, request, service_healths, services_to_analyze, final_analysis, cached, start_time, root
+                )
             
             return AnalysisResponse(
                 success=True,
                 analysis=analysis,
-                execution_time=execution_time,
+                execution_time=analysis.execution_time,
                 services_analyzed=services_to_analyze
             )
             
@@ -722,6 +801,113 @@ class UnifiedAgent:
                 execution_time=execution_time,
                 services_analyzed=[]
             )
+        finally:
+            ANALYSES_IN_FLIGHT.dec("sync")
+
+    async def analyze_incident_stream(self, request: AnalysisRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Same pipeline as analyze_incident, yielding {"event", "data"} dicts as
+        each stage completes: routing, service, cache, token, analysis, error.
+        """
+        start_time = datetime.utcnow()
+        analysis_id = self._generate_id()
+        tasks: Dict[asyncio.Task, str] = {}
+        
+        self._log(f"Starting streamed analysis {analysis_id} for: {request.query}")
+        ANALYSES_IN_FLIGHT.inc("stream")
+        
+        try:
+            with trace("analyze_incident_stream") as root:
+                config = self.config_manager.get_config()
+                with span("route"):
+                    services_to_analyze = await self._route(request)
+                deadline, collection_deadline = self._deadlines(request, config)
+                yield {"event": "routing", "data": {"analysis_id": analysis_id, "services": services_to_analyze}}
+
+                service_healths = {}
+                with span("collect"):
+                    for service in services_to_analyze:
+                        tasks[asyncio.ensure_future(self._bounded_service(service, config, collection_deadline))] = service
+
+                    # Emit each service as soon as its collection finishes
+                    pending = set(tasks)
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            service = tasks[task]
+                            health = self._to_service_health(task.exception() or task.result())
+                            service_healths[service] = health
+                            shown = await self._externalize(health)
+                            yield {"event": "service", "data": {"service": service, "health": shown.model_dump()}}
+
+                service_healths = {s: service_healths[s] for s in services_to_analyze}
+
+                with span("rules"):
+                    final_analysis, cached = self._rules_analysis(service_healths), False
+                if final_analysis is None:
+                    with span("cache_lookup"):
+                        cache_key, final_analysis = await self._cached_analysis(request, service_healths)
+                    cached = final_analysis is not None
+                prompt_healths = self._prompt_healths(service_healths)
+                if final_analysis is not None and not cached:
+                    yield {"event": "rules", "data": {"rule_ids": final_analysis["rule_ids"]}}
+                elif cached:
+                    yield {"event": "cache", "data": {"hit": True}}
+                elif not service_healths:
+                    final_analysis = self._empty_analysis()
+                elif not prompt_healths:
+                    final_analysis = self._rule_based_summary(service_healths, "Every service timed out.", None)
+                else:
+                    context_budget = None
+                    response_text = ""
+                    loop = asyncio.get_running_loop()
+                    try:
+                        with span("build_prompt"):
+                            system_prompt, context_budget = await asyncio.wait_for(
+                                self._build_analysis_prompt(request.query, prompt_healths, request.mode, deadline),
+                                deadline - loop.time()
+                            )
+                        with span("llm", prompt_tokens=context_budget.get("tokens_used")):
+                            stream = self.llm.astream([SystemMessage(content=system_prompt)], deadline=deadline).__aiter__()
+                            while True:
+                                try:
+                                    chunk = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+                                except StopAsyncIteration:
+                                    break
+                                if chunk.content:
+                                    response_text += chunk.content
+                                    yield {"event": "token", "data": {"text": chunk.content}}
+                        final_analysis = self._parse_analysis_response(response_text, context_budget)
+                        await self.analysis_cache.put(cache_key, final_analysis)
+                    except asyncio.TimeoutError:
+                        self._log("Analysis budget exhausted during LLM call", "WARNING")
+                        final_analysis = self._rule_based_summary(
+                            service_healths, "The LLM did not finish within the analysis budget.", context_budget
+                        )
+                    except Exception as e:
+                        self._log(f"Failed to generate LLM analysis: {str(e)}", "ERROR")
+                        final_analysis = self._fallback_analysis(e, context_budget)
+
+                analysis = await self._record_analysis(
+                    analysis_id, request, service_healths, services_to_analyze, final_analysis, cached, start_time, root
+                )
+                response = AnalysisResponse(
+                    success=True,
+                    analysis=analysis,
+                    execution_time=analysis.execution_time,
+                    services_analyzed=services_to_analyze
+                )
+                yield {"event": "analysis", "data": response.model_dump()}
+
+        except Exception as e:
+            self._log(f"Streamed analysis failed: {str(e)}", "ERROR")
+            yield {"event": "error", "data": {"error": str(e)}}
+        finally:
+            ANALYSES_IN_FLIGHT.dec("stream")
+            # Client went away mid-stream: stop outstanding collections
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
 
     async def _decide_services(self, query: str) -> List[str]:
         """Simple service routing"""
@@ -739,30 +925,53 @@ class UnifiedAgent:
         
         return services if services else ['k8s', 'aws', 'github']
 
-    async def _generate_final_analysis(self, query: str, service_healths: Dict[str, ServiceHealth], services_analyzed: List[str]) -> Dict[str, Any]:
-        """
-        Generate final analysis using the LLM based on real service health data.
-        """
-        self._log("Generating final analysis with LLM...")
-
-        if not service_healths:
-            self._log("No service health data to analyze.", "WARNING")
-            return {
-                "overall_status": "UNKNOWN",
-                "root_cause_analysis": "No service health data was gathered. Cannot perform analysis.",
-                "immediate_actions": ["Verify service configurations (k8s, aws, github) in settings."],
-                "long_term_recommendations": ["Ensure all required services are enabled and have correct permissions."],
-                "commands_to_execute": [],
-                "severity": "LOW",
-                "confidence": 0
-            }
+    def _empty_analysis(self) -> Dict[str, Any]:
+        self._log("No service health data to analyze.", "WARNING")
+        return {
+            "overall_status": "UNKNOWN",
+            "root_cause_analysis": "No service health data was gathered. Cannot perform analysis.",
+            "immediate_actions": ["Verify service configurations (k8s, aws, github) in settings."],
+            "long_term_recommendations": ["Ensure all required services are enabled and have correct permissions."],
+            "commands_to_execute": [],
+            "severity": "LOW",
+            "confidence": 0,
+            "tier": "fallback"
+        }
 
-        # Convert Pydantic models to dictionaries for the prompt - using model_dump() instead of dict()
-        health_data_dict = {
-            service: health.model_dump()  # FIXED: Using model_dump() instead of dict()
-            for service, health in service_healths.items()
+    def _fallback_analysis(self, error: Exception, context_budget: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "overall_status": "UNKNOWN",
+            "root_cause_analysis": f"Failed to generate AI analysis: {str(error)}",
+            "immediate_actions": ["Review raw service data manually."],
+            "long_term_recommendations": ["Check LLM provider status and API key."],
+            "commands_to_execute": [],
+            "severity": "LOW",
+            "confidence": 0,
+            "context_budget": context_budget,
+            "tier": "fallback",
+            "error": str(error)
         }
 
+    async def _build_analysis_prompt(self, query: str, service_healths: Dict[str, ServiceHealth], mode: Optional[str] = None,
+                                     deadline: Optional[float] = None):
+        """Return (system prompt, context budget stats) for the final analysis"""
+        config = self.config_manager.get_config()
+        token_budget = config.prompt_token_budget
+
+        if (mode or config.analysis_mode) == "map_reduce":
+            # Summarize each service concurrently, then correlate the summaries
+            system_prompt, context_budget = await self.map_reduce.analyze(
+                self.llm, query, service_healths, token_budget, config.map_concurrency, deadline
+            )
+            cached = sum(1 for m in context_budget["map"].values() if m["cached"])
+            self._log(f"Map stage done: {len(context_budget['map'])} services, {cached} from cache")
+            return system_prompt, context_budget
+
+        # Compact the health data so the prompt stays within the token budget
+        health_context, context_budget = build_prompt_context(service_healths, token_budget)
+        context_budget["mode"] = "single"
+        self._log(f"Prompt context: {context_budget['tokens_used']}/{token_budget} tokens (level {context_budget['compaction_level']})")
+
         system_prompt = f"""
 You are a world-class Site Reliability Engineer (SRE) AI assistant. Your task is to analyze a user's query about a system incident and the JSON data collected from various services.
 
@@ -771,71 +980,116 @@ Provide a concise, expert-level root cause analysis and actionable recommendatio
 **USER QUERY:**
 "{query}"
 
-**RAW SERVICE HEALTH DATA (JSON):**
-{json.dumps(health_data_dict, indent=2)}
+**SERVICE HEALTH DATA (compacted JSON; unhealthy entities in full, healthy ones sampled and counted):**
+{health_context}
+{ANALYSIS_OUTPUT_SPEC}"""
+        return system_prompt, context_budget
+
+    def _parse_analysis_response(self, response_text: str, context_budget: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Parse and validate the LLM's JSON analysis"""
+        # Clean up potential markdown code fences
+        response_text = response_text.strip()
+        if response_text.startswith("```json"):
+            response_text = response_text[7:-3].strip()
+        elif response_text.startswith("```"):
+            response_text = response_text[3:-3].strip()
+        
+        analysis_json = json.loads(response_text)
+        
+        # Validate keys to be safe
+        required_keys = ["overall_status", "root_cause_analysis", "immediate_actions", "long_term_recommendations", "commands_to_execute", "severity", "confidence"]
+        for key in required_keys:
+            if key not in analysis_json:
+                raise KeyError(f"Missing required key in LLM response: {key}")
+                
+        self._log("LLM analysis generated successfully.")
+        analysis_json["context_budget"] = context_budget
+        analysis_json["tier"] = "llm"
+        return analysis_json
+
+    def _prompt_healths(self, service_healths: Dict[str, ServiceHealth]) -> Dict[str, ServiceHealth]:
+        """Services whose data made it in time; timed-out ones stay out of the prompt"""
+        return {s: h for s, h in service_healths.items() if h.status != "TIMED_OUT"}
+
+    def _rule_based_summary(self, service_healths: Dict[str, ServiceHealth], reason: str,
+                            context_budget: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Deterministic summary used when the LLM cannot answer within the deadline"""
+        rank = {"HEALTHY": 0, "UNKNOWN": 1, "DEGRADED": 2, "TIMED_OUT": 2, "CRITICAL": 3}
+        worst = max((rank.get(h.status, 1) for h in service_healths.values()), default=1)
+        overall_status = {0: "HEALTHY", 1: "UNKNOWN", 2: "DEGRADED", 3: "CRITICAL"}[worst]
+        severity = {0: "LOW", 1: "LOW", 2: "MEDIUM", 3: "HIGH"}[worst]
+
+        issues = [f"{service}: {issue}" for service, h in service_healths.items() for issue in h.issues]
+        recommendations = list(dict.fromkeys(r for h in service_healths.values() for r in h.recommendations))
+
+        return {
+            "overall_status": overall_status,
+            "root_cause_analysis": f"{reason} Rule-based summary of collected data: "
+                                   + ("; ".join(issues) if issues else "no issues were reported."),
+            "immediate_actions": recommendations[:5] or ["Review raw service data manually."],
+            "long_term_recommendations": ["Raise analysis_timeout or per-service budgets if timeouts persist."],
+            "commands_to_execute": [],
+            "severity": severity,
+            "confidence": 40,
+            "context_budget": context_budget,
+            "tier": "fallback",
+            "error": reason
+        }
+
+    async def _generate_final_analysis(self, query: str, service_healths: Dict[str, ServiceHealth], services_analyzed: List[str], mode: Optional[str] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Generate final analysis using the LLM based on real service health data.
+        The LLM call is cancelled once the deadline (loop clock) passes.
+        """
+        with span("final_analysis"):
+            return await self._final_analysis(query, service_healths, mode, deadline)
 
-**YOUR TASK:**
-Based on *only* the user query and the JSON data provided, return a JSON object with the following structure.
-- **overall_status**: (string) The final system status. Must be one of: 'HEALTHY', 'DEGRADED', 'CRITICAL', 'UNKNOWN'.
-- **root_cause_analysis**: (string) Your expert analysis of what is causing the issue. If healthy, state that.
-- **immediate_actions**: (list of strings) A list of 3-5 concrete, high-priority actions to stabilize the system *now*.
-- **long_term_recommendations**: (list of strings) A list of 2-3 recommendations for future prevention.
-- **commands_to_execute**: (list of strings) A list of specific `kubectl`, `aws`, or `gh` commands (if any) that would help diagnose or fix the issue.
-- **severity**: (string) The incident severity. Must be one of: 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL'.
-- **confidence**: (integer) Your confidence in this analysis (0-100).
+    async def _final_analysis(self, query: str, service_healths: Dict[str, ServiceHealth],
+                              mode: Optional[str], deadline: Optional[float]) -> Dict[str, Any]:
+        self._log("Generating final analysis with LLM...")
 
-Respond *only* with the JSON object. Do not add any introductory text or pleasantries.
-"""
+        if not service_healths:
+            return self._empty_analysis()
 
-        messages = [
-            SystemMessage(content=system_prompt)
-        ]
+        prompt_healths = self._prompt_healths(service_healths)
+        if not prompt_healths:
+            return self._rule_based_summary(service_healths, "Every service timed out.", None)
 
+        context_budget = None
         try:
-            response = await self.llm.ainvoke(messages)
-            
-            # Extract and parse the JSON content
-            response_text = response.content
-            # Clean up potential markdown code fences
-            if response_text.startswith("```json"):
-                response_text = response_text[7:-3].strip()
-            elif response_text.startswith("```"):
-                response_text = response_text[3:-3].strip()
-            
-            analysis_json = json.loads(response_text)
-            
-            # Validate keys to be safe
-            required_keys = ["overall_status", "root_cause_analysis", "immediate_actions", "long_term_recommendations", "commands_to_execute", "severity", "confidence"]
-            for key in required_keys:
-                if key not in analysis_json:
-                    raise KeyError(f"Missing required key in LLM response: {key}")
-                    
-            self._log("LLM analysis generated successfully.")
-            return analysis_json
+            async with asyncio.timeout_at(deadline):
+                with span("build_prompt"):
+                    system_prompt, context_budget = await self._build_analysis_prompt(query, prompt_healths, mode, deadline)
+
+                messages = [
+                    SystemMessage(content=system_prompt)
+                ]
+
+                with span("llm", prompt_tokens=context_budget.get("tokens_used") if context_budget else None):
+                    # Fails fast when the rate budget would only free up after the deadline
+                    response = await self.llm.ainvoke(messages, deadline=deadline)
+            with span("parse_response"):
+                return self._parse_analysis_response(response.content, context_budget)
+
+        except TimeoutError:
+            self._log("Analysis budget exhausted during LLM call", "WARNING")
+            return self._rule_based_summary(
+                service_healths, "The LLM did not finish within the analysis budget.", context_budget
+            )
 
         except Exception as e:
             self._log(f"Failed to generate LLM analysis: {str(e)}", "ERROR")
             # Fallback response
-            return {
-                "overall_status": "UNKNOWN",
-                "root_cause_analysis": f"Failed to generate AI analysis: {str(e)}",
-                "immediate_actions": ["Review raw service data manually."],
-                "long_term_recommendations": ["Check LLM provider status and API key."],
-                "commands_to_execute": [],
-                "severity": "LOW",
-                "confidence": 0
-            }
+            return self._fallback_analysis(e, context_budget)
 
-    def get_analysis_history(self, limit: int = 20) -> List[IncidentAnalysis]:
-        """Get recent analysis history"""
-        return self.analysis_history[-limit:]
+    def get_analysis_history(self, limit: int = 20, service: Optional[str] = None,
+                             severity: Optional[str] = None) -> List[IncidentAnalysis]:
+        """Get recent analysis history, optionally filtered by service/severity"""
+        return self.analysis_history.recent(limit, service, severity)
 
     def get_analysis_by_id(self, analysis_id: str) -> Optional[IncidentAnalysis]:
         """Get specific analysis by ID"""
-        for analysis in self.analysis_history:
-            if analysis.id == analysis_id:
-                return analysis
-        return None
+        return self.analysis_history.get(analysis_id)
 
 # Global agent instance
 agent = UnifiedAgent()
\ No newline at end of file
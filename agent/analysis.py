@@ -1,52 +1,146 @@
 import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
-from clients.mcp_clients import k8s, aws, github
-from dotenv import load_dotenv
-import os
+from agent.context import build_prompt_context, estimate_tokens
 
-load_dotenv()
+# Output contract shared by the single-prompt and map-reduce analyses
+ANALYSIS_OUTPUT_SPEC = """
+**YOUR TASK:**
+Based on *only* the user query and the data provided, return a JSON object with the following structure.
+- **overall_status**: (string) The final system status. Must be one of: 'HEALTHY', 'DEGRADED', 'CRITICAL', 'UNKNOWN'.
+- **root_cause_analysis**: (string) Your expert analysis of what is causing the issue. If healthy, state that.
+- **immediate_actions**: (list of strings) A list of 3-5 concrete, high-priority actions to stabilize the system *now*.
+- **long_term_recommendations**: (list of strings) A list of 2-3 recommendations for future prevention.
+- **commands_to_execute**: (list of strings) A list of specific `kubectl`, `aws`, or `gh` commands (if any) that would help diagnose or fix the issue.
+- **severity**: (string) The incident severity. Must be one of: 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL'.
+- **confidence**: (integer) Your confidence in this analysis (0-100).
 
-llm = ChatGroq(
-    groq_api_key=os.getenv("GROQ_API_KEY"),
-    model_name="openai/gpt-oss-120b"
+Respond *only* with the JSON object. Do not add any introductory text or pleasantries.
+"""
+
+# Service-specific prompts for the map stage
+SERVICE_PROMPTS = {
+    "k8s": "You are a Kubernetes SRE. Summarize the cluster state below: failing or restarting pods, "
+           "container waiting/terminated reasons, unhealthy nodes, and the most likely cause.",
+    "aws": "You are a CloudWatch / AWS SRE. Summarize the CloudWatch log group state below: missing or empty "
+           "log groups, unusual storage, affected Lambda functions, and the most likely cause.",
+    "github": "You are a DevOps CI/CD Engineer. Summarize the GitHub Actions state below: failing workflows, "
+              "failing check runs, the commits that triggered them, and the most likely cause.",
+}
+
+DEFAULT_SERVICE_PROMPT = "You are an SRE. Summarize the service health data below and the most likely cause of any issue."
+
+MAP_INSTRUCTIONS = (
+    "Reply in plain text with at most 120 words. Name the specific failing entities and reasons. "
+    "If everything is healthy, say so in one sentence."
 )
 
-async def analyze_k8s():
-    async with k8s:
-        pods = await k8s.call_tool("list_pods", {"namespace": "default"})
-    
-    messages = [
-        SystemMessage(content="You are a Kubernetes SRE. Generate Kubernetes RCA."),
-        HumanMessage(content=f"KUBERNETES PODS:\n{pods}")
-    ]
-
-    result = llm.invoke(messages).content
-    return result
-
-
-async def analyze_aws():
-    async with aws:
-        logs = await aws.call_tool("list_log_groups", {})
-    
-    messages = [
-        SystemMessage(content="You are a CloudWatch / AWS SRE. Generate AWS RCA."),
-        HumanMessage(content=f"CLOUDWATCH LOG GROUPS:\n{logs}")
-    ]
-
-    result = llm.invoke(messages).content
-    return result
-
-
-async def analyze_github(owner, repo):
-    async with github:
-        workflows = await github.call_tool("gh_check_workflow_health",
-                                           {"owner": owner, "repo": repo})
-    
-    messages = [
-        SystemMessage(content="You are a DevOps CI/CD Engineer. Generate GitHub Pipeline RCA."),
-        HumanMessage(content=f"GITHUB WORKFLOW HEALTH:\n{workflows}")
-    ]
-
-    result = llm.invoke(messages).content
-    return result
+
+class MapReduceAnalyzer:
+    """
+    Summarizes each service with its own concurrent LLM call (map) so the
+    final correlation call (reduce) only sees short summaries. Map results
+    are cached by a fingerprint of the compacted service data.
+    """
+
+    def __init__(self, cache_size: int = 128):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def fingerprint(service: str, context: str) -> str:
+        return hashlib.sha256(f"{service}\n{context}".encode()).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        summary = self._cache.get(key)
+        if summary is not None:
+            self._cache.move_to_end(key)
+        return summary
+
+    def _cache_put(self, key: str, summary: str):
+        self._cache[key] = summary
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def summarize_service(self, llm, service: str, health, token_budget: int,
+                                semaphore: asyncio.Semaphore, deadline: Optional[float] = None) -> Dict[str, Any]:
+        context, budget = build_prompt_context({service: health}, token_budget)
+        key = self.fingerprint(service, context)
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            return {"summary": cached, "fingerprint": key, "cached": True, "tokens_used": 0}
+
+        messages = [
+            SystemMessage(content=f"{SERVICE_PROMPTS.get(service, DEFAULT_SERVICE_PROMPT)}\n{MAP_INSTRUCTIONS}"),
+            HumanMessage(content=f"{service.upper()} HEALTH DATA:\n{context}")
+        ]
+        async with semaphore:
+            response = await llm.ainvoke(messages, deadline=deadline)
+
+        summary = response.content.strip()
+        self._cache_put(key, summary)
+        return {"summary": summary, "fingerprint": key, "cached": False, "tokens_used": budget["tokens_used"]}
+
+    async def map(self, llm, service_healths: Dict[str, Any], token_budget: int,
+                  max_concurrency: int, deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Summarize every service concurrently, at most max_concurrency at a time.
+        A summary the LLM cannot produce before `deadline` falls back to the
+        service's reported issues.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        services = list(service_healths)
+        results = await asyncio.gather(
+            *(self.summarize_service(llm, s, service_healths[s], token_budget, semaphore, deadline) for s in services),
+            return_exceptions=True
+        )
+
+        summaries = {}
+        for service, result in zip(services, results):
+            if isinstance(result, Exception):
+                health = service_healths[service]
+                summaries[service] = {
+                    "summary": f"Summary unavailable ({result}). Reported issues: {'; '.join(health.issues) or 'none'}",
+                    "fingerprint": None,
+                    "cached": False,
+                    "tokens_used": 0
+                }
+            else:
+                summaries[service] = result
+        return summaries
+
+    @staticmethod
+    def reduce_prompt(query: str, service_healths: Dict[str, Any], summaries: Dict[str, Dict[str, Any]]) -> str:
+        sections = "\n\n".join(
+            f"[{service}] status={service_healths[service].status} score={service_healths[service].score}\n"
+            f"{summaries[service]['summary']}"
+            for service in summaries
+        )
+        return f"""
+You are a world-class Site Reliability Engineer (SRE) AI assistant. Specialist engineers have each summarized one service. Correlate their findings to explain the user's incident.
+
+**USER QUERY:**
+"{query}"
+
+**PER-SERVICE SUMMARIES:**
+{sections}
+{ANALYSIS_OUTPUT_SPEC}"""
+
+    async def analyze(self, llm, query: str, service_healths: Dict[str, Any], token_budget: int,
+                      max_concurrency: int, deadline: Optional[float] = None):
+        """Run the map stage and return (reduce prompt, budget stats)"""
+        summaries = await self.map(llm, service_healths, token_budget, max_concurrency, deadline)
+        prompt = self.reduce_prompt(query, service_healths, summaries)
+        return prompt, {
+            "mode": "map_reduce",
+            "token_budget": token_budget,
+            "tokens_used": estimate_tokens(prompt),
+            "map": {
+                service: {k: v for k, v in result.items() if k != "summary"}
+                for service, result in summaries.items()
+            }
+        }
@@ -0,0 +1,222 @@
+# agent/blobs.py
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from agent.log import get_logger
+
+try:
+    import zstandard
+except ImportError:  # gzip from the stdlib is always available
+    zstandard = None
+
+logger = get_logger("blobs")
+
+# Failed blob writes are retried on the next put() at least this much later
+RETRY_SECONDS = 5.0
+
+
+class BlobWriteError(Exception):
+    """A blob could not be persisted and the retry backlog is full"""
+
+
+def _compress(payload: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(payload)
+    return "gzip", gzip.compress(payload, compresslevel=6)
+
+
+def _decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def content_ref(data: Any) -> Tuple[str, bytes]:
+    """(sha256 ref, canonical JSON bytes) for a raw payload"""
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(payload).hexdigest(), payload
+
+
+class BlobStore:
+    """
+    Content-addressed store for raw service payloads. Each distinct payload
+    is compressed and written once; analyses keep only its hash. Recently
+    used blobs stay in memory up to `max_memory_bytes` (compressed), with an
+    optional MongoDB collection as the durable tier. Mongo writes run in the
+    background, at most `max_concurrent_writes` at a time; past
+    `max_pending_writes` queued, put() waits for its own write instead.
+    Failed writes stay readable in memory and are retried, so a returned
+    ref never dangles; when the backlog is full and put()'s own write
+    fails, it raises BlobWriteError and the caller keeps the data inline.
+    """
+
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024, max_concurrent_writes: int = 4,
+                 max_pending_writes: int = 1000):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_pending_writes = max_pending_writes
+        self.collection = None
+        self._blobs: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._memory_bytes = 0
+        # Blobs not yet in Mongo, readable even if evicted from memory meanwhile
+        self._unwritten: Dict[str, Tuple[str, bytes]] = {}
+        self._write_slots = asyncio.Semaphore(max_concurrent_writes)
+        self._writes: Set[asyncio.Task] = set()
+        self._failed: Dict[str, int] = {}  # ref -> raw size, awaiting retry
+        self._retry_at = 0.0
+        self._stats = {"puts": 0, "dedup_hits": 0, "stored": 0, "raw_bytes": 0, "stored_bytes": 0,
+                       "fetches": 0, "misses": 0, "write_failures": 0}
+
+    def attach_store(self, collection):
+        """Persist blobs to a Mongo collection"""
+        self.collection = collection
+
+    async def put(self, data: Any) -> str:
+        ref, payload = await asyncio.to_thread(content_ref, data)
+        self._stats["puts"] += 1
+        if ref in self._blobs or ref in self._unwritten:
+            # Identical snapshot: already compressed and persisted (or on its way)
+            if ref in self._blobs:
+                self._blobs.move_to_end(ref)
+            self._stats["dedup_hits"] += 1
+            return ref
+
+        encoding, compressed = await asyncio.to_thread(_compress, payload)
+        if self.collection is None:
+            self._remember(ref, encoding, compressed)
+            self._count_stored(len(payload), len(compressed))
+            return ref
+
+        self._retry_failed()
+        if len(self._writes) + len(self._failed) < self.max_pending_writes:
+            self._remember(ref, encoding, compressed)
+            self._unwritten[ref] = (encoding, compressed)
+            self._start_write(ref, len(payload))
+        elif await self._persist(ref, encoding, compressed, len(payload), retry=False):
+            self._remember(ref, encoding, compressed)
+        else:
+            raise BlobWriteError(f"Raw data blob {ref[:12]} could not be written")
+        return ref
+
+    def _start_write(self, ref: str, size: int):
+        encoding, compressed = self._unwritten[ref]
+        task = asyncio.create_task(self._persist(ref, encoding, compressed, size))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _retry_failed(self):
+        if not self._failed or time.monotonic() < self._retry_at:
+            return
+        failed, self._failed = self._failed, {}
+        for ref, size in failed.items():
+            if ref in self._unwritten:
+                self._start_write(ref, size)
+
+    async def _persist(self, ref: str, encoding: str, compressed: bytes, size: int, retry: bool = True) -> bool:
+        """Upsert one blob; a failed write stays in _unwritten for a later retry if `retry`"""
+        try:
+            async with self._write_slots:
+                result = await self.collection.update_one(
+                    {"_id": ref},
+                    {
+                        "$setOnInsert": {
+                            "encoding": encoding,
+                            "data": compressed,
+                            "size": size,
+                            "stored_size": len(compressed),
+                            "created_at": datetime.utcnow(),
+                        },
+                        "$set": {"last_referenced": datetime.utcnow()},
+                    },
+                    upsert=True
+                )
+            if result.upserted_id is None:
+                # Written earlier by another process or before a restart
+                self._stats["dedup_hits"] += 1
+            else:
+                self._count_stored(size, len(compressed))
+        except Exception as e:
+            self._stats["write_failures"] += 1
+            logger.warning("Raw data blob write failed: %s", e)
+            if retry:
+                self._failed[ref] = size
+                self._retry_at = time.monotonic() + RETRY_SECONDS
+            return False
+        self._unwritten.pop(ref, None)
+        return True
+
+    def _count_stored(self, size: int, stored_size: int):
+        self._stats["stored"] += 1
+        self._stats["raw_bytes"] += size
+        self._stats["stored_bytes"] += stored_size
+
+    async def drain(self):
+        """Wait for background blob writes, retrying failed ones once (on shutdown)"""
+        self._retry_at = 0.0
+        self._retry_failed()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        if self._failed:
+            logger.error("%d raw data blobs could not be written", len(self._failed))
+
+    async def get_encoded(self, ref: str) -> Optional[Tuple[str, bytes]]:
+        """(encoding, compressed bytes) for a ref, without decompressing"""
+        self._stats["fetches"] += 1
+        blob = self._blobs.get(ref)
+        if blob is not None:
+            self._blobs.move_to_end(ref)
+            return blob
+        blob = self._unwritten.get(ref)
+        if blob is not None:
+            return blob
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one({"_id": ref})
+                if doc:
+                    self._remember(ref, doc["encoding"], bytes(doc["data"]))
+                    return doc["encoding"], bytes(doc["data"])
+            except Exception as e:
+                logger.warning("Raw data blob lookup failed: %s", e)
+
+        self._stats["misses"] += 1
+        return None
+
+    async def get(self, ref: str) -> Optional[Any]:
+        blob = await self.get_encoded(ref)
+        if blob is None:
+            return None
+        return json.loads(await asyncio.to_thread(_decompress, *blob))
+
+    def refs(self) -> Set[str]:
+        """Refs held in memory or still being written"""
+        return set(self._blobs) | set(self._unwritten)
+
+    def _remember(self, ref: str, encoding: str, compressed: bytes):
+        if ref in self._blobs:
+            return
+        self._blobs[ref] = (encoding, compressed)
+        self._memory_bytes += len(compressed)
+        while self._memory_bytes > self.max_memory_bytes and len(self._blobs) > 1:
+            _, (_, evicted) = self._blobs.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encoding": "zstd" if zstandard is not None else "gzip",
+            "blobs_in_memory": len(self._blobs),
+            "memory_bytes": self._memory_bytes,
+            "max_memory_bytes": self.max_memory_bytes,
+            "persistent": self.collection is not None,
+            "pending_writes": len(self._writes),
+            "failed_writes_pending": len(self._failed),
+            "compression_ratio": self._stats["raw_bytes"] / self._stats["stored_bytes"] if self._stats["stored_bytes"] else None,
+            **self._stats,
+        }
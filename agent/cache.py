@@ -0,0 +1,125 @@
+# agent/cache.py
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from agent.log import get_logger
+
+logger = get_logger("cache")
+
+# Fields that change on every collection without the underlying state changing
+VOLATILE_FIELDS = {"last_checked", "timestamp", "retrieved_at", "data_freshness"}
+
+
+def strip_volatile(data: Any) -> Any:
+    if isinstance(data, dict):
+        return {k: strip_volatile(v) for k, v in data.items() if k not in VOLATILE_FIELDS}
+    if isinstance(data, list):
+        return [strip_volatile(v) for v in data]
+    return data
+
+
+def canonical_hash(data: Any) -> str:
+    """Stable SHA-256 of data with volatile fields removed and keys sorted"""
+    canonical = json.dumps(strip_volatile(data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class AnalysisCache:
+    """
+    TTL + LRU cache of LLM analysis results keyed by query and health data
+    fingerprint. An optional MongoDB collection acts as a shared second tier;
+    its lookups and writes give up after `store_timeout` seconds so a slow
+    database never stalls an analysis.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 256, store_timeout: float = 0.5):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.store_timeout = store_timeout
+        self.collection = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def attach_store(self, collection):
+        """Use a Mongo collection as the second cache tier"""
+        self.collection = collection
+
+    def key(self, query: str, service_healths: Dict[str, Any], mode: str = "single",
+            scope: Optional[Dict[str, Any]] = None) -> str:
+        """`scope` (namespace, repo, region) keeps entries from other targets, including Mongo ones, from matching"""
+        health = {
+            service: h.model_dump() if hasattr(h, "model_dump") else h
+            for service, h in service_healths.items()
+        }
+        query_hash = hashlib.sha256(normalize_query(query).encode()).hexdigest()[:16]
+        return f"{mode}:{canonical_hash(scope or {})[:16]}:{query_hash}:{canonical_hash(health)}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self.collection is not None:
+            try:
+                doc = await asyncio.wait_for(
+                    self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}}),
+                    self.store_timeout
+                )
+                if doc:
+                    remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+                    self._store(key, doc["value"], remaining)
+                    self.hits += 1
+                    return doc["value"]
+            except Exception as e:
+                logger.warning("Analysis cache lookup failed: %r", e)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        self._store(key, value, self.ttl_seconds)
+        if self.collection is not None:
+            try:
+                await asyncio.wait_for(self.collection.replace_one(
+                    {"_id": key},
+                    {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)},
+                    upsert=True
+                ), self.store_timeout)
+            except Exception as e:
+                logger.warning("Analysis cache write failed: %r", e)
+
+    def _store(self, key: str, value: Dict[str, Any], ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mongo_tier": self.collection is not None
+        }
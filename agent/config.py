@@ -1,8 +1,19 @@
 # agent/config.py
 from pydantic import BaseModel, Field
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Awaitable, Callable, Set
+import asyncio
+import copy
 import json
 import os
+import tempfile
+import threading
+
+from agent.log import get_logger
+
+logger = get_logger("config")
+
+# Fields that select what is analyzed; results cached under the old values are stale
+SCOPE_FIELDS = {"github_owner", "github_repo", "k8s_namespace", "aws_region"}
 
 class ServiceConfig(BaseModel):
     enabled: bool = True
@@ -15,13 +26,61 @@ class AgentConfig(BaseModel):
     k8s_namespace: str = "default"
     aws_region: str = "us-east-1"
     services: Dict[str, ServiceConfig] = Field(default_factory=dict)
-    analysis_timeout: int = 30
-    max_history_items: int = 100
+    analysis_timeout: int = Field(30, ge=1)
+    max_history_items: int = Field(100, ge=1)
+    prompt_token_budget: int = Field(6000, ge=1)
+    analysis_mode: str = "single"  # single, map_reduce
+    map_concurrency: int = Field(3, ge=1)
+    cache_ttl_seconds: int = Field(300, ge=0)
+    cache_max_entries: int = Field(256, ge=1)
+    service_timeouts: Dict[str, float] = Field(default_factory=lambda: {"k8s": 15.0, "aws": 15.0, "github": 15.0})
+    llm_min_budget: float = 10.0
+    job_workers: int = Field(2, ge=1)
+    job_queue_size: int = Field(100, ge=1)
+    job_aging_seconds: float = 30.0
+    llm_rpm: int = Field(30, ge=1)
+    llm_tpm: int = Field(6000, ge=1)
+    llm_max_retries: int = Field(3, ge=0)
+    llm_provider: str = "groq"  # groq, fake
+    llm_model: str = "llama-3.3-70b-versatile"
+    fake_llm_latency_distribution: str = "lognormal"  # fixed, uniform, lognormal
+    fake_llm_latency_mean: float = 1.0
+    fake_llm_latency_spread: float = 0.5
+    fake_llm_tokens_per_second: float = 250.0
+    fake_llm_responses_file: Optional[str] = None
+    fake_llm_seed: int = 0
+    rules_enabled: bool = True
+    rules_healthy_score: int = 95
+    poll_intervals: Dict[str, float] = Field(default_factory=lambda: {"k8s": 30.0, "aws": 60.0, "github": 60.0})
+    poll_min_interval: float = 10.0
+    poll_max_interval: float = 300.0
+    health_retention_days: int = 30
+    retention_full_days: int = 30  # analyses keep raw data this long
+    retention_summary_days: int = 365  # then summaries only, until archived and deleted
+    retention_archive_dir: str = "archives"
+    retention_interval_hours: float = 24.0
 
 class ConfigManager:
-    def __init__(self, config_file: str = "agent_config.json"):
+    """
+    Versioned config store shared by the backend and the agent. `config` is
+    an immutable snapshot replaced wholesale on every change, so readers take
+    it with a plain attribute access and never see a half-applied update.
+    Subscribers are called with (config, previous, changed_fields) after each
+    swap. Persistence is debounced: changes within `save_delay` seconds are
+    written once, off the event loop, to the file and to any async writers.
+    """
+
+    def __init__(self, config_file: str = "agent_config.json", save_delay: float = 0.5):
         self.config_file = config_file
+        self.save_delay = save_delay
         self.config = self._load_config()
+        self.version = 1
+        self._lock = threading.RLock()
+        self._subscribers: List[Callable[[AgentConfig, AgentConfig, Set[str]], None]] = []
+        self._writers: List[Callable[[AgentConfig], Awaitable[None]]] = []
+        self._save_task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._saved_version = self.version
     
     def _load_config(self) -> AgentConfig:
         # Load from file if exists
@@ -44,6 +103,37 @@ class ConfigManager:
             aws_region=get_val("AWS_REGION", "aws_region", "us-east-1"),
             analysis_timeout=int(get_val("ANALYSIS_TIMEOUT", "analysis_timeout", 30)),
             max_history_items=int(get_val("MAX_HISTORY_ITEMS", "max_history_items", 100)),
+            prompt_token_budget=int(get_val("PROMPT_TOKEN_BUDGET", "prompt_token_budget", 6000)),
+            analysis_mode=get_val("ANALYSIS_MODE", "analysis_mode", "single"),
+            map_concurrency=int(get_val("MAP_CONCURRENCY", "map_concurrency", 3)),
+            cache_ttl_seconds=int(get_val("CACHE_TTL_SECONDS", "cache_ttl_seconds", 300)),
+            cache_max_entries=int(get_val("CACHE_MAX_ENTRIES", "cache_max_entries", 256)),
+            service_timeouts=file_config.get("service_timeouts", {"k8s": 15.0, "aws": 15.0, "github": 15.0}),
+            llm_min_budget=float(get_val("LLM_MIN_BUDGET", "llm_min_budget", 10.0)),
+            job_workers=int(get_val("JOB_WORKERS", "job_workers", 2)),
+            job_queue_size=int(get_val("JOB_QUEUE_SIZE", "job_queue_size", 100)),
+            job_aging_seconds=float(get_val("JOB_AGING_SECONDS", "job_aging_seconds", 30.0)),
+            llm_rpm=int(get_val("LLM_RPM", "llm_rpm", 30)),
+            llm_tpm=int(get_val("LLM_TPM", "llm_tpm", 6000)),
+            llm_max_retries=int(get_val("LLM_MAX_RETRIES", "llm_max_retries", 3)),
+            llm_provider=get_val("LLM_PROVIDER", "llm_provider", "groq"),
+            llm_model=get_val("LLM_MODEL", "llm_model", "llama-3.3-70b-versatile"),
+            fake_llm_latency_distribution=get_val("FAKE_LLM_LATENCY_DISTRIBUTION", "fake_llm_latency_distribution", "lognormal"),
+            fake_llm_latency_mean=float(get_val("FAKE_LLM_LATENCY_MEAN", "fake_llm_latency_mean", 1.0)),
+            fake_llm_latency_spread=float(get_val("FAKE_LLM_LATENCY_SPREAD", "fake_llm_latency_spread", 0.5)),
+            fake_llm_tokens_per_second=float(get_val("FAKE_LLM_TOKENS_PER_SECOND", "fake_llm_tokens_per_second", 250.0)),
+            fake_llm_responses_file=get_val("FAKE_LLM_RESPONSES_FILE", "fake_llm_responses_file", None),
+            fake_llm_seed=int(get_val("FAKE_LLM_SEED", "fake_llm_seed", 0)),
+            rules_enabled=str(get_val("RULES_ENABLED", "rules_enabled", True)).lower() not in ("false", "0", "no"),
+            rules_healthy_score=int(get_val("RULES_HEALTHY_SCORE", "rules_healthy_score", 95)),
+            poll_intervals=file_config.get("poll_intervals", {"k8s": 30.0, "aws": 60.0, "github": 60.0}),
+            poll_min_interval=float(get_val("POLL_MIN_INTERVAL", "poll_min_interval", 10.0)),
+            poll_max_interval=float(get_val("POLL_MAX_INTERVAL", "poll_max_interval", 300.0)),
+            health_retention_days=int(get_val("HEALTH_RETENTION_DAYS", "health_retention_days", 30)),
+            retention_full_days=int(get_val("RETENTION_FULL_DAYS", "retention_full_days", 30)),
+            retention_summary_days=int(get_val("RETENTION_SUMMARY_DAYS", "retention_summary_days", 365)),
+            retention_archive_dir=get_val("RETENTION_ARCHIVE_DIR", "retention_archive_dir", "archives"),
+            retention_interval_hours=float(get_val("RETENTION_INTERVAL_HOURS", "retention_interval_hours", 24.0)),
             services=file_config.get("services", {
                 "k8s": ServiceConfig(enabled=True),
                 "aws": ServiceConfig(enabled=True),
@@ -51,26 +141,134 @@ class ConfigManager:
             })
         )
     
+    def subscribe(self, callback: Callable[[AgentConfig, AgentConfig, Set[str]], None]):
+        """Call `callback(config, previous, changed_fields)` after every change"""
+        self._subscribers.append(callback)
+    
+    def add_writer(self, writer: Callable[[AgentConfig], Awaitable[None]]):
+        """Persist snapshots somewhere besides the config file (awaited after each debounced save)"""
+        self._writers.append(writer)
+    
+    def update(self, persist: bool = True, **changes) -> AgentConfig:
+        """
+        Swap in a new snapshot with `changes` applied. The result is validated
+        like a loaded config (values are coerced, invalid ones raise
+        ValueError) and shares no nested dicts with the previous snapshot.
+        """
+        unknown = set(changes) - set(AgentConfig.model_fields)
+        if unknown:
+            raise ValueError(f"Unknown config fields: {', '.join(sorted(unknown))}")
+        with self._lock:
+            config = AgentConfig.model_validate({**self.config.model_dump(), **copy.deepcopy(changes)})
+            return self._swap(config, persist)
+    
+    def replace(self, config: AgentConfig, persist: bool = True) -> AgentConfig:
+        with self._lock:
+            return self._swap(config, persist)
+    
+    def reload(self, persist: bool = True) -> AgentConfig:
+        """Re-read the file and environment"""
+        return self.replace(self._load_config(), persist)
+    
+    def _swap(self, config: AgentConfig, persist: bool) -> AgentConfig:
+        previous = self.config
+        old, new = previous.dict(), config.dict()
+        changed = {key for key in new if new[key] != old.get(key)}
+        if changed:
+            self.config = config
+            self.version += 1
+            for callback in self._subscribers:
+                try:
+                    callback(config, previous, changed)
+                except Exception as e:
+                    logger.warning("Config subscriber failed: %s", e)
+        if persist:
+            self.save_config()
+        elif self._save_task and not self._save_task.done():
+            # An unpersisted swap (e.g. after the stored record was deleted) drops the pending write
+            self._save_task.cancel()
+            self._dirty = False
+        return self.config
+    
     def save_config(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config.dict(), f, indent=2)
+        """Schedule a debounced write; without a running event loop, write the file now"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_file(self.config)
+            self._saved_version = self.version
+            return
+        self._dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+    
+    async def _save_later(self):
+        await asyncio.sleep(self.save_delay)
+        await self._save()
+    
+    async def _save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        config, version = self.config, self.version
+        try:
+            try:
+                await asyncio.to_thread(self._write_file, config)
+            except OSError as e:
+                logger.error("Could not write %s: %s", self.config_file, e)
+            for writer in self._writers:
+                try:
+                    await writer(config)
+                except Exception as e:
+                    logger.warning("Config writer failed: %s", e)
+        except asyncio.CancelledError:
+            # Interrupted by flush(), which writes the latest snapshot again
+            self._dirty = True
+            raise
+        self._saved_version = version
+    
+    async def flush(self):
+        """Write any pending change now (on shutdown)"""
+        task, self._save_task = self._save_task, None
+        if task and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._save()
+    
+    def _write_file(self, config: AgentConfig):
+        # Write a temp file and rename it, so a crash never leaves a truncated config
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, path = tempfile.mkstemp(dir=directory, prefix=".agent_config.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(config.dict(), f, indent=2)
+            os.replace(path, self.config_file)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
     
     def update_github_config(self, owner: str, repo: str):
-        self.config.github_owner = owner
-        self.config.github_repo = repo
-        self.save_config()
+        self.update(github_owner=owner, github_repo=repo)
     
     def update_k8s_config(self, namespace: str):
-        self.config.k8s_namespace = namespace
-        self.save_config()
+        self.update(k8s_namespace=namespace)
     
     def update_aws_config(self, region: str):
-        self.config.aws_region = region
-        self.save_config()
+        self.update(aws_region=region)
     
     def get_config(self) -> AgentConfig:
         return self.config
     
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "saved_version": self._saved_version,
+            "save_pending": bool(self._save_task and not self._save_task.done()),
+            "subscribers": len(self._subscribers),
+            "writers": len(self._writers),
+        }
+    
     def validate_config(self) -> Dict[str, Any]:
         """Validate current configuration"""
         issues = []
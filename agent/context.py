@@ -0,0 +1,209 @@
+# agent/context.py
+import json
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Tuple
+
+# Kubernetes container states arrive as the client's repr, e.g.
+# "{'running': None, 'waiting': {'reason': 'ImagePullBackOff', ...}}"
+STATE_REASON = re.compile(r"'reason':\s*'([A-Za-z]+)'")
+
+# Healthy entities kept per stratum at each compaction level; the last
+# levels also strip unhealthy entities down to their identifying fields.
+SAMPLE_LEVELS = [5, 3, 1, 0, 0]
+MAX_LIST_ITEMS = 25
+
+# Appended to hard-truncated context so the model knows data is missing
+TRUNCATION_MARKER = "...[truncated]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token for English/JSON)"""
+    return len(text) // 4 + 1
+
+
+def compact_json(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
+def container_reasons(pod: Dict[str, Any]) -> List[str]:
+    """Waiting/terminated reasons across a pod's containers"""
+    reasons = []
+    for cs in pod.get("container_statuses") or []:
+        for field in ("state", "last_state"):
+            if cs.get(field):
+                reasons.extend(STATE_REASON.findall(cs[field]))
+    return [r for r in reasons if r != "Completed"]
+
+
+def _pod_is_healthy(pod: Dict[str, Any]) -> bool:
+    if pod.get("phase") not in ("Running", "Succeeded"):
+        return False
+    if pod.get("restarts", 0) > 5:
+        return False
+    statuses = pod.get("container_statuses") or []
+    if pod.get("phase") == "Running" and any(not cs.get("ready") for cs in statuses):
+        return False
+    return not container_reasons(pod)
+
+
+def _sample(items: List[Dict[str, Any]], key: str, per_stratum: int) -> List[Dict[str, Any]]:
+    """Take up to per_stratum items from each group of items sharing `key`"""
+    if per_stratum <= 0:
+        return []
+    strata = defaultdict(list)
+    for item in items:
+        strata[item.get(key)].append(item)
+    return [item for group in strata.values() for item in group[:per_stratum]]
+
+
+def _compact_pods(pods: List[Any], level: int) -> Tuple[Dict[str, Any], int, int, int]:
+    pods = [p for p in pods if isinstance(p, dict)]
+    unhealthy = [p for p in pods if not _pod_is_healthy(p)]
+    healthy = [p for p in pods if _pod_is_healthy(p)]
+    brief = level >= len(SAMPLE_LEVELS) - 1
+
+    def pod_entry(p, detail):
+        entry = {"name": p.get("name"), "phase": p.get("phase"), "restarts": p.get("restarts", 0)}
+        reasons = container_reasons(p)
+        if reasons:
+            entry["reasons"] = dict(Counter(reasons))
+        if detail:
+            entry["node"] = p.get("node")
+            entry["images"] = sorted({c.get("image") for c in p.get("containers") or [] if c.get("image")})
+            not_ready = [cs.get("name") for cs in p.get("container_statuses") or [] if not cs.get("ready")]
+            if not_ready:
+                entry["not_ready"] = not_ready
+        return entry
+
+    sampled = _sample(healthy, "node", SAMPLE_LEVELS[level])
+    return {
+        "total": len(pods),
+        "phases": dict(Counter(p.get("phase") for p in pods)),
+        "unhealthy": [pod_entry(p, not brief) for p in unhealthy],
+        "healthy_sample": [pod_entry(p, False) for p in sampled],
+        "healthy_by_node": dict(Counter(p.get("node") for p in healthy)),
+    }, len(unhealthy), len(healthy), len(sampled)
+
+
+def _compact_nodes(nodes: Any) -> Dict[str, Any]:
+    if not isinstance(nodes, list):
+        return nodes
+    nodes = [n for n in nodes if isinstance(n, dict)]
+    not_ready = []
+    for n in nodes:
+        bad = {
+            k: v.get("reason") or v.get("status")
+            for k, v in (n.get("conditions") or {}).items()
+            if (k == "Ready") != (v.get("status") == "True")
+        }
+        if n.get("ready") != "True" or bad:
+            not_ready.append({"name": n.get("name"), "ready": n.get("ready"), "conditions": bad})
+    return {"total": len(nodes), "not_ready": not_ready}
+
+
+def _compact_log_groups(log_groups: Any) -> Dict[str, Any]:
+    groups = log_groups.get("log_groups", []) if isinstance(log_groups, dict) else log_groups or []
+    prefixes = Counter("/".join(g.get("name", "").split("/")[:3]) or "(root)" for g in groups)
+    largest = sorted(groups, key=lambda g: g.get("stored_bytes", 0), reverse=True)[:5]
+    return {
+        "total": len(groups),
+        "empty": sum(1 for g in groups if not g.get("stored_bytes")),
+        "by_prefix": dict(prefixes.most_common(10)),
+        "largest": [{"name": g.get("name"), "stored_bytes": g.get("stored_bytes", 0)} for g in largest],
+    }
+
+
+def _compact_runs(runs: Any) -> Dict[str, Any]:
+    runs = runs.get("runs", []) if isinstance(runs, dict) else runs or []
+    failed = [r for r in runs if r.get("conclusion") not in ("success", "skipped", "neutral", None)]
+    passed = [r for r in runs if r not in failed]
+    return {
+        "total": len(runs),
+        "failed": [
+            {k: r.get(k) for k in ("id", "name", "event", "conclusion", "created_at", "head_sha", "failed_checks") if r.get(k)}
+            for r in failed
+        ],
+        "passed_by_workflow": dict(Counter(r.get("name") for r in passed)),
+    }
+
+
+def _compact_raw(raw: Dict[str, Any], level: int, stats: Dict[str, int]) -> Dict[str, Any]:
+    compact = {}
+    for key, value in raw.items():
+        if key == "pods" and isinstance(value, list):
+            compact[key], unhealthy, healthy, sampled = _compact_pods(value, level)
+            stats["unhealthy"] += unhealthy
+            stats["healthy_total"] += healthy
+            stats["healthy_sampled"] += sampled
+        elif key == "nodes":
+            compact[key] = _compact_nodes(value)
+        elif key == "log_groups":
+            compact[key] = _compact_log_groups(value)
+        elif key == "recent_runs":
+            compact[key] = _compact_runs(value)
+        elif key == "ci_overview":
+            # Runs are already summarized from recent_runs
+            continue
+        elif isinstance(value, list) and len(value) > MAX_LIST_ITEMS:
+            compact[key] = {"items": value[:MAX_LIST_ITEMS], "omitted": len(value) - MAX_LIST_ITEMS}
+        else:
+            compact[key] = value
+    return compact
+
+
+def _collapse(items: List[str]) -> List[str]:
+    """Collapse repeated strings into 'text (xN)'"""
+    counts = Counter(items)
+    return [f"{text} (x{n})" if n > 1 else text for text, n in counts.items()]
+
+
+def _build(service_healths: Dict[str, Any], level: int) -> Tuple[Dict[str, Any], Dict[str, int]]:
+    stats = {"unhealthy": 0, "healthy_total": 0, "healthy_sampled": 0}
+    context = {}
+    for service, health in service_healths.items():
+        data = health.model_dump() if hasattr(health, "model_dump") else dict(health)
+        entry = {
+            "status": data.get("status"),
+            "score": data.get("score"),
+            "issues": _collapse(data.get("issues") or []),
+        }
+        if data.get("metrics"):
+            entry["metrics"] = {k: v for k, v in data["metrics"].items() if v is not None}
+        if data.get("raw_data"):
+            entry["data"] = _compact_raw(data["raw_data"], level, stats)
+        context[service] = entry
+    return context, stats
+
+
+def build_prompt_context(service_healths: Dict[str, Any], token_budget: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Serialize service health for the LLM prompt within a token budget.
+    Unhealthy entities are always kept; healthy ones are stratified-sampled
+    and progressively dropped until the context fits.
+    """
+    text, stats, level = "", {}, 0
+    for level in range(len(SAMPLE_LEVELS)):
+        context, stats = _build(service_healths, level)
+        text = compact_json(context)
+        if estimate_tokens(text) <= token_budget:
+            break
+
+    truncated = False
+    if estimate_tokens(text) > token_budget:
+        # Even the most compact form is too large; hard-truncate as a last resort,
+        # reserving room for the marker so the result still fits the budget
+        max_chars = max(token_budget * 4 - 1, 0)
+        if max_chars > len(TRUNCATION_MARKER):
+            text = text[:max_chars - len(TRUNCATION_MARKER)] + TRUNCATION_MARKER
+        else:
+            text = text[:max_chars]
+        truncated = True
+
+    return text, {
+        "token_budget": token_budget,
+        "tokens_used": estimate_tokens(text),
+        "compaction_level": level,
+        "truncated": truncated,
+        **stats,
+    }
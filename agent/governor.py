@@ -0,0 +1,253 @@
+# agent/governor.py
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from agent.context import estimate_tokens
+from agent.metrics import REGISTRY, TOKEN_BUCKETS
+from agent.log import get_logger
+from agent.tracing import span
+
+logger = get_logger("governor")
+
+LLM_SECONDS = REGISTRY.histogram("llm_request_duration_seconds", "LLM call latency (excluding pacing waits)",
+                                 ("mode", "outcome"))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram("llm_time_to_first_token_seconds", "Streaming LLM time to first chunk")
+LLM_TOKENS = REGISTRY.histogram("llm_tokens", "Tokens per LLM call", ("kind",), buckets=TOKEN_BUCKETS)
+LLM_WAIT_SECONDS = REGISTRY.histogram("llm_admission_wait_seconds", "Time spent waiting for RPM/TPM budget")
+LLM_RATE_LIMITED = REGISTRY.counter("llm_rate_limited", "429 responses from the LLM provider")
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most `capacity` units"""
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdmissionTimeout(TimeoutError):
+    """The call could not be admitted before the caller's deadline"""
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a rate-limit error's retry-after header, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or "rate limit" in str(error).lower() or "429" in str(error)
+
+
+class LLMGovernor:
+    """
+    Wraps a chat model and paces calls against requests-per-minute and
+    tokens-per-minute buckets. Callers are admitted in arrival order, 429s
+    are retried after `retry-after`, and a 429 pauses every caller. A caller
+    passing `deadline` (loop clock) gets AdmissionTimeout right away when the
+    budget would free up only after it, instead of sleeping past it.
+    """
+
+    def __init__(self, llm, rpm: int = 30, tpm: int = 6000, max_retries: int = 3,
+                 expected_output_tokens: int = 800):
+        self.llm = llm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.expected_output_tokens = expected_output_tokens
+        self._admission = asyncio.Lock()
+        self._blocked_until = 0.0
+        self._waiting = 0
+        self._in_flight = 0
+        self._window = deque()  # (monotonic time, tokens) of settled calls
+        self._stats = {"calls": 0, "rate_limited": 0, "retries": 0, "failures": 0, "deadline_rejections": 0,
+                       "total_wait": 0.0}
+
+    def __getattr__(self, name):
+        # Anything not governed (invoke, bind, ...) goes straight to the model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def estimate(self, messages: List[Any]) -> int:
+        prompt = sum(estimate_tokens(str(getattr(m, "content", m))) for m in messages)
+        return prompt + self.expected_output_tokens
+
+    async def _admit(self, cost: int, deadline: Optional[float] = None):
+        """Wait (FIFO) until both buckets can cover the call, then charge them"""
+        loop = asyncio.get_running_loop()
+        self._waiting += 1
+        start = time.monotonic()
+        try:
+            async with self._admission:
+                while True:
+                    delay = max(
+                        self._blocked_until - time.monotonic(),
+                        self.requests.wait_time(1),
+                        self.tokens.wait_time(cost)
+                    )
+                    if delay <= 0:
+                        break
+                    if deadline is not None and loop.time() + delay > deadline:
+                        self._stats["deadline_rejections"] += 1
+                        raise AdmissionTimeout(f"LLM rate budget frees up in {delay:.1f}s, after the deadline")
+                    await asyncio.sleep(delay)
+                self.requests.consume(1)
+                self.tokens.consume(cost)
+        finally:
+            self._waiting -= 1
+        now = time.monotonic()
+        self._stats["total_wait"] += now - start
+        LLM_WAIT_SECONDS.observe(now - start)
+
+    def _trim_window(self, now: float):
+        while self._window and now - self._window[0][0] > 60:
+            self._window.popleft()
+
+    @staticmethod
+    def _usage(response: Any) -> Dict[str, Any]:
+        usage = getattr(response, "usage_metadata", None)
+        return usage if isinstance(usage, dict) else {}
+
+    def _settle(self, estimated: int, actual: Optional[int]):
+        """Replace a call's reservation with its actual usage and record it for stats()"""
+        actual = actual or estimated
+        if actual < estimated:
+            self.tokens.refund(estimated - actual)
+        else:
+            self.tokens.consume(actual - estimated)
+        now = time.monotonic()
+        self._window.append((now, actual))
+        self._trim_window(now)
+
+    async def _backoff(self, error: Exception, attempt: int):
+        self._stats["rate_limited"] += 1
+        self._stats["retries"] += 1
+        LLM_RATE_LIMITED.inc()
+        delay = _retry_after(error) or min(2 ** attempt + random.random(), 30)
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning("LLM rate limited, retrying in %.1fs (attempt %d/%d)", delay, attempt + 1, self.max_retries)
+        await asyncio.sleep(delay)
+
+    async def ainvoke(self, messages, deadline: Optional[float] = None, **kwargs):
+        cost = self.estimate(messages)
+        for attempt in range(self.max_retries + 1):
+            with span("rate_limit_wait"):
+                await self._admit(cost, deadline)
+            self._in_flight += 1
+            started = time.perf_counter()
+            outcome = "error"
+            settled = False
+            try:
+                response = await self.llm.ainvoke(messages, **kwargs)
+                outcome = "success"
+                self._stats["calls"] += 1
+                usage = self._usage(response)
+                if usage.get("input_tokens") is not None:
+                    LLM_TOKENS.observe(usage["input_tokens"], "input")
+                    LLM_TOKENS.observe(usage.get("output_tokens", 0), "output")
+                self._settle(cost, usage.get("total_tokens"))
+                settled = True
+                return response
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == self.max_retries:
+                    self._stats["failures"] += 1
+                    raise
+                outcome, rate_limit = "rate_limited", e
+            finally:
+                self._in_flight -= 1
+                # A rejected or failed call used no tokens; the request slot stays spent
+                if not settled:
+                    self.tokens.refund(cost)
+                LLM_SECONDS.observe(time.perf_counter() - started, "invoke", outcome)
+            await self._backoff(rate_limit, attempt)
+
+    async def astream(self, messages, deadline: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+        cost = self.estimate(messages)
+        for attempt in range(self.max_retries + 1):
+            with span("rate_limit_wait"):
+                await self._admit(cost, deadline)
+            self._in_flight += 1
+            started = time.perf_counter()
+            outcome = "error"
+            emitted = False
+            output_chars = 0
+            usage: Dict[str, Any] = {}
+            try:
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    if not emitted:
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                    emitted = True
+                    output_chars += len(getattr(chunk, "content", "") or "")
+                    usage = self._usage(chunk) or usage
+                    yield chunk
+                outcome = "success"
+                self._stats["calls"] += 1
+                # Streams rarely report usage; record the estimates instead
+                LLM_TOKENS.observe(usage.get("input_tokens", cost - self.expected_output_tokens), "input")
+                LLM_TOKENS.observe(usage.get("output_tokens", output_chars // 4), "output")
+                return
+            except Exception as e:
+                # Only retry before any output reached the caller
+                if emitted or not _is_rate_limited(e) or attempt == self.max_retries:
+                    self._stats["failures"] += 1
+                    raise
+                outcome, rate_limit = "rate_limited", e
+            finally:
+                self._in_flight -= 1
+                # Once output has flowed the call used tokens, even if it then failed
+                if emitted:
+                    self._settle(cost, usage.get("total_tokens")
+                                 or cost - self.expected_output_tokens + output_chars // 4)
+                else:
+                    self.tokens.refund(cost)
+                LLM_SECONDS.observe(time.perf_counter() - started, "stream", outcome)
+            await self._backoff(rate_limit, attempt)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._trim_window(now)
+        requests_last_minute = len(self._window)
+        tokens_last_minute = sum(cost for _, cost in self._window)
+        return {
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity,
+            "requests_last_minute": requests_last_minute,
+            "tokens_last_minute": tokens_last_minute,
+            "rpm_utilization": requests_last_minute / self.requests.capacity,
+            "tpm_utilization": tokens_last_minute / self.tokens.capacity,
+            "waiting": self._waiting,
+            "in_flight": self._in_flight,
+            "blocked_for": max(self._blocked_until - now, 0.0),
+            "avg_wait": self._stats["total_wait"] / max(self._stats["calls"] + self._stats["failures"], 1),
+            **{k: v for k, v in self._stats.items() if k != "total_wait"},
+        }
@@ -0,0 +1,102 @@
+# agent/history.py
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+
+class AnalysisHistory:
+    """
+    Bounded in-memory analysis history: id -> entry dict, a ring buffer
+    of ids in insertion order, and per-service / per-severity indexes.
+    Entries are stored without raw_data to keep memory independent of
+    cluster size.
+    """
+
+    def __init__(self, max_items: int = 100):
+        self.max_items = max(1, max_items)
+        self._by_id: Dict[str, Any] = {}
+        self._order: deque = deque()
+        # Ordered sets (dict keys) so removal on eviction is O(1)
+        self._by_service: Dict[str, "OrderedDict[str, None]"] = {}
+        self._by_severity: Dict[str, "OrderedDict[str, None]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    @staticmethod
+    def _hot_copy(analysis):
+        services = {
+            name: health.model_copy(update={"raw_data": None})
+            for name, health in analysis.services.items()
+        }
+        return analysis.model_copy(update={"services": services})
+
+    def add(self, analysis):
+        entry = self._hot_copy(analysis)
+        if entry.id in self._by_id:
+            self._remove(entry.id)
+
+        self._by_id[entry.id] = entry
+        self._order.append(entry.id)
+        for service in entry.services_analyzed:
+            self._by_service.setdefault(service, OrderedDict())[entry.id] = None
+        self._by_severity.setdefault(entry.severity.upper(), OrderedDict())[entry.id] = None
+
+        self._evict()
+        return entry
+
+    def resize(self, max_items: int):
+        self.max_items = max(1, max_items)
+        self._evict()
+
+    def _evict(self):
+        while self._order and len(self._order) > self.max_items:
+            self._remove(self._order[0])
+
+    def _remove(self, analysis_id: str):
+        entry = self._by_id.pop(analysis_id, None)
+        if entry is None:
+            return
+        if self._order and self._order[0] == analysis_id:
+            self._order.popleft()
+        else:
+            self._order.remove(analysis_id)
+        for service in entry.services_analyzed:
+            self._unindex(self._by_service, service, analysis_id)
+        self._unindex(self._by_severity, entry.severity.upper(), analysis_id)
+
+    @staticmethod
+    def _unindex(index: Dict[str, "OrderedDict[str, None]"], key: str, analysis_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.pop(analysis_id, None)
+            if not ids:
+                del index[key]
+
+    def get(self, analysis_id: str):
+        return self._by_id.get(analysis_id)
+
+    def latest(self):
+        return self._by_id[self._order[-1]] if self._order else None
+
+    def recent(self, limit: int = 20, service: Optional[str] = None,
+               severity: Optional[str] = None) -> List:
+        """Most recent entries (oldest first), optionally filtered"""
+        if service is None and severity is None:
+            ids = list(self._order)
+        else:
+            candidates = []
+            if service is not None:
+                candidates.append(self._by_service.get(service, {}))
+            if severity is not None:
+                candidates.append(self._by_severity.get(severity.upper(), {}))
+            # Walk the smallest index, newest first, checking the other in O(1)
+            smallest = min(candidates, key=len)
+            ids = [i for i in reversed(smallest) if all(i in c for c in candidates)][:limit]
+            ids.reverse()
+        return [self._by_id[i] for i in ids[-limit:]] if limit > 0 else []
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "by_service": {s: len(ids) for s, ids in self._by_service.items()},
+            "by_severity": {s: len(ids) for s, ids in self._by_severity.items()},
+        }
@@ -0,0 +1,136 @@
+# agent/llm.py
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agent.context import estimate_tokens
+
+# Canned analyses matching the IncidentAnalysis fields the LLM must return
+DEFAULT_FAKE_RESPONSES = [
+    {
+        "overall_status": "HEALTHY",
+        "root_cause_analysis": "All monitored services report healthy state; no incident detected.",
+        "immediate_actions": ["No action required", "Keep monitoring dashboards", "Verify alert routing"],
+        "long_term_recommendations": ["Review alert thresholds", "Schedule capacity review"],
+        "commands_to_execute": ["kubectl get pods -A"],
+        "severity": "LOW",
+        "confidence": 90
+    },
+    {
+        "overall_status": "DEGRADED",
+        "root_cause_analysis": "Several pods are stuck in ImagePullBackOff after the latest deployment referenced a missing image tag.",
+        "immediate_actions": ["Roll back the deployment", "Verify the image tag exists in the registry", "Check imagePullSecrets"],
+        "long_term_recommendations": ["Pin image digests in CI", "Add a pre-deploy image existence check"],
+        "commands_to_execute": ["kubectl describe pod <pod>", "kubectl rollout undo deployment/<name>"],
+        "severity": "MEDIUM",
+        "confidence": 75
+    },
+    {
+        "overall_status": "CRITICAL",
+        "root_cause_analysis": "The most recent CI workflow failed at the test step and the resulting deploy left pods crash-looping.",
+        "immediate_actions": ["Inspect failing workflow logs", "Roll back to the last green build", "Page the owning team"],
+        "long_term_recommendations": ["Block deploys on failing checks", "Add canary analysis"],
+        "commands_to_execute": ["gh run view <run-id> --log-failed", "kubectl logs <pod> --previous"],
+        "severity": "HIGH",
+        "confidence": 70
+    }
+]
+
+FAKE_SUMMARY = "Fake summary: service data reviewed; see reported issues for failing entities."
+
+
+class FakeChatModel:
+    """
+    Deterministic offline stand-in for a chat model. Latency follows a
+    configurable distribution, output is paced at tokens_per_second, and
+    responses are canned IncidentAnalysis JSON chosen by prompt hash.
+    """
+
+    def __init__(self, latency_distribution: str = "lognormal", latency_mean: float = 1.0,
+                 latency_spread: float = 0.5, tokens_per_second: float = 250.0,
+                 responses: Optional[List[Dict[str, Any]]] = None, seed: int = 0):
+        self.latency_distribution = latency_distribution
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.tokens_per_second = tokens_per_second
+        self.responses = responses or DEFAULT_FAKE_RESPONSES
+        self._random = random.Random(seed)
+
+    def _latency(self) -> float:
+        """Time to first token"""
+        if self.latency_distribution == "fixed":
+            return self.latency_mean
+        if self.latency_distribution == "uniform":
+            return max(0.0, self._random.uniform(self.latency_mean - self.latency_spread,
+                                                 self.latency_mean + self.latency_spread))
+        # lognormal: latency_mean is the median, latency_spread the sigma
+        return self._random.lognormvariate(math.log(max(self.latency_mean, 1e-3)), self.latency_spread)
+
+    def _respond(self, messages: List[Any]) -> str:
+        prompt = "\n".join(str(getattr(m, "content", m)) for m in messages)
+        if "overall_status" not in prompt:
+            # Map-stage style request for a plain-text summary
+            return FAKE_SUMMARY
+        index = int(hashlib.sha256(prompt.encode()).hexdigest(), 16) % len(self.responses)
+        return json.dumps(self.responses[index])
+
+    def _usage(self, messages: List[Any], content: str) -> Dict[str, int]:
+        input_tokens = sum(estimate_tokens(str(getattr(m, "content", m))) for m in messages)
+        output_tokens = estimate_tokens(content)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    async def ainvoke(self, messages: List[Any], **kwargs) -> AIMessage:
+        content = self._respond(messages)
+        await asyncio.sleep(self._latency() + estimate_tokens(content) / self.tokens_per_second)
+        return AIMessage(content=content, usage_metadata=self._usage(messages, content))
+
+    async def astream(self, messages: List[Any], **kwargs) -> AsyncIterator[AIMessageChunk]:
+        content = self._respond(messages)
+        await asyncio.sleep(self._latency())
+        # ~4 characters per token
+        step = 16
+        for i in range(0, len(content), step):
+            await asyncio.sleep((step / 4) / self.tokens_per_second)
+            yield AIMessageChunk(content=content[i:i + step])
+
+    def invoke(self, messages: List[Any], **kwargs) -> AIMessage:
+        content = self._respond(messages)
+        return AIMessage(content=content, usage_metadata=self._usage(messages, content))
+
+
+def _load_fake_responses(path: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    if not path:
+        return None
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else [data]
+
+
+def create_llm(config):
+    """Build the chat model selected by config.llm_provider (groq, fake)"""
+    if config.llm_provider == "fake":
+        return FakeChatModel(
+            latency_distribution=config.fake_llm_latency_distribution,
+            latency_mean=config.fake_llm_latency_mean,
+            latency_spread=config.fake_llm_latency_spread,
+            tokens_per_second=config.fake_llm_tokens_per_second,
+            responses=_load_fake_responses(config.fake_llm_responses_file),
+            seed=config.fake_llm_seed
+        )
+
+    if config.llm_provider == "groq":
+        # Imported lazily so offline runs don't need the Groq client
+        from langchain_groq import ChatGroq
+        return ChatGroq(
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            model_name=config.llm_model
+        )
+
+    raise ValueError(f"Unknown LLM provider: {config.llm_provider}")
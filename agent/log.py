@@ -0,0 +1,194 @@
+# agent/log.py
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+# Structured logging shared by the backend, the agent and the MCP servers.
+# Callers log with %-style args so messages below the active level are never
+# formatted; records go through a bounded queue to a background thread, so
+# a slow stdout never blocks the event loop.
+
+ROOT = "sre"
+
+_STANDARD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the shared `sre` namespace (e.g. sre.agent, sre.k8s-mcp)"""
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {k: v for k, v in record.__dict__.items() if k not in _STANDARD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """[time] [LEVEL] [logger] message key=value ..."""
+
+    def __init__(self):
+        super().__init__("[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with extra= fields merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DebugThrottle(logging.Filter):
+    """
+    Samples and rate-limits DEBUG records per call site (file and line):
+    keeps 1 in `sample_every`, then at most `per_second` with a
+    small burst. The next record let through reports how many were dropped.
+    """
+
+    def __init__(self, sample_every: int = 1, per_second: float = 20.0, burst: int = 50):
+        super().__init__()
+        self.sample_every = max(sample_every, 1)
+        self.per_second = per_second
+        self.burst = burst
+        self._sites: Dict[tuple, list] = {}  # site -> [seen, tokens, updated, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = [0, float(self.burst), time.monotonic(), 0]
+
+        site[0] += 1
+        if site[0] % self.sample_every:
+            site[3] += 1
+            return False
+
+        now = time.monotonic()
+        site[1] = min(self.burst, site[1] + (now - site[2]) * self.per_second)
+        site[2] = now
+        if site[1] < 1:
+            site[3] += 1
+            return False
+        site[1] -= 1
+        if site[3]:
+            record.suppressed = site[3]
+            site[3] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Drops (and counts) records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread; only tracebacks are
+        # rendered here because the frames they reference may not survive
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(service: str, level: Optional[str] = None) -> logging.Logger:
+    """
+    Configure the `sre` logger tree once per process. LOG_LEVEL, LOG_FORMAT
+    (text|json), LOG_DEBUG_SAMPLE (keep 1 in N debug records per call site)
+    and LOG_DEBUG_RATE (debug records per second per call site) tune it.
+    """
+    global _listener, _handler
+    root = logging.getLogger(ROOT)
+    if _listener is None:
+        if _handler is not None:
+            root.removeHandler(_handler)
+        stream = logging.StreamHandler()
+        stream.setFormatter(JsonFormatter() if os.getenv("LOG_FORMAT", "text") == "json" else TextFormatter())
+
+        _handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        _handler.addFilter(DebugThrottle(
+            sample_every=int(os.getenv("LOG_DEBUG_SAMPLE", "1")),
+            per_second=float(os.getenv("LOG_DEBUG_RATE", "20"))
+        ))
+        root.addHandler(_handler)
+        root.propagate = False
+
+        _listener = QueueListener(_handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    return get_logger(service)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(level: str, name: Optional[str] = None):
+    """Change the level of the whole tree or one logger (e.g. "agent") at runtime"""
+    logger = logging.getLogger(ROOT) if not name else get_logger(name)
+    logger.setLevel(level.upper())
+
+
+def get_levels() -> Dict[str, Any]:
+    loggers = {
+        name[len(ROOT) + 1:]: logging.getLevelName(logger.level)
+        for name, logger in logging.root.manager.loggerDict.items()
+        if name.startswith(ROOT + ".") and isinstance(logger, logging.Logger) and logger.level
+    }
+    return {
+        "root": logging.getLevelName(logging.getLogger(ROOT).level),
+        "loggers": loggers,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+def add_log_level_route(mcp):
+    """GET/PUT /log-level on a FastMCP server (PUT body: {"level": ..., "logger": ...})"""
+    from starlette.responses import JSONResponse
+
+    @mcp.custom_route("/log-level", methods=["GET", "PUT"])
+    async def log_level(request):
+        if request.method == "PUT":
+            body = await request.json()
+            try:
+                set_level(body["level"], body.get("logger"))
+            except (KeyError, ValueError) as e:
+                return JSONResponse({"error": f"Invalid level: {e}"}, status_code=400)
+        return JSONResponse(get_levels())
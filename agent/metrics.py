@@ -0,0 +1,220 @@
+# agent/metrics.py
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from agent.log import get_logger
+
+logger = get_logger("metrics")
+
+# Dependency-free Prometheus text exposition shared by the backend and the
+# MCP servers. Series hold preallocated bucket arrays and are updated with
+# plain increments: no locks, and nothing is allocated after a label set is
+# first seen. Cumulative bucket counts are only computed at scrape time.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total {self.kind}"]
+
+    def render(self) -> List[str]:
+        return self._header() + [
+            f"{self.name}_total{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in self._series.items()
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._series[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> List[str]:
+        return self._header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in self._series.items()
+        ]
+
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._size = len(self.buckets) + 1  # last slot is +Inf
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, _HistogramSeries(self._size))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        bounds = self.buckets + (math.inf,)
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, list(series.counts)):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series.count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors for one process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def register_collector(self, collector: Callable[[], None]):
+        """Called on every scrape, e.g. to copy cache stats into gauges"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def instrument_mcp_server(mcp, server: str, registry: Registry = REGISTRY):
+    """Time every tool call on a FastMCP server and serve GET /metrics"""
+    # Imported lazily so the backend does not need the server-side APIs
+    from fastmcp.server.middleware import Middleware
+    from starlette.responses import Response
+
+    tool_seconds = registry.histogram(
+        "mcp_server_tool_duration_seconds", "MCP tool execution time", ("server", "tool", "outcome")
+    )
+    tool_errors = registry.counter("mcp_server_tool_errors", "MCP tool calls that failed", ("server", "tool"))
+    in_flight = registry.gauge("mcp_server_tools_in_flight", "MCP tool calls currently executing", ("server",))
+
+    class ToolMetricsMiddleware(Middleware):
+        async def on_call_tool(self, context, call_next):
+            tool = getattr(context.message, "name", "unknown")
+            start = time.perf_counter()
+            in_flight.inc(server)
+            outcome = "error"
+            try:
+                result = await call_next(context)
+                outcome = "error" if tool_result_failed(result) else "success"
+                return result
+            finally:
+                in_flight.dec(server)
+                tool_seconds.observe(time.perf_counter() - start, server, tool, outcome)
+                if outcome == "error":
+                    tool_errors.inc(server, tool)
+
+    mcp.add_middleware(ToolMetricsMiddleware())
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics(request):
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def tool_result_failed(result) -> bool:
+    """Tools in this repo report failures as {"error": ...} or {"success": false}"""
+    if getattr(result, "is_error", False):
+        return True
+    content = getattr(result, "structured_content", None)
+    if isinstance(content, dict):
+        content = content.get("result", content)
+    return isinstance(content, dict) and ("error" in content or content.get("success") is False)
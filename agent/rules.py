@@ -0,0 +1,265 @@
+# agent/rules.py
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.context import STATE_REASON
+
+# Signature rules over signals extracted from ServiceHealth raw data. Signals
+# look like "k8s:reason:OOMKilled" or "github:failed_check:unit-tests".
+# Lower priority wins when one entity matches several rules (an OOMKilled
+# container is usually also in CrashLoopBackOff).
+SIGNATURE_RULES = [
+    {
+        "id": "k8s_oom_killed",
+        "priority": 0,
+        "pattern": r"^k8s:reason:OOMKilled$",
+        "overall_status": "DEGRADED",
+        "severity": "HIGH",
+        "confidence": 90,
+        "root_cause": "Containers in {entities} were OOMKilled: they exceeded their memory limits and were terminated by the kernel.",
+        "immediate_actions": [
+            "Raise the memory limit of the affected containers or reduce their working set",
+            "Check recent deploys for memory regressions",
+            "Inspect the previous container logs for the allocation that triggered the kill",
+        ],
+        "long_term_recommendations": [
+            "Set memory requests/limits from observed usage percentiles",
+            "Alert on container memory approaching its limit",
+        ],
+        "commands": ["kubectl describe pod {entity} -n {namespace}", "kubectl logs {entity} -n {namespace} --previous",
+                     "kubectl top pod -n {namespace}"],
+    },
+    {
+        "id": "k8s_image_pull",
+        "priority": 0,
+        "pattern": r"^k8s:reason:(ImagePullBackOff|ErrImagePull|InvalidImageName)$",
+        "overall_status": "DEGRADED",
+        "severity": "HIGH",
+        "confidence": 92,
+        "root_cause": "Pods {entities} cannot pull their container image (ImagePullBackOff): the image tag is missing, the registry is unreachable, or pull credentials are wrong.",
+        "immediate_actions": [
+            "Verify the referenced image tag exists in the registry",
+            "Check imagePullSecrets and registry credentials",
+            "Roll back to the last deployment with a valid image",
+        ],
+        "long_term_recommendations": [
+            "Verify images exist before deploying from CI",
+            "Pin images by digest",
+        ],
+        "commands": ["kubectl describe pod {entity} -n {namespace}", "kubectl get events -n {namespace} --field-selector involvedObject.name={entity}"],
+    },
+    {
+        "id": "k8s_config_error",
+        "priority": 0,
+        "pattern": r"^k8s:reason:(CreateContainerConfigError|CreateContainerError)$",
+        "overall_status": "DEGRADED",
+        "severity": "MEDIUM",
+        "confidence": 88,
+        "root_cause": "Containers in {entities} cannot be created because of invalid configuration (missing ConfigMap/Secret or bad container spec).",
+        "immediate_actions": [
+            "Check that referenced ConfigMaps and Secrets exist in the namespace",
+            "Review the pod spec changes from the latest deploy",
+            "Roll back the deployment if the config cannot be fixed quickly",
+        ],
+        "long_term_recommendations": [
+            "Validate manifests against the cluster in CI",
+            "Manage config and workloads in the same release",
+        ],
+        "commands": ["kubectl describe pod {entity} -n {namespace}", "kubectl get configmaps,secrets -n {namespace}"],
+    },
+    {
+        "id": "k8s_crash_loop",
+        "priority": 1,
+        "pattern": r"^k8s:reason:CrashLoopBackOff$",
+        "overall_status": "DEGRADED",
+        "severity": "HIGH",
+        "confidence": 80,
+        "root_cause": "Containers in {entities} are in CrashLoopBackOff: the process exits repeatedly shortly after start.",
+        "immediate_actions": [
+            "Read the previous container logs for the crash reason",
+            "Check liveness probes and startup dependencies",
+            "Roll back the latest deployment if the crash started with it",
+        ],
+        "long_term_recommendations": [
+            "Add startup probes for slow-starting services",
+            "Alert on restart rate rather than absolute restart counts",
+        ],
+        "commands": ["kubectl logs {entity} -n {namespace} --previous", "kubectl describe pod {entity} -n {namespace}"],
+    },
+    {
+        "id": "github_ci_step_failure",
+        "priority": 0,
+        "pattern": r"^github:failed_check:(?P<step>.+)$",
+        "overall_status": "DEGRADED",
+        "severity": "MEDIUM",
+        "confidence": 88,
+        "root_cause": "The latest CI workflow run is failing at check step(s) {entities}.",
+        "immediate_actions": [
+            "Open the failing check's logs and fix or revert the offending commit",
+            "Hold deployments until the pipeline is green",
+            "Notify the author of the triggering commit",
+        ],
+        "long_term_recommendations": [
+            "Require passing checks before merge",
+            "Quarantine flaky tests instead of retrying the workflow",
+        ],
+        "commands": ["gh run view {run_id} --log-failed"],
+    },
+]
+
+
+def _compile(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{**rule, "regex": re.compile(rule["pattern"])} for rule in rules]
+
+
+def pod_reasons(pod: Dict[str, Any]) -> List[str]:
+    """
+    Reasons describing a pod's containers now. A ready container's last
+    state is history (it restarted and recovered since), so only containers
+    that are not ready add their last termination reason, e.g. the OOMKilled
+    behind a CrashLoopBackOff.
+    """
+    reasons = []
+    for cs in pod.get("container_statuses") or []:
+        for field in ("state",) if cs.get("ready") else ("state", "last_state"):
+            if cs.get(field):
+                reasons.extend(STATE_REASON.findall(cs[field]))
+    return [r for r in reasons if r != "Completed"]
+
+
+def needs_explanation(pod: Dict[str, Any]) -> bool:
+    """Pods a k8s signature must account for before the rules tier may answer"""
+    if pod.get("phase") not in ("Running", "Succeeded"):
+        return True
+    if pod.get("phase") == "Running" and any(not cs.get("ready") for cs in pod.get("container_statuses") or []):
+        return True
+    return bool(pod_reasons(pod))
+
+
+def extract_signals(service: str, raw_data: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Signals (text + entity context) from a service's raw data"""
+    signals = []
+    raw_data = raw_data or {}
+
+    if service == "k8s":
+        for pod in raw_data.get("pods") or []:
+            if not isinstance(pod, dict):
+                continue
+            for reason in set(pod_reasons(pod)):
+                signals.append({
+                    "text": f"k8s:reason:{reason}",
+                    "entity": pod.get("name"),
+                    "namespace": pod.get("namespace") or "default",
+                })
+
+    elif service == "github":
+        runs = raw_data.get("recent_runs") or {}
+        runs = runs.get("runs", []) if isinstance(runs, dict) else runs
+        # Only the most recent completed run reflects the current pipeline state
+        completed = [r for r in runs if r.get("status") == "completed"]
+        latest = completed[0] if completed else None
+        if latest and latest.get("conclusion") == "failure":
+            for check in latest.get("failed_checks") or []:
+                signals.append({
+                    "text": f"github:failed_check:{check}",
+                    "entity": check,
+                    "run_id": latest.get("id"),
+                })
+
+    return signals
+
+
+class RulesEngine:
+    """
+    Deterministic first tier: answers clearly healthy states and textbook
+    failure signatures without an LLM call. Anything ambiguous returns None.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]] = SIGNATURE_RULES, healthy_score: int = 95):
+        # Compiled once when the agent starts
+        self.rules = _compile(rules)
+        self.healthy_score = healthy_score
+
+    def _match(self, signal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        matches = [rule for rule in self.rules if rule["regex"].match(signal["text"])]
+        return min(matches, key=lambda r: r["priority"]) if matches else None
+
+    def evaluate(self, service_healths: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Partial data: the service that timed out may hold the real cause
+        healths = service_healths
+        if not healths or any(h.status == "TIMED_OUT" for h in healths.values()):
+            return None
+
+        if all(h.status == "HEALTHY" and h.score >= self.healthy_score for h in healths.values()):
+            return self._healthy(healths)
+
+        # Best rule per (service, entity); several distinct rules means ambiguity
+        per_entity: Dict[Tuple[str, str], Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+        for service, health in healths.items():
+            for signal in extract_signals(service, health.raw_data):
+                rule = self._match(signal)
+                if rule is None:
+                    continue
+                key = (service, signal["entity"])
+                current = per_entity.get(key)
+                if current is None or rule["priority"] < current[0]["priority"]:
+                    per_entity[key] = (rule, signal)
+
+        rules_hit = {rule["id"] for rule, _ in per_entity.values()}
+        if len(rules_hit) != 1:
+            return None
+
+        # Every unhealthy service, and every unhealthy pod, must be explained by the matched signature
+        explained = {service for service, _ in per_entity}
+        unexplained = [s for s, h in healths.items() if h.status != "HEALTHY" and s not in explained]
+        if unexplained:
+            return None
+        k8s = healths.get("k8s")
+        pods = ((k8s.raw_data or {}).get("pods") or []) if k8s is not None else []
+        if any(isinstance(p, dict) and needs_explanation(p) and ("k8s", p.get("name")) not in per_entity for p in pods):
+            return None
+
+        rule = next(iter(per_entity.values()))[0]
+        return self._classified([signal for _, signal in per_entity.values()], rule, healths)
+
+    def _healthy(self, healths: Dict[str, Any]) -> Dict[str, Any]:
+        scores = ", ".join(f"{s}={h.score}" for s, h in healths.items())
+        return {
+            "overall_status": "HEALTHY",
+            "root_cause_analysis": f"All analyzed services are healthy ({scores}); no incident detected.",
+            "immediate_actions": ["No action required"],
+            "long_term_recommendations": list(dict.fromkeys(
+                r for h in healths.values() for r in h.recommendations
+            ))[:3],
+            "commands_to_execute": [],
+            "severity": "LOW",
+            "confidence": 95,
+            "tier": "rules",
+            "rule_ids": ["all_healthy"],
+        }
+
+    def _classified(self, signals: List[Dict[str, Any]], rule: Dict[str, Any],
+                    healths: Dict[str, Any]) -> Dict[str, Any]:
+        entities = sorted({str(s["entity"]) for s in signals})
+        shown = ", ".join(entities[:5]) + (f" and {len(entities) - 5} more" if len(entities) > 5 else "")
+        first = signals[0]
+        commands = [
+            command.format(entity=first.get("entity"), namespace=first.get("namespace", "default"),
+                           run_id=first.get("run_id", "<run-id>"))
+            for command in rule["commands"]
+        ]
+        # Never report a better status than the collectors measured
+        rank = ["HEALTHY", "DEGRADED", "CRITICAL"]
+        statuses = [rule["overall_status"]] + [h.status for h in healths.values() if h.status in rank]
+        overall_status = max(statuses, key=rank.index)
+        return {
+            "overall_status": overall_status,
+            "root_cause_analysis": rule["root_cause"].format(entities=shown),
+            "immediate_actions": rule["immediate_actions"],
+            "long_term_recommendations": rule["long_term_recommendations"],
+            "commands_to_execute": commands,
+            "severity": rule["severity"],
+            "confidence": rule["confidence"],
+            "tier": "rules",
+            "rule_ids": [rule["id"]],
+        }
@@ -0,0 +1,143 @@
+# agent/tracing.py
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed phase with nested child phases"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children: List["Span"] = []
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.root = parent.root if parent else self
+        if parent:
+            parent.children.append(self)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "offset_ms": round((self.start - self.root.start) * 1000, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            **self.attrs,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def _activate(span_: Span):
+    token = _current.set(span_)
+    try:
+        yield span_
+    except BaseException as e:
+        span_.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        span_.finish()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Exited from another context (e.g. an async generator closed elsewhere)
+            _current.set(None)
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """Start a new root span; phases opened inside it nest under it"""
+    with _activate(Span(name, **attrs)) as root:
+        yield root
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a phase under the current span; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with _activate(Span(name, parent, **attrs)) as child:
+        yield child
+
+
+@asynccontextmanager
+async def connected(client, name: str = "connect"):
+    """`async with client` with the session handshake timed as its own phase"""
+    with span(name):
+        await client.__aenter__()
+    try:
+        yield client
+    except BaseException as e:
+        if not await client.__aexit__(type(e), e, e.__traceback__):
+            raise
+    else:
+        await client.__aexit__(None, None, None)
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    path = f"{prefix}/{tree['name']}" if prefix else tree["name"]
+    phases = {path: tree["duration_ms"]}
+    for child in tree["children"]:
+        for child_path, duration in _flatten(child, path).items():
+            # Repeated phases (e.g. several map calls) add up
+            phases[child_path] = phases.get(child_path, 0.0) + duration
+    return phases
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+class PhaseStats:
+    """Per-phase latency percentiles over the most recent traces"""
+
+    def __init__(self, max_traces: int = 500):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def record(self, trace_id: str, tree: Dict[str, Any]):
+        self._traces[trace_id] = _flatten(tree)
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+
+    def add_phase(self, trace_id: str, path: str, duration_ms: float):
+        """Attach a phase measured after its trace was recorded (e.g. persistence)"""
+        if trace_id in self._traces:
+            self._traces[trace_id][path] = duration_ms
+
+    def summary(self, last: Optional[int] = None) -> Dict[str, Any]:
+        traces = list(self._traces.values())
+        if last:
+            traces = traces[-last:]
+        durations: Dict[str, List[float]] = {}
+        for phases in traces:
+            for path, duration in phases.items():
+                durations.setdefault(path, []).append(duration)
+        phases = {}
+        for path, values in sorted(durations.items()):
+            values.sort()
+            phases[path] = {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 0.5), 2),
+                "p95_ms": round(_percentile(values, 0.95), 2),
+                "max_ms": round(values[-1], 2),
+            }
+        return {"traces": len(traces), "phases": phases}
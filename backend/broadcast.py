@@ -0,0 +1,90 @@
+# backend/broadcast.py
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, Optional, Set
+
+from agent.log import get_logger
+
+logger = get_logger("broadcast")
+
+
+def sse_frame(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    frame = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return f"id: {event_id}\n{frame}" if event_id is not None else frame
+
+
+class Subscriber:
+    __slots__ = ("id", "queue", "dropped")
+
+    def __init__(self, subscriber_id: int, queue_size: int):
+        self.id = subscriber_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class Broadcaster:
+    """
+    Fan-out of server-sent events to every open dashboard. Each event is
+    encoded once and handed to per-client bounded queues; a client whose
+    queue is full is disconnected (told to resync) rather than slowing
+    publishers or growing memory.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = max(queue_size, 2)
+        self._subscribers: Set[Subscriber] = set()
+        self._ids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._counts = {"published": 0, "delivered": 0, "dropped_clients": 0}
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(next(self._ids), self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, data: Any):
+        if not self._subscribers:
+            return
+        frame = sse_frame(event, data, next(self._event_ids))
+        self._counts["published"] += 1
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+                self._counts["delivered"] += 1
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        # Discard the backlog and leave room for one last frame and the end marker
+        self._subscribers.discard(subscriber)
+        subscriber.dropped = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(sse_frame("resync", {"reason": "slow consumer"}))
+        subscriber.queue.put_nowait(None)
+        self._counts["dropped_clients"] += 1
+        logger.info("Dropped slow event subscriber %d", subscriber.id)
+
+    async def stream(self, subscriber: Subscriber, initial: Optional[str] = None, keepalive: float = 15.0):
+        """SSE body for one client; ends when the client is dropped or disconnects"""
+        try:
+            if initial:
+                yield initial
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counts, "subscribers": len(self._subscribers), "queue_size": self.queue_size}
@@ -1,15 +1,40 @@
 import motor.motor_asyncio
 import os
 from dotenv import load_dotenv
+from pymongo import monitoring
+
+from agent.metrics import REGISTRY
 
 load_dotenv()
 
+MONGO_SECONDS = REGISTRY.histogram("mongo_command_duration_seconds", "MongoDB command latency",
+                                   ("command", "outcome"))
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Records every MongoDB command's server round trip"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "success")
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name, "error")
+
+
 # MongoDB connection
-client = motor.motor_asyncio.AsyncIOMotorClient(os.getenv("MONGODB_URL", "mongodb://localhost:27017"))
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    os.getenv("MONGODB_URL", "mongodb://localhost:27017"),
+    event_listeners=[CommandMetrics()]
+)
 db = client.sre_agent
 
 # Collections
 incident_analysis = db.incident_analysis
 k8s_analysis = db.k8s_analysis
 aws_analysis = db.aws_analysis
-github_analysis = db.github_analysis
\ No newline at end of file
+github_analysis = db.github_analysis
+analysis_cache = db.analysis_cache
+raw_blobs = db.raw_blobs
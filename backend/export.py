@@ -0,0 +1,59 @@
+# backend/export.py
+import asyncio
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+def _default(value: Any):
+    # ObjectIds and anything else non-JSON become strings
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def projection_for(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """Inclusion projection from a comma separated field list (dotted paths allowed)"""
+    if not fields:
+        return None
+    names = [f.strip() for f in fields.split(",") if f.strip() and not f.strip().startswith("$")]
+    return {name: 1 for name in names} or None
+
+
+class _Encoder:
+    """NDJSON lines, optionally through a single streaming gzip member"""
+
+    def __init__(self, compress: bool):
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(self, batch: List[Dict[str, Any]]) -> bytes:
+        data = "".join(json.dumps(document, default=_default) + "\n" for document in batch).encode("utf-8")
+        return self._gzip.compress(data) if self._gzip else data
+
+    def finish(self) -> bytes:
+        return self._gzip.flush() if self._gzip else b""
+
+
+async def export_ndjson(collection, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                        batch_size: int = 500, compress: bool = False) -> AsyncIterator[bytes]:
+    """
+    Stream matching documents oldest first, one cursor batch at a time;
+    memory stays bounded by `batch_size` regardless of the result size.
+    Encoding and compression run on a worker thread.
+    """
+    encoder = _Encoder(compress)
+    cursor = collection.find(query, projection).sort([("timestamp", 1), ("_id", 1)]).batch_size(batch_size)
+    batch: List[Dict[str, Any]] = []
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            chunk = await asyncio.to_thread(encoder.encode, batch)
+            batch = []
+            if chunk:
+                yield chunk
+    if batch:
+        chunk = await asyncio.to_thread(encoder.encode, batch)
+        if chunk:
+            yield chunk
+    tail = encoder.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,216 @@
+# backend/jobs.py
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+# Lower runs first. One level is worth `aging_seconds` of queue time, so a
+# low-priority job that has waited long enough overtakes newer urgent ones.
+PRIORITY_LEVELS = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+
+DEADLINE_EXPIRED = "Deadline expired while the job was queued"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class AnalysisJob:
+    def __init__(self, request, deadline: Optional[float] = None):
+        self.id = f"job_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{os.urandom(4).hex()}"
+        self.request = request
+        self.deadline = deadline  # epoch seconds; queue time counts against it
+        self.priority = request.priority if request.priority in PRIORITY_LEVELS else "medium"
+        self.status = QUEUED
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False  # set by cancel(), as opposed to the queue stopping
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "query": self.request.query,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat(),
+            "wait_time": (self.started_at or self.finished_at or time.time()) - self.created_at,
+            "run_time": (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+            "result": self.result.dict() if self.result is not None else None,
+            "error": self.error,
+        }
+
+
+class AnalysisJobQueue:
+    """
+    Bounded worker pool pulling analysis jobs from a priority queue with aging.
+    Runs outside the queue (streaming) hold one of the same `workers` slots,
+    so at most `workers` analyses run at once whichever way they arrive.
+    """
+
+    def __init__(self, runner: Callable[[Any], Awaitable[Any]], workers: int = 2,
+                 max_queued: int = 100, aging_seconds: float = 30.0, retain: int = 500):
+        self.runner = runner
+        self.workers = workers
+        self.max_queued = max_queued
+        self.aging_seconds = aging_seconds
+        self.retain = retain
+        self.jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._workers = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._wait_times = deque(maxlen=200)
+        self._counts = {COMPLETED: 0, FAILED: 0, CANCELLED: 0}
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def check_capacity(self):
+        """Raise QueueFullError if no more analyses may wait for a slot"""
+        if self._queued >= self.max_queued:
+            raise QueueFullError(f"Analysis queue is full ({self.max_queued} jobs waiting)")
+
+    def submit(self, request, deadline: Optional[float] = None) -> AnalysisJob:
+        """Queue a request; with a `deadline`, the analysis only gets the time left when it starts"""
+        self.check_capacity()
+        job = AnalysisJob(request, deadline)
+        # Static key equivalent to aging: enqueue time plus a per-level head start
+        key = job.created_at + PRIORITY_LEVELS[job.priority] * self.aging_seconds
+        self._queue.put_nowait((key, next(self._seq), job))
+        self._queued += 1
+        self._remember(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[AnalysisJob]:
+        job = self.jobs.get(job_id)
+        if job is None or job.done.is_set():
+            return job
+        if job.status == QUEUED:
+            # Left in the heap; the worker that pops it skips it
+            self._queued -= 1
+            self._finish(job, CANCELLED)
+        elif job.task is not None:
+            job.cancel_requested = True
+            job.task.cancel()
+        return job
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a run slot for an analysis run outside the queue; waiting counts as queued"""
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+        self._running += 1
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[AnalysisJob]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.done.wait()), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._wait_times)
+        queued_by_priority = {p: 0 for p in PRIORITY_LEVELS}
+        for job in self.jobs.values():
+            if job.status == QUEUED:
+                queued_by_priority[job.priority] += 1
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queued,
+            "max_queued": self.max_queued,
+            "running": self._running,
+            "queued_by_priority": queued_by_priority,
+            "avg_wait_time": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait_time": waits[int(len(waits) * 0.95) - 1] if waits else 0.0,
+            "max_wait_time": waits[-1] if waits else 0.0,
+            **self._counts,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status != QUEUED:
+                continue
+
+            # A slot may be held by a streaming run; the job stays cancellable meanwhile
+            async with self._slots:
+                if job.status != QUEUED:
+                    continue
+                self._queued -= 1
+                job.started_at = time.time()
+                self._wait_times.append(job.started_at - job.created_at)
+                request = job.request
+                if job.deadline is not None:
+                    remaining = job.deadline - job.started_at
+                    if remaining <= 0:
+                        job.error = DEADLINE_EXPIRED
+                        self._finish(job, FAILED)
+                        continue
+                    request = request.model_copy(update={"timeout": remaining})
+                self._running += 1
+                job.status = RUNNING
+
+                job.task = asyncio.create_task(self.runner(request))
+                try:
+                    job.result = await job.task
+                    self._finish(job, COMPLETED)
+                except asyncio.CancelledError:
+                    job.task.cancel()
+                    self._finish(job, CANCELLED)
+                    # Stopping the queue cancels the worker, which must not survive it
+                    if not job.cancel_requested or asyncio.current_task().cancelling():
+                        raise
+                except Exception as e:
+                    job.error = str(e)
+                    self._finish(job, FAILED)
+                finally:
+                    self._running -= 1
+
+    def _finish(self, job: AnalysisJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        self._counts[status] += 1
+        job.done.set()
+
+    def _remember(self, job: AnalysisJob):
+        self.jobs[job.id] = job
+        # Drop the oldest finished jobs beyond the retention limit
+        while len(self.jobs) > self.retain:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if not oldest.done.is_set():
+                break
+            del self.jobs[oldest_id]
@@ -2,61 +2,139 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from contextlib import asynccontextmanager
 from agent.agent import agent, AnalysisRequest, AnalysisResponse
-from agent.config import ConfigManager
+from agent.config import SCOPE_FIELDS
+from agent.metrics import REGISTRY, CONTENT_TYPE
+from agent.log import setup_logging, set_level, get_levels
 from backend.db import db
-from datetime import datetime
+from backend.jobs import DEADLINE_EXPIRED, AnalysisJobQueue, QueueFullError
+from backend.poller import HealthPoller, SnapshotStore
+from backend.probes import ProbeCache
+from backend.broadcast import Broadcaster, sse_frame
+from backend.pagination import HISTORY_INDEXES, SUMMARY_PROJECTION, InvalidCursor, fetch_history_page, history_filter
+from backend.export import export_ndjson, projection_for
+from backend.writer import WriteBehindQueue
+from backend.rollups import AnalysisRollups
+from backend.timeseries import COLLECTIONS as HEALTH_COLLECTIONS, HealthSeries
+from backend.retention import RetentionJob
+from datetime import datetime, timedelta
 import json
-import asyncio
+import time
+from typing import Optional
 
 from bson import ObjectId
 import json
 
-# Initialize config manager
-config_manager = ConfigManager()
+logger = setup_logging("backend")
+
+# One config store for the backend and the agent; /config changes apply to both
+config_manager = agent.config_manager
+
+# Fields kept in the app_config record in MongoDB
+CONFIG_RECORD_FIELDS = ("github_owner", "github_repo", "k8s_namespace", "aws_region",
+                        "analysis_timeout", "max_history_items", "prompt_token_budget")
+
+async def persist_config_record(config):
+    """Debounced config writer: upsert the app_config record"""
+    now = datetime.utcnow()
+    await db.configurations.update_one(
+        {"type": "app_config"},
+        {"$set": {**{field: getattr(config, field) for field in CONFIG_RECORD_FIELDS}, "updated_at": now},
+         "$setOnInsert": {"created_at": now}},
+        upsert=True
+    )
+
+config_manager.add_writer(persist_config_record)
 
 # Store analysis history - REMOVED, agent handles this.
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    print("Unified SRE Agent starting up...")
+    logger.info("Unified SRE Agent starting up...")
+    
+    # Collection handles need no I/O; attach them first so a slow or
+    # unreachable database at startup only costs the index setup below
+    agent.analysis_cache.attach_store(db.analysis_cache)  # Mongo tier for the analysis cache
+    agent.blobs.attach_store(db.raw_blobs)  # Raw service payloads, stored once per content hash
+    persistence.attach_store(db.incident_analysis)  # Completed analyses, written behind the response
+    retention.attach_store(db.incident_analysis, db.raw_blobs)
     
     # Initialize database collections if needed
     try:
         # Create indexes for configurations collection
         await db.configurations.create_index("type", unique=True)
-        print("✅ Database configurations collection initialized")
+        logger.info("Database configurations collection initialized")
+        
+        # Analysis cache entries expire via TTL index
+        await db.analysis_cache.create_index("expires_at", expireAfterSeconds=0)
+        logger.info("Analysis cache collection initialized")
+        
+        # Keyset pagination indexes for the analysis history
+        for keys in HISTORY_INDEXES:
+            await db.incident_analysis.create_index(keys)
+        await db.incident_analysis.create_index("analysis.id")
+        logger.info("Analysis history indexes initialized")
+    except Exception as e:
+        logger.warning("Database initialization: %s", e)
+    
+    try:
+        # Hour/day rollups, updated from each persisted batch
+        await rollups.attach_store(db)
+        logger.info("Analysis rollups initialized")
     except Exception as e:
-        print(f"⚠️ Database initialization: {e}")
+        logger.warning("Rollup initialization: %s", e)
+    
+    try:
+        # Per-service health samples in time-series collections with TTL retention
+        await health_series.attach_store(db, config_manager.get_config().health_retention_days)
+        logger.info("Health time-series collections initialized")
+    except Exception as e:
+        logger.warning("Health time-series initialization: %s", e)
     
     # Load configuration from database on startup
     try:
         config_record = await db.configurations.find_one({"type": "app_config"})
         if config_record:
-            # Update config manager with database values
-            from agent.config import AgentConfig
-            db_config = AgentConfig(
-                github_owner=config_record.get("github_owner", ""),
-                github_repo=config_record.get("github_repo", ""),
-                k8s_namespace=config_record.get("k8s_namespace", "default"),
-                aws_region=config_record.get("aws_region", "us-east-1"),
-                analysis_timeout=config_record.get("analysis_timeout", 30),
-                max_history_items=config_record.get("max_history_items", 100)
-            )
-            config_manager.config = db_config
-            config_manager.save_config()
-            print("✅ Configuration loaded from database on startup")
+            # Database values override the file
+            config_manager.update(**{
+                field: config_record[field] for field in CONFIG_RECORD_FIELDS if field in config_record
+            })
+            logger.info("Configuration loaded from database on startup")
     except Exception as e:
-        print(f"⚠️ Failed to load config from database: {e}")
+        logger.warning("Failed to load config from database: %s", e)
+    
+    config = config_manager.get_config()
+    logger.info("Loaded configuration: %s", config.dict())
+    
+    job_queue.workers = config.job_workers
+    job_queue.max_queued = config.job_queue_size
+    job_queue.aging_seconds = config.job_aging_seconds
+    job_queue.start()
+    logger.info("Analysis job queue started with %d workers", job_queue.workers)
+    persistence.start()
+    retention.start()
     
-    print(f"Loaded configuration: {config_manager.get_config().dict()}")
+    # Dashboard endpoints read snapshots kept fresh by the background poller
+    poller.intervals = dict(config.poll_intervals)
+    poller.min_interval = config.poll_min_interval
+    poller.max_interval = config.poll_max_interval
+    poller.start()
+    logger.info("Health poller started for %s", ", ".join(poller.intervals))
     yield
     # Shutdown
-    print("Unified SRE Agent shutting down...")
+    logger.info("Unified SRE Agent shutting down...")
+    await poller.stop()
+    await retention.stop()
+    await job_queue.stop()
+    await persistence.stop()
+    await agent.blobs.drain()
+    await health_series.stop()
+    await config_manager.flush()
 
 app = FastAPI(title="Unified SRE Agent", lifespan=lifespan)
 
@@ -68,44 +146,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency by route",
+                                  ("method", "route", "status"))
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates keep the label set bounded (/analysis/{analysis_id}, not each id)
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - start, request.method,
+                             getattr(route, "path", "unmatched"), str(status))
+
 # Import MCP clients for connection testing
 from clients.mcp_clients import k8s, aws, github
 
-async def test_k8s_connection():
-    """Test Kubernetes connection"""
+async def _ping(client, tool: str, args: dict, label: str, describe):
+    """Run a server's cheap ping tool and shape it like a connection test"""
     try:
-        async with k8s:
-            result = await k8s.call_tool("list_pods", {"namespace": config_manager.get_config().k8s_namespace})
-            data = agent._extract_mcp_data(result)
-            return {
-                "success": True,
-                "message": f"Kubernetes connected successfully - {data.get('count', 0)} pods found",
-                "data": data
-            }
+        async with client:
+            data = agent._extract_mcp_data(await client.call_tool(tool, args))
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Kubernetes connection failed: {str(e)}"
-        }
+        return {"success": False, "error": f"{label} connection failed: {str(e)}"}
+    if not isinstance(data, dict) or not data.get("success"):
+        error = data.get("error", "unknown error") if isinstance(data, dict) else "unexpected response"
+        return {"success": False, "error": f"{label} connection failed: {error}"}
+    return {"success": True, "message": f"{label} connected successfully - {describe(data)}", "data": data}
+
+async def ping_k8s():
+    return await _ping(k8s, "ping", {}, "Kubernetes", lambda d: f"API server {d.get('server_version')}")
+
+async def ping_aws():
+    return await _ping(aws, "ping", {}, "AWS", lambda d: f"region {d.get('region')}")
+
+async def ping_github(owner: str, repo: str):
+    return await _ping(github, "gh_ping", {"owner": owner, "repo": repo}, "GitHub", lambda d: d.get("repo"))
+
+# Short-lived cache of connectivity probes, cleared whenever the config is saved
+probes = ProbeCache({"k8s": ping_k8s, "aws": ping_aws, "github": ping_github})
 
-async def test_aws_connection():
+def probe_requests():
+    """{service: probe args} for every configured service"""
+    config = config_manager.get_config()
+    requests = {"k8s": (), "aws": ()}
+    if config.github_owner and config.github_repo:
+        requests["github"] = (config.github_owner, config.github_repo)
+    return requests
+
+async def test_k8s_connection(fresh: bool = False):
+    """Test Kubernetes connection"""
+    return await probes.get("k8s", fresh=fresh)
+
+async def test_aws_connection(fresh: bool = False):
     """Test AWS connection"""
-    try:
-        async with aws:
-            result = await aws.call_tool("list_log_groups", {})
-            data = agent._extract_mcp_data(result)
-            return {
-                "success": True,
-                "message": f"AWS connected successfully - {data.get('count', 0)} log groups found",
-                "data": data
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"AWS connection failed: {str(e)}"
-        }
+    return await probes.get("aws", fresh=fresh)
 
-async def test_github_connection():
+async def test_github_connection(fresh: bool = False):
     """Test GitHub connection"""
     config = config_manager.get_config()
     if not config.github_owner or not config.github_repo:
@@ -113,54 +214,23 @@ async def test_github_connection():
             "success": False,
             "error": "GitHub owner and repository not configured"
         }
-    
-    try:
-        async with github:
-            result = await github.call_tool("gh_check_workflow_health", {
-                "owner": config.github_owner,
-                "repo": config.github_repo
-            })
-            data = agent._extract_mcp_data(result)
-            return {
-                "success": True,
-                "message": f"GitHub connected successfully - Status: {data.get('status', 'unknown')}",
-                "data": data
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"GitHub connection failed: {str(e)}"
-        }
+    return await probes.get("github", config.github_owner, config.github_repo, fresh=fresh)
 
 # Configuration APIs
+# Changes go to the shared config store; it notifies subscribers (probe and
+# analysis caches, the poller) and writes the file and database record behind
+# the response, so several quick edits cost one write.
 @app.get("/config")
 async def get_configuration():
-    """Get current configuration - try database first, then file"""
+    """Get current configuration from the shared store"""
     try:
-        # Try database first
-        config_record = await db.configurations.find_one({"type": "app_config"})
-        if config_record:
-            # Return database config
-            config_data = {
-                "github_owner": config_record.get("github_owner", ""),
-                "github_repo": config_record.get("github_repo", ""),
-                "k8s_namespace": config_record.get("k8s_namespace", "default"),
-                "aws_region": config_record.get("aws_region", "us-east-1"),
-                "analysis_timeout": config_record.get("analysis_timeout", 30),
-                "max_history_items": config_record.get("max_history_items", 100)
-            }
-            return {
-                "success": True,
-                "config": config_data,
-                "source": "database"
-            }
-        
-        # Fallback to file config
         config = config_manager.get_config()
+        config_record = await db.configurations.find_one({"type": "app_config"}, {"_id": 1})
         return {
             "success": True,
             "config": config.dict(),
-            "source": "file"
+            "version": config_manager.version,
+            "source": "database" if config_record else "file"
         }
         
     except Exception as e:
@@ -168,27 +238,9 @@ async def get_configuration():
 
 @app.post("/config/save")
 async def save_configuration(config_data: dict):
-    """Save new configuration to database"""
+    """Save new configuration"""
     try:
-        # Create configuration record
-        config_record = {
-            "type": "app_config",
-            "github_owner": config_data.get("github_owner", ""),
-            "github_repo": config_data.get("github_repo", ""),
-            "k8s_namespace": config_data.get("k8s_namespace", "default"),
-            "aws_region": config_data.get("aws_region", "us-east-1"),
-            "analysis_timeout": config_data.get("analysis_timeout", 30),
-            "max_history_items": config_data.get("max_history_items", 100),
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        # Save to database
-        result = await db.configurations.insert_one(config_record)
-        
-        # Also update config manager
-        from agent.config import AgentConfig
-        new_config = AgentConfig(
+        new_config = config_manager.update(
             github_owner=config_data.get("github_owner", ""),
             github_repo=config_data.get("github_repo", ""),
             k8s_namespace=config_data.get("k8s_namespace", "default"),
@@ -196,56 +248,45 @@ async def save_configuration(config_data: dict):
             analysis_timeout=config_data.get("analysis_timeout", 30),
             max_history_items=config_data.get("max_history_items", 100)
         )
-        config_manager.config = new_config
-        config_manager.save_config()
         
         return {
             "success": True,
             "message": "Configuration saved successfully",
-            "config_id": str(result.inserted_id),
+            "version": config_manager.version,
             "config": new_config.dict()
         }
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/config/update")
 async def update_configuration(config_data: dict):
-    """Update existing configuration in database"""
+    """Update existing configuration"""
     try:
-        # Update configuration in database
         update_data = {
             "github_owner": config_data.get("github_owner"),
             "github_repo": config_data.get("github_repo"),
             "k8s_namespace": config_data.get("k8s_namespace"),
             "aws_region": config_data.get("aws_region"),
             "analysis_timeout": config_data.get("analysis_timeout"),
-            "max_history_items": config_data.get("max_history_items"),
-            "updated_at": datetime.utcnow()
+            "max_history_items": config_data.get("max_history_items")
         }
         
         # Remove None values
         update_data = {k: v for k, v in update_data.items() if v is not None}
-        
-        result = await db.configurations.update_one(
-            {"type": "app_config"},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            # No existing config, create new one
-            return await save_configuration(config_data)
-        
-        # Also update config manager
-        current_config = config_manager.get_config()
-        updated_config = current_config.copy(update=update_data)
-        config_manager.config = updated_config
-        config_manager.save_config()
+        updated_config = config_manager.update(**update_data)
         
         return {
             "success": True,
             "message": "Configuration updated successfully",
+            "version": config_manager.version,
             "config": updated_config.dict()
         }
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -259,33 +300,19 @@ async def update_github_config(github_config: dict):
         if not github_owner or not github_repo:
             raise HTTPException(status_code=400, detail="GitHub owner and repository are required")
         
-        # Update in database
-        update_data = {
-            "github_owner": github_owner,
-            "github_repo": github_repo,
-            "updated_at": datetime.utcnow()
-        }
-        
-        result = await db.configurations.update_one(
-            {"type": "app_config"},
-            {"$set": update_data},
-            upsert=True
-        )
-        
-        # Update config manager
-        current_config = config_manager.get_config()
-        updated_config = current_config.copy(update={
-            "github_owner": github_owner,
-            "github_repo": github_repo
-        })
-        config_manager.config = updated_config
-        config_manager.save_config()
+        updated_config = config_manager.update(github_owner=github_owner, github_repo=github_repo)
         
         return {
             "success": True,
             "message": "GitHub configuration updated successfully",
+            "version": config_manager.version,
             "config": updated_config.dict()
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -294,30 +321,17 @@ async def update_k8s_config(k8s_config: dict):
     """Update only Kubernetes configuration"""
     try:
         k8s_namespace = k8s_config.get("k8s_namespace", "default")
-        
-        # Update in database
-        update_data = {
-            "k8s_namespace": k8s_namespace,
-            "updated_at": datetime.utcnow()
-        }
-        
-        result = await db.configurations.update_one(
-            {"type": "app_config"},
-            {"$set": update_data},
-            upsert=True
-        )
-        
-        # Update config manager
-        current_config = config_manager.get_config()
-        updated_config = current_config.copy(update={"k8s_namespace": k8s_namespace})
-        config_manager.config = updated_config
-        config_manager.save_config()
+        updated_config = config_manager.update(k8s_namespace=k8s_namespace)
         
         return {
             "success": True,
             "message": "Kubernetes configuration updated successfully",
+            "version": config_manager.version,
             "config": updated_config.dict()
         }
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -326,30 +340,17 @@ async def update_aws_config(aws_config: dict):
     """Update only AWS configuration"""
     try:
         aws_region = aws_config.get("aws_region", "us-east-1")
-        
-        # Update in database
-        update_data = {
-            "aws_region": aws_region,
-            "updated_at": datetime.utcnow()
-        }
-        
-        result = await db.configurations.update_one(
-            {"type": "app_config"},
-            {"$set": update_data},
-            upsert=True
-        )
-        
-        # Update config manager
-        current_config = config_manager.get_config()
-        updated_config = current_config.copy(update={"aws_region": aws_region})
-        config_manager.config = updated_config
-        config_manager.save_config()
+        updated_config = config_manager.update(aws_region=aws_region)
         
         return {
             "success": True,
             "message": "AWS configuration updated successfully",
+            "version": config_manager.version,
             "config": updated_config.dict()
         }
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -357,36 +358,25 @@ async def update_aws_config(aws_config: dict):
 async def update_agent_config(agent_config: dict):
     """Update only agent settings"""
     try:
-        analysis_timeout = agent_config.get("analysis_timeout", 30)
-        max_history_items = agent_config.get("max_history_items", 100)
-        
-        # Update in database
         update_data = {
-            "analysis_timeout": analysis_timeout,
-            "max_history_items": max_history_items,
-            "updated_at": datetime.utcnow()
+            "analysis_timeout": agent_config.get("analysis_timeout", 30),
+            "max_history_items": agent_config.get("max_history_items", 100)
         }
         
-        result = await db.configurations.update_one(
-            {"type": "app_config"},
-            {"$set": update_data},
-            upsert=True
-        )
+        if "prompt_token_budget" in agent_config:
+            update_data["prompt_token_budget"] = int(agent_config["prompt_token_budget"])
         
-        # Update config manager
-        current_config = config_manager.get_config()
-        updated_config = current_config.copy(update={
-            "analysis_timeout": analysis_timeout,
-            "max_history_items": max_history_items
-        })
-        config_manager.config = updated_config
-        config_manager.save_config()
+        updated_config = config_manager.update(**update_data)
         
         return {
             "success": True,
             "message": "Agent configuration updated successfully",
+            "version": config_manager.version,
             "config": updated_config.dict()
         }
+    except ValueError as e:
+        # Rejected by config validation
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -397,9 +387,8 @@ async def delete_configuration():
         result = await db.configurations.delete_one({"type": "app_config"})
         
         if result.deleted_count > 0:
-            # Reset config manager to defaults
-            config_manager.config = config_manager._load_config()
-            config_manager.save_config()
+            # Back to file/env values; nothing is written, or the record would come back
+            config_manager.reload(persist=False)
             
             return {
                 "success": True,
@@ -431,35 +420,28 @@ async def check_configuration():
 async def test_service_connection(data: dict):
     """Test connection to a specific service"""
     service = data.get('service')
+    # An explicit test should reach the service, not the probe cache
+    fresh = data.get('fresh', True)
     
     if service == 'k8s':
-        result = await test_k8s_connection()
+        result = await test_k8s_connection(fresh)
     elif service == 'aws':
-        result = await test_aws_connection()
+        result = await test_aws_connection(fresh)
     elif service == 'github':
-        result = await test_github_connection()
+        result = await test_github_connection(fresh)
     else:
         raise HTTPException(status_code=400, detail=f"Unknown service: {service}")
     
     return result
 
 @app.post("/test-all-connections")
-async def test_all_connections():
-    """Test connections to all services"""
+async def test_all_connections(fresh: bool = False):
+    """Test connections to all services concurrently (cached for a few seconds)"""
     try:
-        results = {}
-        
-        # Test Kubernetes
-        results['k8s'] = await test_k8s_connection()
+        results = await probes.get_many(probe_requests(), fresh=fresh)
         
-        # Test AWS
-        results['aws'] = await test_aws_connection()
-        
-        # Test GitHub if configured
-        config = config_manager.get_config()
-        if config.github_owner and config.github_repo:
-            results['github'] = await test_github_connection()
-        else:
+        # GitHub is optional
+        if 'github' not in results:
             results['github'] = {
                 "success": False,
                 "error": "GitHub not configured"
@@ -480,78 +462,455 @@ async def test_all_connections():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/logging/levels")
+async def get_log_levels():
+    """Current log levels and records dropped by the non-blocking log queue"""
+    return get_levels()
+
+@app.put("/logging/levels")
+async def update_log_level(data: dict):
+    """Change a log level at runtime: {"level": "DEBUG", "logger": "agent"} (omit logger for all)"""
+    try:
+        set_level(data["level"], data.get("logger"))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid level: {e}")
+    return get_levels()
+
+@app.get("/metrics/prometheus")
+async def get_prometheus_metrics():
+    """Prometheus text exposition of backend, MCP client, LLM and Mongo telemetry"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Component stats are copied into gauges at scrape time only
+JOBS_GAUGE = REGISTRY.gauge("analysis_jobs", "Analysis jobs by state", ("state",))
+CACHE_GAUGE = REGISTRY.gauge("cache_stat", "Cache counters and sizes", ("cache", "stat"))
+GOVERNOR_GAUGE = REGISTRY.gauge("llm_governor", "LLM governor pacing state", ("stat",))
+PERSIST_GAUGE = REGISTRY.gauge("analysis_persistence", "Write-behind persistence queue state", ("stat",))
+
+def collect_component_stats():
+    jobs = job_queue.stats()
+    JOBS_GAUGE.set(jobs["queue_depth"], "queued")
+    JOBS_GAUGE.set(jobs["running"], "running")
+    for state in ("completed", "failed", "cancelled"):
+        JOBS_GAUGE.set(jobs[state], state)
+    cache = agent.analysis_cache.stats()
+    for stat in ("entries", "hits", "misses"):
+        CACHE_GAUGE.set(cache[stat], "analysis", stat)
+    blobs = agent.blobs.stats()
+    for stat in ("blobs_in_memory", "memory_bytes", "dedup_hits", "stored", "stored_bytes"):
+        CACHE_GAUGE.set(blobs[stat], "raw_blobs", stat)
+    governor = agent.llm.stats()
+    for stat in ("requests_last_minute", "tokens_last_minute", "waiting", "in_flight", "blocked_for"):
+        GOVERNOR_GAUGE.set(governor[stat], stat)
+
+    persisted = persistence.stats()
+    for stat in ("pending", "oldest_pending_seconds", "spill_bytes", "written", "spilled", "dropped"):
+        PERSIST_GAUGE.set(persisted[stat], stat)
+
+REGISTRY.register_collector(collect_component_stats)
+
+# Latest probe result per service, written by the poller
+snapshots = SnapshotStore()
+poller = HealthPoller(agent.poll_service, snapshots)
+
+def on_config_change(config, previous, changed):
+    """Config store subscriber: drop probe results for the old targets and re-poll"""
+    if changed & SCOPE_FIELDS:
+        probes.invalidate()
+        poller.refresh()
+    if changed & {"poll_intervals", "poll_min_interval", "poll_max_interval"}:
+        poller.intervals = {s: config.poll_intervals.get(s, i) for s, i in poller.intervals.items()}
+        poller.min_interval = config.poll_min_interval
+        poller.max_interval = config.poll_max_interval
+
+config_manager.subscribe(on_config_change)
+
+def snapshot_details():
+    """Per-service snapshot data; services not polled yet report as pending"""
+    details = {}
+    for service in poller.intervals:
+        snapshot = snapshots.get(service)
+        details[service] = snapshot.to_dict() if snapshot else {"status": "pending"}
+    return details
+
+def build_metrics():
+    """Dashboard metrics from the snapshots plus recent analysis stats"""
+    details = snapshot_details()
+    checked = [d["checked_at"] for d in details.values() if "checked_at" in d]
+    metrics = agent.summarize_service_details(details, min(checked) if checked else None)
+    metrics["snapshot_version"] = snapshots.version
+    metrics["snapshot_age_seconds"] = max(
+        (d["snapshot_age_seconds"] for d in details.values() if "snapshot_age_seconds" in d), default=None
+    )
+    
+    # Get recent analysis stats
+    recent_analyses = agent.get_analysis_history(10)
+    successful_analyses = len([a for a in recent_analyses if a.overall_status == "HEALTHY"])
+    analysis_success_rate = (successful_analyses / len(recent_analyses)) * 100 if recent_analyses else 100
+    
+    # Add analysis stats to the metrics dictionary
+    metrics["analysis_success_rate"] = analysis_success_rate
+    metrics["total_analyses"] = len(agent.analysis_history)
+    return metrics
+
+# Live dashboard events: one encoded frame per change, fanned out to every client
+events = Broadcaster()
+
+def publish_snapshot_delta(snapshot, previous):
+    """Push a service snapshot only when its data actually changed"""
+    if previous is not None and previous.data == snapshot.data:
+        return
+    metrics = build_metrics()
+    del metrics["services"]
+    events.publish("metrics", {**metrics, "changed": {snapshot.service: snapshot.to_dict()}})
+
+snapshots.listeners.append(publish_snapshot_delta)
+
+def analysis_summary(record: dict, result: AnalysisResponse):
+    """History-shaped record without per-service data, for live updates"""
+    analysis = result.analysis
+    return {
+        "_id": str(record.get("_id", analysis.id)),
+        "id": analysis.id,
+        "timestamp": record["timestamp"],
+        "query": record["query"],
+        "services_analyzed": result.services_analyzed,
+        "execution_time": result.execution_time,
+        "analysis": {
+            "id": analysis.id,
+            "overall_status": analysis.overall_status,
+            "severity": analysis.severity,
+            "confidence": analysis.confidence,
+            "root_cause_analysis": analysis.root_cause_analysis,
+            "tier": analysis.tier,
+        },
+    }
+
+@app.get("/events")
+async def stream_events():
+    """
+    Server-Sent Events for dashboards: a full `metrics` frame on connect, then
+    `metrics` deltas (with a `changed` map) and new `analysis` summaries.
+    A `resync` event means the client fell behind and should reconnect.
+    """
+    subscriber = events.subscribe()
+    return StreamingResponse(
+        events.stream(subscriber, initial=sse_frame("metrics", build_metrics())),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events/stats")
+async def get_event_stats():
+    return events.stats()
+
 # System Metrics API
 @app.get("/metrics")
 async def get_system_metrics():
-    """Get real-time system metrics from the agent"""
+    """System metrics from the latest service snapshots (no live calls)"""
     try:
-        # Get metrics from agent
-        metrics = await agent.get_system_metrics()
-        
-        # Get recent analysis stats
-        recent_analyses = agent.get_analysis_history(10)
-        successful_analyses = len([a for a in recent_analyses if a.overall_status == "HEALTHY"])
-        analysis_success_rate = (successful_analyses / len(recent_analyses)) * 100 if recent_analyses else 100
-        
-        # Add analysis stats to the metrics dictionary
-        metrics["analysis_success_rate"] = analysis_success_rate
-        metrics["total_analyses"] = len(agent.analysis_history)
-        
-        return metrics
-        
+        return build_metrics()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/metrics/refresh")
+async def refresh_system_metrics(service: Optional[str] = None):
+    """Ask the poller to probe now rather than at its next interval"""
+    poller.refresh(service)
+    return {"success": True, "snapshot_version": snapshots.version}
+
+# Write-behind persistence for completed analyses; each written batch feeds
+# the rollups and the health time series
+rollups = AnalysisRollups()
+health_series = HealthSeries()
+snapshots.listeners.append(health_series.add_snapshot)
+
+async def on_analyses_persisted(documents):
+    await rollups.apply(documents)
+    await health_series.add_analyses(documents)
+
+persistence = WriteBehindQueue(on_batch=on_analyses_persisted)
+
+# Compaction and archiving of old analyses, on a schedule from the config
+retention = RetentionJob(config_manager.get_config, agent.blobs)
+
+def persist_analysis(request: AnalysisRequest, result: AnalysisResponse):
+    """Queue a completed analysis for the incident_analysis collection"""
+    analysis_record = {
+        "_id": ObjectId(),  # assigned here so retried batches stay idempotent
+        "timestamp": datetime.utcnow(),
+        "query": request.query,
+        "services_analyzed": result.services_analyzed,
+        "execution_time": result.execution_time
+    }
+    # The full .dict() is built on the writer task, off the response path
+    analysis = result.analysis
+    persistence.enqueue(
+        lambda: {**analysis_record, "analysis": analysis.dict()},
+        # Phase stats see the enqueue-to-durable lag
+        on_written=lambda lag_ms: agent.record_phase(analysis, "persist", lag_ms)
+    )
+    events.publish("analysis", analysis_summary(analysis_record, result))
+
+async def run_analysis(request: AnalysisRequest) -> AnalysisResponse:
+    """Job runner: analyze and persist"""
+    result = await agent.analyze_incident(request)
+    
+    # Store in database
+    if result.success and result.analysis:
+        persist_analysis(request, result)
+    
+    return result
+
+# Analyses run on a bounded worker pool, ordered by request priority
+job_queue = AnalysisJobQueue(run_analysis)
+
+# Past its deadline an analysis returns partial results; this covers the
+# time to wrap up and persist before the request gives up on it
+RESPONSE_GRACE_SECONDS = 5.0
+
 # Enhanced Analysis APIs
 @app.post("/analyze-incident", response_model=AnalysisResponse)
 async def analyze_incident(request: AnalysisRequest):
     """
     Unified endpoint for intelligent incident analysis.
-    Uses configured settings automatically.
+    Uses configured settings automatically. The timeout starts when the
+    request arrives, so time spent queued comes out of the analysis budget;
+    a job that cannot finish in time is answered with 504 and its job id.
     """
+    budget = request.timeout or config_manager.get_config().analysis_timeout
     try:
-        result = await agent.analyze_incident(request)
-        
-        # Store in database
-        if result.success and result.analysis:
-            analysis_record = {
-                "timestamp": datetime.utcnow(),
-                "query": request.query,
-                "services_analyzed": result.services_analyzed,
-                "analysis": result.analysis.dict(),
-                "execution_time": result.execution_time
-            }
-            await db.incident_analysis.insert_one(analysis_record)
-            # REMOVED: analysis_history.append(analysis_record)
-        
-        return result
-        
+        job = job_queue.submit(request, deadline=time.time() + budget)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    await job_queue.wait(job.id, budget + RESPONSE_GRACE_SECONDS)
+    if job.status == "completed":
+        return job.result
+    if not job.done.is_set() or job.error == DEADLINE_EXPIRED:
+        raise HTTPException(status_code=504, detail={
+            "message": f"Analysis did not finish within {budget:g}s",
+            "job_id": job.id,
+            "status": job.status,
+        })
+    raise HTTPException(status_code=500, detail=job.error or f"Analysis {job.status}")
+
+# Asynchronous analysis jobs
+@app.post("/analysis/jobs")
+async def submit_analysis_job(request: AnalysisRequest):
+    """Queue an analysis and return its job id immediately"""
+    try:
+        job = job_queue.submit(request)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "priority": job.priority}
+
+@app.get("/analysis/jobs/stats")
+async def get_analysis_job_stats():
+    """Queue depth, wait times and outcome counts"""
+    return job_queue.stats()
+
+@app.get("/analysis/jobs/{job_id}")
+async def get_analysis_job(job_id: str, wait: Optional[float] = None):
+    """Poll a job, or block up to `wait` seconds for it to finish"""
+    job = await job_queue.wait(job_id, wait) if wait else job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.delete("/analysis/jobs/{job_id}")
+async def cancel_analysis_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/analyze-incident/stream")
+async def analyze_incident_stream(request: AnalysisRequest):
+    """
+    Streaming variant of /analyze-incident using Server-Sent Events.
+    Emits routing, service, cache, token, analysis and error events.
+    Runs in one of the job queue's slots, so streamed and queued analyses
+    share the same concurrency limit and the wait counts against the timeout.
+    """
+    try:
+        job_queue.check_capacity()
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    deadline = time.time() + (request.timeout or config_manager.get_config().analysis_timeout)
+
+    async def event_stream():
+        async with job_queue.slot():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                yield f"event: error\ndata: {json.dumps({'error': DEADLINE_EXPIRED})}\n\n"
+                return
+            async for event in agent.analyze_incident_stream(request.model_copy(update={"timeout": remaining})):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+                # Persist after the final event is flushed so the client is not kept waiting
+                if event["event"] == "analysis":
+                    try:
+                        persist_analysis(request, AnalysisResponse(**event["data"]))
+                    except Exception as e:
+                        logger.warning("Failed to persist streamed analysis: %s", e)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/analysis/cache")
+async def get_analysis_cache_stats():
+    """Get LLM analysis cache statistics"""
+    return agent.analysis_cache.stats()
+
+@app.delete("/analysis/cache")
+async def clear_analysis_cache():
+    """Clear the in-memory LLM analysis cache"""
+    agent.analysis_cache.clear()
+    return {"success": True, "message": "Analysis cache cleared"}
+
+@app.get("/connections/probes")
+async def get_probe_stats():
+    """Probe cache hit/shared/probe counts"""
+    return probes.stats()
+
+@app.get("/llm/governor")
+async def get_llm_governor_stats():
+    """LLM pacing: RPM/TPM utilization, queued callers and 429 retries"""
+    return agent.llm.stats()
+
+@app.get("/analysis/raw/stats")
+async def get_raw_blob_stats():
+    """Raw-data blob store: dedup hits, stored bytes and compression ratio"""
+    return agent.blobs.stats()
+
+@app.get("/analysis/raw/{ref}")
+async def get_raw_data(ref: str, request: Request):
+    """
+    Lazily fetch a service's raw data by the raw_ref in its analysis.
+    Gzip blobs are sent as stored when the client accepts gzip.
+    """
+    blob = await agent.blobs.get_encoded(ref)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Raw data not found")
+    encoding, data = blob
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{ref}"'}
+    if encoding == "gzip" and "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(content=data, media_type="application/json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(content=json.dumps(await agent.get_raw_data(ref)), media_type="application/json", headers=headers)
+
+@app.get("/analysis/persistence")
+async def get_persistence_stats():
+    """Write-behind queue depth, spill state and enqueue-to-write lag"""
+    return persistence.stats()
+
+@app.get("/analysis/retention")
+async def get_retention_report():
+    """Report of the last retention run, including reclaimed bytes"""
+    return retention.last_report or {"state": "idle"}
+
+@app.post("/analysis/retention/run")
+async def run_retention():
+    """Start a compaction/archive run in the background"""
+    if not retention.trigger():
+        return retention.last_report
+    return {"state": "started"}
+
+@app.get("/analysis/stats")
+async def get_analysis_stats(days: int = 7, granularity: str = "day", service: Optional[str] = None, top: int = 10):
+    """
+    Analyses, failure rate, MTTR and severity mix per service, a time series
+    and the top recurring root causes, all read from the hour/day rollups
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    try:
+        return await rollups.stats(days, granularity, service, top)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analysis/stats/backfill")
+async def backfill_analysis_stats():
+    """Rebuild the rollups from the full history in the background"""
+    if not rollups.start_backfill(db.incident_analysis):
+        return rollups.backfill_status
+    return {"state": "started"}
+
+@app.get("/analysis/stats/backfill")
+async def get_backfill_status():
+    return rollups.backfill_status
+
+@app.get("/analysis/phases")
+async def get_analysis_phase_stats(last: Optional[int] = None):
+    """p50/p95 duration per analysis phase over recent analyses"""
+    return agent.get_phase_stats(last)
+
 @app.get("/analysis/history")
-async def get_analysis_history(limit: int = 20):
+async def get_analysis_history(limit: int = 20, service: Optional[str] = None, severity: Optional[str] = None,
+                               status: Optional[str] = None):
     """
-    Get recent incident analysis history
+    Get recent incident analysis history, optionally filtered by service, severity and status
     """
     try:
         # Get from agent memory first (faster)
-        agent_history = agent.get_analysis_history(limit)
-        
-        if agent_history:
-            return [analysis.dict() for analysis in agent_history]
-        
-        # Fallback to database
-        history = await db.incident_analysis.find().sort("timestamp", -1).limit(limit).to_list(limit)
-        
-        # Convert ObjectId to string for JSON serialization
-        for item in history:
-            item["_id"] = str(item["_id"])
+        if not status:
+            agent_history = agent.get_analysis_history(limit, service, severity)
+            if agent_history:
+                return [analysis.dict() for analysis in agent_history]
         
-        return history
+        # Fallback to database (summaries only); unlike /analysis/history/page the limit is not capped
+        page = await fetch_history_page(db.incident_analysis, limit, max_limit=None,
+                                        service=service, severity=severity, status=status)
+        return page["items"]
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/analysis/history/page")
+async def get_analysis_history_page(limit: int = 20, cursor: Optional[str] = None, service: Optional[str] = None,
+                                    severity: Optional[str] = None, status: Optional[str] = None):
+    """
+    Page through stored analyses, newest first. Pass the returned `next_cursor`
+    to get the following page; it is null on the last page. `limit` is capped
+    at 200. Items are summaries without raw service data (use /analysis/{id}
+    for the full record).
+    """
+    try:
+        return await fetch_history_page(db.incident_analysis, limit, cursor=cursor,
+                                        service=service, severity=severity, status=status)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analysis/export")
+async def export_analyses(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          service: Optional[str] = None, severity: Optional[str] = None,
+                          status: Optional[str] = None, fields: Optional[str] = None,
+                          summary: bool = False, batch_size: int = 500, compress: Optional[str] = None):
+    """
+    Stream stored analyses as NDJSON, oldest first, straight from a cursor.
+    `fields` is a comma separated projection (e.g. timestamp,query,analysis.severity);
+    `summary=true` drops raw data instead. `compress=gzip` returns a .ndjson.gz download.
+    """
+    if compress not in (None, "gzip"):
+        raise HTTPException(status_code=400, detail="compress must be 'gzip'")
+    query = history_filter(service=service, severity=severity, status=status)
+    time_range = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    if time_range:
+        query = {"$and": [query, {"timestamp": time_range}]} if query else {"timestamp": time_range}
+    projection = projection_for(fields) or (SUMMARY_PROJECTION if summary else None)
+
+    filename = f"analyses_{datetime.utcnow():%Y%m%dT%H%M%S}.ndjson"
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        export_ndjson(db.incident_analysis, query, projection, min(max(batch_size, 1), 5000), compress == "gzip"),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/analysis/{analysis_id}")
 async def get_analysis_by_id(analysis_id: str):
     """
@@ -563,16 +922,20 @@ async def get_analysis_by_id(analysis_id: str):
         if analysis:
             return analysis.dict()
         
-        # Fallback to database
-        from bson import ObjectId
-        analysis = await db.incident_analysis.find_one({"_id": ObjectId(analysis_id)})
+        # Fallback to database: history cards link by the analysis id; the
+        # Mongo _id is still accepted
+        analysis = await db.incident_analysis.find_one({"analysis.id": analysis_id})
+        if analysis is None and ObjectId.is_valid(analysis_id):
+            analysis = await db.incident_analysis.find_one({"_id": ObjectId(analysis_id)})
         if analysis:
             analysis["_id"] = str(analysis["_id"])
             return analysis
         else:
             raise HTTPException(status_code=404, detail="Analysis not found")
-    except:
-        raise HTTPException(status_code=400, detail="Invalid analysis ID")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 # Service-specific analysis endpoints
 @app.post("/analyze/k8s")
@@ -603,24 +966,14 @@ async def analyze_github_only(query: str):
 # Health and status endpoints
 @app.get("/health")
 async def health_check():
-    """Comprehensive health check"""
+    """Comprehensive health check from the latest service snapshots"""
     try:
-        # Test basic connectivity
-        config = config_manager.get_config()
-        services_status = {}
-        
-        # Test Kubernetes
-        k8s_status = await test_k8s_connection()
-        services_status['k8s'] = k8s_status['success']
-        
-        # Test AWS
-        aws_status = await test_aws_connection()
-        services_status['aws'] = aws_status['success']
-        
-        # Test GitHub if configured
-        if config.github_owner and config.github_repo:
-            github_status = await test_github_connection()
-            services_status['github'] = github_status['success']
+        details = snapshot_details()
+        # Reachable services count as connected; unconfigured GitHub is skipped
+        services_status = {
+            service: d["status"] in ("healthy", "degraded")
+            for service, d in details.items() if d["status"] not in ("disabled", "pending")
+        }
         
         overall_health = all(services_status.values())
         
@@ -628,6 +981,7 @@ async def health_check():
             "status": "healthy" if overall_health else "degraded",
             "timestamp": datetime.utcnow().isoformat(),
             "services": services_status,
+            "snapshot_age_seconds": {s: d.get("snapshot_age_seconds") for s, d in details.items()},
             "config_loaded": True,
             "agent_ready": True
         }
@@ -638,12 +992,41 @@ async def health_check():
             "timestamp": datetime.utcnow().isoformat()
         }
 
+@app.get("/health/series/{service}")
+async def get_health_series(service: str, hours: float = 24, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, points: int = 200,
+                            fields: Optional[str] = None, source: Optional[str] = None):
+    """
+    Downsampled health trend for one service: the last `hours` (or start/end)
+    split into at most `points` buckets with avg/min/max per field.
+    `fields` is comma separated (e.g. score,running_pods); `source` is poll or analysis.
+    """
+    if service not in HEALTH_COLLECTIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown service: {service}")
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=hours)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    try:
+        return await health_series.query(service, start, end, min(max(points, 1), 1000),
+                                         fields.split(",") if fields else None, source)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/status")
 async def detailed_status():
     """Detailed system status"""
     try:
         config = config_manager.get_config()
-        connections = await test_all_connections()
+        connections = {
+            service: {
+                "success": d["status"] in ("healthy", "degraded"),
+                "status": d["status"],
+                "error": d.get("error"),
+                "snapshot_age_seconds": d.get("snapshot_age_seconds"),
+            }
+            for service, d in snapshot_details().items()
+        }
         metrics = await get_system_metrics()
         
         return {
@@ -662,8 +1045,7 @@ async def detailed_status():
 async def reset_configuration():
     """Reset configuration to defaults"""
     try:
-        config_manager.config = config_manager._load_config()  # Reload from file or create default
-        config_manager.save_config()
+        config_manager.reload()  # Reload from file or create default
         return {
             "success": True,
             "message": "Configuration reset to defaults",
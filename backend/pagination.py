@@ -0,0 +1,87 @@
+# backend/pagination.py
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+# Keyset pagination over incident_analysis ordered by (timestamp, _id)
+# descending. A cursor is the sort key of the last item returned, so every
+# page is an index seek regardless of how deep it is.
+
+HISTORY_SORT = [("timestamp", -1), ("_id", -1)]
+
+# Compound indexes: each filter's equality field first, then the sort key
+HISTORY_INDEXES = [
+    HISTORY_SORT,
+    [("analysis.severity", 1)] + HISTORY_SORT,
+    [("analysis.overall_status", 1)] + HISTORY_SORT,
+    [("services_analyzed", 1)] + HISTORY_SORT,
+]
+
+SERVICES = ("k8s", "aws", "github")
+
+MAX_PAGE_SIZE = 200
+
+# Summary projection: raw service payloads, traces and budgets are only
+# fetched by /analysis/{id}
+SUMMARY_PROJECTION = {
+    **{f"analysis.services.{service}.raw_data": 0 for service in SERVICES},
+    "analysis.trace": 0,
+    "analysis.context_budget": 0,
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    key = f"{item['timestamp'].isoformat()}|{item['_id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        key = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, object_id = key.split("|", 1)
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def history_filter(service: Optional[str] = None, severity: Optional[str] = None,
+                   status: Optional[str] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = []
+    if service:
+        clauses.append({"services_analyzed": service})
+    if severity:
+        clauses.append({"analysis.severity": severity.upper()})
+    if status:
+        clauses.append({"analysis.overall_status": status.upper()})
+    if cursor:
+        timestamp, object_id = decode_cursor(cursor)
+        clauses.append({"$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": object_id}},
+        ]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def fetch_history_page(collection, limit: int, max_limit: Optional[int] = MAX_PAGE_SIZE,
+                             **filters) -> Dict[str, Any]:
+    """
+    One page of summaries plus the cursor for the next (None on the last
+    page). `limit` is clamped to `max_limit` unless that is None.
+    """
+    limit = max(1, limit if max_limit is None else min(limit, max_limit))
+    items = await collection.find(history_filter(**filters), SUMMARY_PROJECTION) \
+        .sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor(items[-1]) if has_more else None
+    for item in items:
+        item["_id"] = str(item["_id"])
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
@@ -0,0 +1,138 @@
+# backend/poller.py
+import asyncio
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from agent.log import get_logger
+
+logger = get_logger("poller")
+
+
+class Snapshot:
+    __slots__ = ("service", "version", "data", "taken_at", "taken_at_iso", "duration", "interval")
+
+    def __init__(self, service: str, version: int, data: Dict[str, Any], duration: float, interval: float):
+        self.service = service
+        self.version = version
+        self.data = data
+        self.taken_at = time.monotonic()
+        self.taken_at_iso = datetime.utcnow().isoformat()
+        self.duration = duration
+        self.interval = interval
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.taken_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.data,
+            "snapshot_version": self.version,
+            "snapshot_age_seconds": round(self.age, 1),
+            "checked_at": self.taken_at_iso,
+            "poll_duration": round(self.duration, 3),
+            "poll_interval": self.interval,
+        }
+
+
+class SnapshotStore:
+    """
+    Latest probe result per service; each write bumps a global version.
+    Listeners are called with (snapshot, previous) on every write.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._snapshots: Dict[str, Snapshot] = {}
+        self.listeners: List[Callable[[Snapshot, Optional[Snapshot]], None]] = []
+
+    def put(self, service: str, data: Dict[str, Any], duration: float, interval: float) -> Snapshot:
+        self.version += 1
+        previous = self._snapshots.get(service)
+        snapshot = self._snapshots[service] = Snapshot(service, self.version, data, duration, interval)
+        for listener in self.listeners:
+            try:
+                listener(snapshot, previous)
+            except Exception as e:
+                logger.warning("Snapshot listener failed: %s", e)
+        return snapshot
+
+    def get(self, service: str) -> Optional[Snapshot]:
+        return self._snapshots.get(service)
+
+    def all(self) -> Dict[str, Snapshot]:
+        return dict(self._snapshots)
+
+
+class HealthPoller:
+    """
+    One polling task per service. Healthy services back off toward
+    `max_interval`; a degraded or unhealthy result drops to `min_interval`
+    until the service recovers.
+    """
+
+    def __init__(self, probe: Callable[[str], Awaitable[Dict[str, Any]]], store: SnapshotStore,
+                 intervals: Optional[Dict[str, float]] = None, min_interval: float = 10.0,
+                 max_interval: float = 300.0, timeout: float = 15.0):
+        self.probe = probe
+        self.store = store
+        self.intervals = intervals or {"k8s": 30.0, "aws": 60.0, "github": 60.0}
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self._current: Dict[str, float] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._tasks = []
+
+    def start(self):
+        for service in self.intervals:
+            self._wakeups[service] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._run(service)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def refresh(self, service: Optional[str] = None):
+        """Poll now instead of waiting for the next interval"""
+        for name, wakeup in self._wakeups.items():
+            if service is None or name == service:
+                wakeup.set()
+
+    def _next_interval(self, service: str, status: str) -> float:
+        base = self.intervals[service]
+        current = self._current.get(service, base)
+        if status in ("degraded", "unhealthy"):
+            return self.min_interval
+        if status == "disabled":
+            return self.max_interval
+        # Healthy: relax gradually from the base interval
+        return min(max(current * 1.5, base), self.max_interval)
+
+    async def _run(self, service: str):
+        while True:
+            start = time.monotonic()
+            try:
+                data = await asyncio.wait_for(self.probe(service), self.timeout)
+            except asyncio.TimeoutError:
+                data = {"status": "unhealthy", "error": f"Probe timed out after {self.timeout:.0f}s"}
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                data = {"status": "unhealthy", "error": str(e)}
+
+            interval = self._current[service] = self._next_interval(service, data.get("status", "unhealthy"))
+            snapshot = self.store.put(service, data, time.monotonic() - start, interval)
+            logger.debug("Polled %s: %s (v%d), next in %.0fs", service, data.get("status"), snapshot.version, interval)
+
+            # Jitter keeps pollers of different services from aligning
+            wakeup = self._wakeups[service]
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), interval * random.uniform(0.9, 1.1))
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,75 @@
+# backend/probes.py
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from agent.log import get_logger
+
+logger = get_logger("probes")
+
+
+class ProbeCache:
+    """
+    Connectivity probe results cached for `ttl` seconds per (service, args)
+    key. Concurrent callers for the same key share one in-flight probe, so a
+    composite request (or several dashboards) costs at most one round.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[..., Awaitable[Dict[str, Any]]]],
+                 ttl: float = 15.0, timeout: float = 10.0):
+        self.probes = probes
+        self.ttl = ttl
+        self.timeout = timeout
+        self._results: Dict[Tuple[str, Hashable], Tuple[float, Dict[str, Any]]] = {}
+        self._in_flight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._counts = {"hits": 0, "shared": 0, "probes": 0}
+
+    async def get(self, service: str, *args: Hashable, fresh: bool = False) -> Dict[str, Any]:
+        key = (service, args)
+        cached = self._results.get(key)
+        if cached and not fresh and time.monotonic() - cached[0] < self.ttl:
+            self._counts["hits"] += 1
+            return {**cached[1], "cached": True, "age_seconds": round(time.monotonic() - cached[0], 1)}
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._counts["shared"] += 1
+            return await asyncio.shield(future)
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._run(service, *args)
+            self._results[key] = (time.monotonic(), result)
+            future.set_result(result)
+            return result
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._in_flight[key]
+
+    async def get_many(self, requests: Dict[str, Tuple[Hashable, ...]], fresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Probe several services concurrently: {service: args} -> {service: result}"""
+        results = await asyncio.gather(*(self.get(s, *args, fresh=fresh) for s, args in requests.items()))
+        return dict(zip(requests, results))
+
+    async def _run(self, service: str, *args: Hashable) -> Dict[str, Any]:
+        self._counts["probes"] += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self.probes[service](*args), self.timeout)
+        except asyncio.TimeoutError:
+            result = {"success": False, "error": f"Probe timed out after {self.timeout:.0f}s"}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if not result.get("success"):
+            logger.warning("Probe %s failed: %s", service, result.get("error"))
+        return result
+
+    def invalidate(self, service: Optional[str] = None):
+        for key in [k for k in self._results if service is None or k[0] == service]:
+            del self._results[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counts, "ttl_seconds": self.ttl, "cached": len(self._results),
+                "in_flight": len(self._in_flight)}
@@ -0,0 +1,254 @@
+# backend/retention.py
+import asyncio
+import gzip
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import bson
+from bson import json_util
+
+from agent.log import get_logger
+from backend.pagination import SERVICES, SUMMARY_PROJECTION
+
+logger = get_logger("retention")
+
+BATCH_SIZE = 500
+
+# Summaries keep their blob refs: the archive step resolves them into the
+# archived lines, and only then do the blobs become collectable
+COMPACTED_FIELDS = SUMMARY_PROJECTION
+
+# Blobs written this recently are kept even if unreferenced: their analysis
+# may still be in the write-behind queue
+BLOB_GRACE = timedelta(hours=1)
+
+
+class RetentionJob:
+    """
+    Ages incident_analysis in three tiers: full documents for `full_days`,
+    then compacted to summaries (inline raw data, traces and budgets removed;
+    blob refs kept), then after `summary_days` exported to gzip NDJSON
+    archives and deleted. Archived lines carry their raw data resolved from
+    the blob store. Blobs no analysis refers to any more are deleted at the
+    end of each run.
+    Rollups and health series are separate collections and are unaffected.
+    Works in small batches with file I/O on a thread, so the API stays responsive.
+    """
+
+    def __init__(self, settings: Callable[[], Any], blobs=None):
+        self.settings = settings  # returns the current AgentConfig
+        self.blobs = blobs  # the agent's BlobStore
+        self.collection = None
+        self.blob_collection = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._run_task: Optional[asyncio.Task] = None
+
+    def attach_store(self, collection, blob_collection=None):
+        self.collection = collection
+        self.blob_collection = blob_collection
+
+    def start(self):
+        self._task = asyncio.create_task(self._schedule())
+
+    async def stop(self):
+        for task in (self._task, self._run_task):
+            if task:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._task, self._run_task) if t), return_exceptions=True)
+        self._task = self._run_task = None
+
+    def trigger(self) -> bool:
+        """Start a run now; False if one is already in progress"""
+        if self._run_task and not self._run_task.done():
+            return False
+        self._run_task = asyncio.create_task(self.run())
+        return True
+
+    async def _schedule(self):
+        # Let startup traffic settle before the first run
+        await asyncio.sleep(60)
+        while True:
+            self.trigger()
+            await asyncio.sleep(self.settings().retention_interval_hours * 3600)
+
+    async def run(self) -> Dict[str, Any]:
+        config = self.settings()
+        now = datetime.utcnow()
+        report: Dict[str, Any] = {"state": "running", "started_at": now.isoformat(),
+                                  "full_days": config.retention_full_days,
+                                  "summary_days": config.retention_summary_days}
+        self.last_report = report
+        try:
+            report["storage_size_before"] = await self._storage_size()
+            report.update(await self.compact(now - timedelta(days=config.retention_full_days)))
+            report.update(await self.archive(now - timedelta(days=config.retention_summary_days),
+                                             config.retention_archive_dir))
+            report.update(await self.collect_blobs(now - BLOB_GRACE))
+            report["storage_size_after"] = await self._storage_size()
+            report["reclaimed_bytes"] = report["compacted_bytes"] + report["archived_bytes"] + report["blob_bytes"]
+            report["state"] = "completed"
+            logger.info("Retention run reclaimed %d bytes (%d compacted, %d archived, %d blobs)",
+                        report["reclaimed_bytes"], report["compacted"], report["archived"], report["blobs_deleted"])
+        except asyncio.CancelledError:
+            report["state"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.exception("Retention run failed: %s", e)
+            report.update(state="failed", error=str(e))
+        finally:
+            report["finished_at"] = datetime.utcnow().isoformat()
+        return report
+
+    async def compact(self, cutoff: datetime) -> Dict[str, Any]:
+        """Strip detail from analyses older than `cutoff`; bytes are logical BSON sizes"""
+        unset = {field: "" for field in COMPACTED_FIELDS}
+        query = {"timestamp": {"$lt": cutoff}, "compacted": {"$ne": True}}
+        compacted = compacted_bytes = 0
+        while True:
+            ids = [d["_id"] for d in await self.collection.find(query, {"_id": 1}).limit(BATCH_SIZE).to_list(BATCH_SIZE)]
+            if not ids:
+                break
+            before = await self._bson_size(ids)
+            await self.collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$unset": unset, "$set": {"compacted": True, "compacted_at": datetime.utcnow()}}
+            )
+            compacted += len(ids)
+            compacted_bytes += before - await self._bson_size(ids)
+            await asyncio.sleep(0)
+        return {"compacted": compacted, "compacted_bytes": compacted_bytes}
+
+    async def archive(self, cutoff: datetime, archive_dir: str) -> Dict[str, Any]:
+        """Export analyses older than `cutoff` to one gzip NDJSON file, then delete them"""
+        query = {"timestamp": {"$lt": cutoff}}
+        result = {"archived": 0, "archived_bytes": 0, "archive_file": None}
+        if not await self.collection.count_documents(query, limit=1):
+            return result
+
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"incident_analysis_before_{cutoff:%Y%m%dT%H%M%S}.ndjson.gz")
+        partial = path + ".partial"
+        archive = await asyncio.to_thread(self._open, partial)
+        ids: List[Any] = []
+        try:
+            cursor = self.collection.find(query).sort([("timestamp", 1), ("_id", 1)]).batch_size(BATCH_SIZE)
+            batch = []
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) >= BATCH_SIZE:
+                    result["archived_bytes"] += await self._archive_batch(archive, batch)
+                    ids.extend(d["_id"] for d in batch)
+                    batch = []
+            if batch:
+                result["archived_bytes"] += await self._archive_batch(archive, batch)
+                ids.extend(d["_id"] for d in batch)
+            await asyncio.to_thread(self._close, archive)
+        except BaseException:
+            await asyncio.to_thread(self._close, archive, False)
+            await asyncio.to_thread(os.remove, partial)
+            raise
+        # Only delete once the archive is complete and on disk
+        await asyncio.to_thread(os.replace, partial, path)
+
+        for i in range(0, len(ids), BATCH_SIZE):
+            deleted = await self.collection.delete_many({"_id": {"$in": ids[i:i + BATCH_SIZE]}})
+            result["archived"] += deleted.deleted_count
+            await asyncio.sleep(0)
+        result["archive_file"] = path
+        result["archive_file_bytes"] = os.path.getsize(path)
+        return result
+
+    async def _archive_batch(self, archive: gzip.GzipFile, batch: List[Dict[str, Any]]) -> int:
+        """Write a batch to the archive; returns its stored BSON size"""
+        size = await asyncio.to_thread(lambda: sum(len(bson.encode(document)) for document in batch))
+        await self._resolve_raw_data(batch)
+        await asyncio.to_thread(self._write_batch, archive, batch)
+        return size
+
+    async def _resolve_raw_data(self, batch: List[Dict[str, Any]]):
+        """Inline blob contents as raw_data, so archives stay complete once the blobs are collected"""
+        if self.blobs is None:
+            return
+        for document in batch:
+            for health in ((document.get("analysis") or {}).get("services") or {}).values():
+                if health and health.get("raw_ref") and health.get("raw_data") is None:
+                    raw_data = await self.blobs.get(health["raw_ref"])
+                    if raw_data is not None:
+                        health["raw_data"] = raw_data
+
+    async def collect_blobs(self, cutoff: datetime) -> Dict[str, Any]:
+        """
+        Delete raw_blobs entries that no analysis refers to and that were
+        last referenced before `cutoff`; bytes are stored (compressed) sizes
+        """
+        result = {"blobs_deleted": 0, "blob_bytes": 0}
+        if self.blob_collection is None:
+            return result
+        referenced = await self._referenced_blobs()
+        # Blobs the agent holds in memory may be reused without touching Mongo
+        if self.blobs is not None:
+            referenced |= self.blobs.refs()
+
+        cursor = self.blob_collection.find({"last_referenced": {"$lt": cutoff}}, {"_id": 1, "stored_size": 1})
+        batch: List[Dict[str, Any]] = []
+        async for blob in cursor.batch_size(BATCH_SIZE):
+            if blob["_id"] not in referenced:
+                batch.append(blob)
+            if len(batch) >= BATCH_SIZE:
+                await self._delete_blobs(batch, result)
+                batch = []
+        if batch:
+            await self._delete_blobs(batch, result)
+        return result
+
+    async def _referenced_blobs(self) -> Set[str]:
+        refs = [f"$analysis.services.{service}.raw_ref" for service in SERVICES]
+        pipeline = [
+            {"$project": {"refs": refs}},
+            {"$unwind": "$refs"},
+            {"$match": {"refs": {"$type": "string"}}},
+            {"$group": {"_id": "$refs"}},
+        ]
+        return {d["_id"] async for d in self.collection.aggregate(pipeline, allowDiskUse=True)}
+
+    async def _delete_blobs(self, batch: List[Dict[str, Any]], result: Dict[str, Any]):
+        deleted = await self.blob_collection.delete_many({"_id": {"$in": [b["_id"] for b in batch]}})
+        result["blobs_deleted"] += deleted.deleted_count
+        result["blob_bytes"] += sum(b.get("stored_size", 0) for b in batch)
+        await asyncio.sleep(0)
+
+    @staticmethod
+    def _open(path: str) -> gzip.GzipFile:
+        # Own the underlying file so it can be fsynced after the gzip trailer
+        return gzip.GzipFile(fileobj=open(path, "wb"), mode="wb")
+
+    @staticmethod
+    def _write_batch(archive: gzip.GzipFile, batch: List[Dict[str, Any]]):
+        for document in batch:
+            archive.write((json_util.dumps(document) + "\n").encode("utf-8"))
+
+    @staticmethod
+    def _close(archive: gzip.GzipFile, sync: bool = True):
+        raw = archive.fileobj
+        archive.close()
+        if sync:
+            raw.flush()
+            os.fsync(raw.fileno())
+        raw.close()
+
+    async def _bson_size(self, ids: List[Any]) -> int:
+        totals = await self.collection.aggregate([
+            {"$match": {"_id": {"$in": ids}}},
+            {"$group": {"_id": None, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+        ]).to_list(1)
+        return totals[0]["bytes"] if totals else 0
+
+    async def _storage_size(self) -> Optional[int]:
+        try:
+            stats = await self.collection.database.command("collStats", self.collection.name)
+            return stats.get("storageSize")
+        except Exception as e:
+            logger.warning("collStats failed: %s", e)
+            return None
@@ -0,0 +1,295 @@
+# backend/rollups.py
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from agent.log import get_logger
+
+logger = get_logger("rollups")
+
+# Hour and day rollups of persisted analyses, keyed by service, severity and
+# status. They are updated incrementally from each persisted batch, so the
+# stats API reads a few hundred small documents instead of the history.
+
+GRANULARITIES = ("hour", "day")
+ALL_SERVICES = "_all"  # one row per analysis, using its overall status
+FAILING = ("DEGRADED", "CRITICAL")
+
+# Any token containing a digit: pod names, ids, counts, timestamps
+_VOLATILE = re.compile(r"\S*\d\S*")
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def root_cause_fingerprint(text: str) -> Tuple[str, str]:
+    """First sentence with ids and numbers masked, so recurrences group together"""
+    sentence = re.split(r"(?<=[.!?])\s", (text or "").strip(), maxsplit=1)[0][:200]
+    normalized = " ".join(_VOLATILE.sub("#", sentence.lower()).split())
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], sentence
+
+
+class _Accumulator:
+    """Rollup increments for a sequence of analysis documents in timestamp order"""
+
+    def __init__(self, open_incidents: Dict[str, datetime]):
+        self.open_incidents = open_incidents
+        self.rows: Dict[tuple, Dict[str, float]] = {}
+        self.causes: Dict[tuple, Dict[str, Any]] = {}
+        self.changed_services = set()
+
+    def _row(self, granularity: str, bucket: datetime, service: str, severity: str, status: str) -> Dict[str, float]:
+        key = (granularity, bucket, service, severity, status)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = {"count": 0, "failures": 0, "execution_time_sum": 0.0,
+                                    "execution_time_max": 0.0, "recoveries": 0, "recovery_seconds": 0.0}
+        return row
+
+    def add(self, document: Dict[str, Any]):
+        analysis = document.get("analysis") or {}
+        timestamp = document["timestamp"]
+        severity = analysis.get("severity") or "UNKNOWN"
+        execution_time = document.get("execution_time") or 0.0
+        services = {ALL_SERVICES: analysis.get("overall_status") or "UNKNOWN"}
+        for service, health in (analysis.get("services") or {}).items():
+            services[service] = (health or {}).get("status") or "UNKNOWN"
+
+        for service, status in services.items():
+            recovery = self._track_incident(service, status, timestamp)
+            for granularity in GRANULARITIES:
+                row = self._row(granularity, bucket_start(timestamp, granularity), service, severity, status)
+                row["count"] += 1
+                row["failures"] += status in FAILING
+                row["execution_time_sum"] += execution_time
+                row["execution_time_max"] = max(row["execution_time_max"], execution_time)
+                if recovery is not None:
+                    row["recoveries"] += 1
+                    row["recovery_seconds"] += recovery
+
+        if services[ALL_SERVICES] in FAILING and analysis.get("root_cause_analysis"):
+            fingerprint, text = root_cause_fingerprint(analysis["root_cause_analysis"])
+            key = (bucket_start(timestamp, "day"), fingerprint)
+            cause = self.causes.setdefault(key, {"count": 0, "text": text, "services": set()})
+            cause["count"] += 1
+            cause["services"].update(s for s in services if s != ALL_SERVICES)
+
+    def _track_incident(self, service: str, status: str, timestamp: datetime) -> Optional[float]:
+        """An incident opens on the first failing status and closes on the next HEALTHY one"""
+        if service == ALL_SERVICES:
+            return None
+        opened = self.open_incidents.get(service)
+        if status in FAILING and opened is None:
+            self.open_incidents[service] = timestamp
+            self.changed_services.add(service)
+        elif status == "HEALTHY" and opened is not None:
+            del self.open_incidents[service]
+            self.changed_services.add(service)
+            return max((timestamp - opened).total_seconds(), 0.0)
+        return None
+
+    def row_updates(self) -> List[UpdateOne]:
+        updates = []
+        for (granularity, bucket, service, severity, status), row in self.rows.items():
+            execution_time_max = row.pop("execution_time_max")
+            updates.append(UpdateOne(
+                {"granularity": granularity, "bucket": bucket, "service": service,
+                 "severity": severity, "status": status},
+                {"$inc": row, "$max": {"execution_time_max": execution_time_max}},
+                upsert=True
+            ))
+        return updates
+
+    def cause_updates(self) -> List[UpdateOne]:
+        return [
+            UpdateOne(
+                {"day": day, "fingerprint": fingerprint},
+                {"$inc": {"count": cause["count"]}, "$set": {"text": cause["text"]},
+                 "$addToSet": {"services": {"$each": sorted(cause["services"])}}},
+                upsert=True
+            )
+            for (day, fingerprint), cause in self.causes.items()
+        ]
+
+
+class AnalysisRollups:
+    """Incremental rollups plus a full rebuild (backfill) from the history collection"""
+
+    def __init__(self):
+        self.rollups = None
+        self.causes = None
+        self.incidents = None
+        self.open_incidents: Dict[str, datetime] = {}
+        self.backfill_status: Dict[str, Any] = {"state": "idle"}
+        self._deferred: Optional[List[Dict[str, Any]]] = None
+        self._backfill_task: Optional[asyncio.Task] = None
+
+    async def attach_store(self, database):
+        self.rollups = database.analysis_rollups
+        self.causes = database.root_cause_rollups
+        self.incidents = database.incident_state
+        await self.rollups.create_index(
+            [("granularity", 1), ("service", 1), ("bucket", -1), ("severity", 1), ("status", 1)], unique=True
+        )
+        await self.causes.create_index([("day", -1), ("fingerprint", 1)], unique=True)
+        async for state in self.incidents.find():
+            self.open_incidents[state["_id"]] = state["open_since"]
+
+    async def apply(self, documents: List[Dict[str, Any]]):
+        """Fold a persisted batch into the rollups (deferred while a backfill runs)"""
+        if self.rollups is None:
+            return
+        if self._deferred is not None:
+            self._deferred.extend(documents)
+            return
+        accumulator = _Accumulator(self.open_incidents)
+        for document in sorted(documents, key=lambda d: d["timestamp"]):
+            accumulator.add(document)
+        await self._write(accumulator)
+
+    async def _write(self, accumulator: _Accumulator):
+        rows, causes = accumulator.row_updates(), accumulator.cause_updates()
+        if rows:
+            await self.rollups.bulk_write(rows, ordered=False)
+        if causes:
+            await self.causes.bulk_write(causes, ordered=False)
+        for service in accumulator.changed_services:
+            opened = self.open_incidents.get(service)
+            if opened is None:
+                await self.incidents.delete_one({"_id": service})
+            else:
+                await self.incidents.replace_one({"_id": service}, {"_id": service, "open_since": opened}, upsert=True)
+
+    def start_backfill(self, history) -> bool:
+        """Run backfill() in the background; False if one is already running"""
+        if self._backfill_task and not self._backfill_task.done():
+            return False
+        self._backfill_task = asyncio.create_task(self.backfill(history))
+        return True
+
+    async def backfill(self, history):
+        """
+        Rebuild every rollup from `history`. An aggregation projects each
+        analysis down to the fields the rollups need (server-side, in
+        timestamp order); live batches arriving meanwhile are held back and
+        folded in afterwards unless the scan already counted them.
+        """
+        if self._deferred is not None:
+            return
+        self._deferred = []
+        started = datetime.utcnow()
+        self.backfill_status = {"state": "running", "started_at": started.isoformat(), "scanned": 0}
+        try:
+            accumulator = _Accumulator({})
+            seen = set()
+            pipeline = [
+                {"$sort": {"timestamp": 1, "_id": 1}},
+                {"$project": {
+                    "timestamp": 1,
+                    "execution_time": 1,
+                    "analysis.severity": 1,
+                    "analysis.overall_status": 1,
+                    "analysis.root_cause_analysis": 1,
+                    "analysis.services": {"$arrayToObject": {"$map": {
+                        "input": {"$objectToArray": {"$ifNull": ["$analysis.services", {}]}},
+                        "in": {"k": "$$this.k", "v": {"status": "$$this.v.status"}},
+                    }}},
+                }},
+            ]
+            async for document in history.aggregate(pipeline, allowDiskUse=True):
+                accumulator.add(document)
+                seen.add(document["_id"])
+                self.backfill_status["scanned"] += 1
+
+            await self.rollups.delete_many({})
+            await self.causes.delete_many({})
+            await self.incidents.delete_many({})
+            self.open_incidents.clear()
+            self.open_incidents.update(accumulator.open_incidents)
+            accumulator.changed_services = set(accumulator.open_incidents)
+            await self._write(accumulator)
+
+            deferred = [d for d in self._deferred if d["_id"] not in seen]
+            self._deferred = None
+            if deferred:
+                await self.apply(deferred)
+            self.backfill_status.update(state="completed", finished_at=datetime.utcnow().isoformat(),
+                                        rows=len(accumulator.rows), deferred_applied=len(deferred))
+            logger.info("Rollup backfill completed: %d analyses, %d rows",
+                        self.backfill_status["scanned"], len(accumulator.rows))
+        except Exception as e:
+            logger.exception("Rollup backfill failed: %s", e)
+            self.backfill_status.update(state="failed", error=str(e))
+            deferred, self._deferred = self._deferred or [], None
+            if deferred:
+                await self.apply(deferred)
+
+    async def stats(self, days: int = 7, granularity: str = "day", service: Optional[str] = None,
+                    top_causes: int = 10) -> Dict[str, Any]:
+        until = datetime.utcnow()
+        since = bucket_start(until - timedelta(days=days), granularity)
+        query: Dict[str, Any] = {"granularity": granularity, "bucket": {"$gte": since}}
+        if service:
+            query["service"] = {"$in": [service, ALL_SERVICES]}
+        rows = await self.rollups.find(query, {"_id": 0}).to_list(None)
+
+        services: Dict[str, Dict[str, float]] = {}
+        severity: Dict[str, int] = {}
+        series: Dict[datetime, Dict[str, int]] = {}
+        series_service = service or ALL_SERVICES
+        for row in rows:
+            totals = services.setdefault(row["service"], {"count": 0, "failures": 0, "execution_time_sum": 0.0,
+                                                          "recoveries": 0, "recovery_seconds": 0.0})
+            for field in totals:
+                totals[field] += row.get(field, 0)
+            if row["service"] == ALL_SERVICES:
+                severity[row["severity"]] = severity.get(row["severity"], 0) + row["count"]
+            if row["service"] == series_service:
+                point = series.setdefault(row["bucket"], {"analyses": 0, "failures": 0})
+                point["analyses"] += row["count"]
+                point["failures"] += row["failures"]
+
+        summary = {}
+        for name, totals in services.items():
+            analyses = totals["count"]
+            summary[name] = {
+                "analyses": analyses,
+                "failures": totals["failures"],
+                "failure_rate": round(totals["failures"] / analyses, 4) if analyses else 0.0,
+                "avg_execution_time": round(totals["execution_time_sum"] / analyses, 3) if analyses else None,
+                "recoveries": totals["recoveries"],
+                "mttr_seconds": round(totals["recovery_seconds"] / totals["recoveries"], 1)
+                if totals["recoveries"] else None,
+            }
+
+        cause_query: Dict[str, Any] = {"day": {"$gte": bucket_start(since, "day")}}
+        if service:
+            cause_query["services"] = service
+        causes = await self.causes.aggregate([
+            {"$match": cause_query},
+            {"$group": {"_id": "$fingerprint", "count": {"$sum": "$count"}, "text": {"$last": "$text"},
+                        "last_seen": {"$max": "$day"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": top_causes},
+        ]).to_list(top_causes)
+
+        return {
+            "window": {"since": since.isoformat(), "until": until.isoformat(), "granularity": granularity},
+            "overall": summary.pop(ALL_SERVICES, None),
+            "services": summary,
+            "severity": severity,
+            "series": [{"bucket": bucket.isoformat(), **point} for bucket, point in sorted(series.items())],
+            "top_root_causes": [
+                {"fingerprint": c["_id"], "text": c["text"], "count": c["count"], "last_seen": c["last_seen"].isoformat()}
+                for c in causes
+            ],
+            "open_incidents": {s: opened.isoformat() for s, opened in self.open_incidents.items()
+                               if not service or s == service},
+        }
@@ -0,0 +1,179 @@
+# backend/timeseries.py
+import asyncio
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from agent.log import get_logger
+
+logger = get_logger("timeseries")
+
+# Per-service health samples in MongoDB time-series collections (the
+# k8s_analysis, aws_analysis and github_analysis collections). Samples come
+# from the background poller and from persisted analyses; each is a score
+# plus a flat map of numeric values, so trend queries never touch analyses.
+
+COLLECTIONS = {"k8s": "k8s_analysis", "aws": "aws_analysis", "github": "github_analysis"}
+
+# Values charted when a query does not name fields
+DEFAULT_FIELDS = {
+    "k8s": ["score", "running_pods", "total_pods", "failed_pods", "pending_pods", "total_restarts"],
+    "aws": ["score", "total_log_groups", "total_storage_bytes"],
+    "github": ["score", "success_rate", "total_recent_runs"],
+}
+
+# Poller snapshots use their own names for the same quantities
+POLL_FIELDS = {
+    "pods_total": "total_pods", "pods_running": "running_pods", "restarts": "total_restarts",
+    "log_groups": "total_log_groups", "total_storage": "total_storage_bytes",
+}
+
+MIN_BUCKET_SECONDS = 60
+
+
+def _numeric(values: Dict[str, Any]) -> Dict[str, float]:
+    return {k: v for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+class HealthSeries:
+    """Buffers samples in memory and flushes them per collection with insert_many"""
+
+    def __init__(self, flush_interval: float = 5.0, max_buffered: int = 10000):
+        self.db = None
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {service: [] for service in COLLECTIONS}
+        self._task: Optional[asyncio.Task] = None
+        self._counts = {"written": 0, "dropped": 0, "failures": 0}
+
+    async def attach_store(self, database, retention_days: int):
+        """Create the time-series collections (or update their TTL) and start flushing"""
+        self.db = database
+        existing = {c["name"]: c async for c in database.list_collections(filter={"name": {"$in": list(COLLECTIONS.values())}})}
+        expire = int(retention_days * 86400)
+        for name in COLLECTIONS.values():
+            info = existing.get(name)
+            if info and info.get("type") != "timeseries":
+                # Declared earlier as a plain collection; only replace it when nothing was stored
+                if await database[name].estimated_document_count():
+                    logger.warning("%s is a regular collection with data; samples go there without TTL", name)
+                    continue
+                await database.drop_collection(name)
+                info = None
+            if info is None:
+                await database.create_collection(name, timeseries={
+                    "timeField": "timestamp", "metaField": "meta", "granularity": "minutes"
+                }, expireAfterSeconds=expire)
+            elif info.get("options", {}).get("expireAfterSeconds") != expire:
+                await database.command("collMod", name, expireAfterSeconds=expire)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def add(self, service: str, source: str, score: Optional[float], status: Optional[str],
+            values: Dict[str, Any], timestamp: Optional[datetime] = None):
+        buffer = self._buffers.get(service)
+        if buffer is None:
+            return
+        if len(buffer) >= self.max_buffered:
+            self._counts["dropped"] += 1
+            return
+        buffer.append({
+            "timestamp": timestamp or datetime.utcnow(),
+            "meta": {"source": source},
+            "status": status,
+            "values": {**_numeric(values), **({"score": score} if score is not None else {})},
+        })
+
+    def add_snapshot(self, snapshot, previous=None):
+        """SnapshotStore listener: one sample per poll"""
+        data = snapshot.data
+        if data.get("status") in ("disabled", "pending"):
+            return
+        values = {POLL_FIELDS.get(k, k): v for k, v in data.items() if k != "health_score"}
+        self.add(snapshot.service, "poll", data.get("health_score"), data.get("status"), values)
+
+    async def add_analyses(self, documents: List[Dict[str, Any]]):
+        """WriteBehindQueue batch hook: one sample per service of each persisted analysis"""
+        for document in documents:
+            for service, health in ((document.get("analysis") or {}).get("services") or {}).items():
+                health = health or {}
+                self.add(service, "analysis", health.get("score"), health.get("status"),
+                         health.get("stats") or {}, document["timestamp"])
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if self.db is None:
+            return
+        for service, name in COLLECTIONS.items():
+            samples, self._buffers[service] = self._buffers[service], []
+            if not samples:
+                continue
+            try:
+                await self.db[name].insert_many(samples, ordered=False)
+                self._counts["written"] += len(samples)
+            except Exception as e:
+                # Trend samples are not worth a spill file; the next poll replaces them
+                self._counts["failures"] += 1
+                self._counts["dropped"] += len(samples)
+                logger.warning("Could not write %d %s health samples: %s", len(samples), service, e)
+
+    async def query(self, service: str, start: datetime, end: datetime, points: int = 200,
+                    fields: Optional[List[str]] = None, source: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Downsample [start, end) into at most `points` buckets, each with the
+        sample count and avg/min/max per field
+        """
+        # Field names end up in aggregation paths, so only plain identifiers are accepted
+        fields = [f for f in fields or DEFAULT_FIELDS[service] if f.isidentifier()] or ["score"]
+        window = (end - start).total_seconds()
+        bucket_seconds = max(MIN_BUCKET_SECONDS, math.ceil(window / max(points, 1)))
+
+        match: Dict[str, Any] = {"timestamp": {"$gte": start, "$lt": end}}
+        if source:
+            match["meta.source"] = source
+        group: Dict[str, Any] = {
+            "_id": {"$dateTrunc": {"date": "$timestamp", "unit": "second", "binSize": bucket_seconds}},
+            "samples": {"$sum": 1},
+        }
+        for i, field in enumerate(fields):
+            group[f"avg{i}"] = {"$avg": f"$values.{field}"}
+            group[f"min{i}"] = {"$min": f"$values.{field}"}
+            group[f"max{i}"] = {"$max": f"$values.{field}"}
+
+        buckets = await self.db[COLLECTIONS[service]].aggregate([
+            {"$match": match},
+            {"$group": group},
+            {"$sort": {"_id": 1}},
+        ]).to_list(None)
+
+        return {
+            "service": service,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "bucket_seconds": bucket_seconds,
+            "fields": fields,
+            "points": [
+                {
+                    "timestamp": bucket["_id"].isoformat(),
+                    "samples": bucket["samples"],
+                    **{
+                        field: {"avg": bucket[f"avg{i}"], "min": bucket[f"min{i}"], "max": bucket[f"max{i}"]}
+                        for i, field in enumerate(fields)
+                    },
+                }
+                for bucket in buckets
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counts, "buffered": sum(len(b) for b in self._buffers.values())}
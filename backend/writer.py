@@ -0,0 +1,210 @@
+# backend/writer.py
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+from agent.log import get_logger
+
+logger = get_logger("writer")
+
+DUPLICATE_KEY = 11000
+
+Document = Dict[str, Any]
+
+
+class _Pending:
+    __slots__ = ("enqueued_at", "document", "on_written")
+
+    def __init__(self, document: Union[Document, Callable[[], Document]],
+                 on_written: Optional[Callable[[float], None]] = None, enqueued_at: Optional[float] = None):
+        self.enqueued_at = enqueued_at if enqueued_at is not None else time.monotonic()
+        self.document = document
+        self.on_written = on_written
+
+    def build(self) -> Document:
+        if callable(self.document):
+            self.document = self.document()
+        return self.document
+
+
+class WriteBehindQueue:
+    """
+    Batches inserts off the request path. Documents (or zero-argument
+    builders, so serialization also happens here) are flushed with
+    insert_many once `batch_size` are queued or `flush_interval` elapses.
+    Failed batches are retried with backoff; past `max_pending` queued
+    documents, or when a batch keeps failing, they are appended to a bounded
+    NDJSON spill file that is replayed once writes succeed again.
+    Documents must carry their own `_id` so a retried batch is idempotent.
+    `on_batch` is awaited with every batch once it is written.
+    """
+
+    def __init__(self, collection=None, batch_size: int = 50, flush_interval: float = 0.5,
+                 max_pending: int = 5000, max_attempts: int = 5, retry_base: float = 0.5,
+                 spill_path: Optional[str] = None, max_spill_bytes: int = 50 * 1024 * 1024,
+                 on_batch: Optional[Callable[[List[Document]], Awaitable[None]]] = None):
+        self.collection = collection
+        self.on_batch = on_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.spill_path = spill_path or os.getenv("PERSIST_SPILL_PATH", "persist_spill.ndjson")
+        self.max_spill_bytes = max_spill_bytes
+        self._pending: Deque[_Pending] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lags: Deque[float] = deque(maxlen=200)
+        self._counts = {"written": 0, "batches": 0, "failures": 0, "spilled": 0, "replayed": 0, "dropped": 0}
+
+    def attach_store(self, collection):
+        self.collection = collection
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write (or spill) everything still queued"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._pending:
+            batch = self._take()
+            if not await self._write(batch, attempts=1):
+                await self._spill(batch)
+        logger.info("Write-behind queue flushed: %d written, %d spilled", self._counts["written"], self._counts["spilled"])
+
+    def enqueue(self, document: Union[Document, Callable[[], Document]],
+                on_written: Optional[Callable[[float], None]] = None):
+        """Queue a document; never waits on the database. on_written gets the lag in ms."""
+        self._pending.append(_Pending(document, on_written))
+        if self._wakeup and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _take(self) -> List[_Pending]:
+        return [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+
+    async def _run(self):
+        # Documents spilled by a previous run
+        await self._replay()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # Past the in-memory bound, overflow goes to disk rather than growing
+            while len(self._pending) > self.max_pending:
+                await self._spill(self._take())
+
+            wrote = False
+            while self._pending:
+                batch = self._take()
+                if await self._write(batch, self.max_attempts):
+                    wrote = True
+                else:
+                    await self._spill(batch)
+                    break
+            if wrote and not self._pending:
+                await self._replay()
+
+    async def _write(self, batch: List[_Pending], attempts: int) -> bool:
+        if self.collection is None:
+            return False
+        documents = [item.build() for item in batch]
+        for attempt in range(attempts):
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+                break
+            except BulkWriteError as e:
+                # Documents inserted by an earlier attempt come back as duplicates
+                if all(err.get("code") == DUPLICATE_KEY for err in e.details.get("writeErrors", [])) \
+                        and not e.details.get("writeConcernErrors"):
+                    break
+                error = e
+            except Exception as e:
+                error = e
+            self._counts["failures"] += 1
+            logger.warning("Batch insert of %d documents failed (attempt %d/%d): %s",
+                           len(documents), attempt + 1, attempts, error)
+            if attempt + 1 < attempts:
+                await asyncio.sleep(self.retry_base * 2 ** attempt)
+        else:
+            return False
+
+        now = time.monotonic()
+        self._counts["written"] += len(batch)
+        self._counts["batches"] += 1
+        for item in batch:
+            lag_ms = (now - item.enqueued_at) * 1000
+            self._lags.append(lag_ms)
+            if item.on_written:
+                try:
+                    item.on_written(lag_ms)
+                except Exception as e:
+                    logger.warning("Write callback failed: %s", e)
+        if self.on_batch:
+            try:
+                await self.on_batch(documents)
+            except Exception as e:
+                logger.warning("Batch hook failed: %s", e)
+        return True
+
+    async def _spill(self, batch: List[_Pending]):
+        lines = "".join(json_util.dumps(item.build()) + "\n" for item in batch)
+        try:
+            written = await asyncio.to_thread(self._append, lines)
+        except OSError as e:
+            logger.error("Could not spill %d documents to %s: %s", len(batch), self.spill_path, e)
+            written = False
+        if written:
+            self._counts["spilled"] += len(batch)
+        else:
+            self._counts["dropped"] += len(batch)
+            logger.error("Dropped %d documents: spill file %s is full", len(batch), self.spill_path)
+
+    def _append(self, lines: str) -> bool:
+        size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+        if size + len(lines) > self.max_spill_bytes:
+            return False
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        return True
+
+    async def _replay(self):
+        """Requeue spilled documents once the database is accepting writes again"""
+        if not os.path.exists(self.spill_path):
+            return
+        documents = await asyncio.to_thread(self._read_spill)
+        for document in documents:
+            self._pending.append(_Pending(document))
+        self._counts["replayed"] += len(documents)
+        logger.info("Replaying %d spilled documents", len(documents))
+
+    def _read_spill(self) -> List[Document]:
+        # Spill and replay both run on the flusher task, so nothing appends meanwhile
+        with open(self.spill_path, encoding="utf-8") as f:
+            documents = [json_util.loads(line) for line in f if line.strip()]
+        os.remove(self.spill_path)
+        return documents
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self._lags)
+        spill_bytes = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+        return {
+            **self._counts,
+            "pending": len(self._pending),
+            "oldest_pending_seconds": round(time.monotonic() - self._pending[0].enqueued_at, 3) if self._pending else 0,
+            "lag_p50_ms": round(lags[len(lags) // 2], 1) if lags else None,
+            "lag_max_ms": round(lags[-1], 1) if lags else None,
+            "spill_bytes": spill_bytes,
+        }
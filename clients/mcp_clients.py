@@ -1,5 +1,36 @@
+import time
+
 from fastmcp import Client
 
-k8s = Client("http://127.0.0.1:9000/mcp")
-aws = Client("http://127.0.0.1:9001/mcp")
-github = Client("http://127.0.0.1:9002/mcp")
+from agent.metrics import REGISTRY, tool_result_failed
+
+MCP_TOOL_SECONDS = REGISTRY.histogram(
+    "mcp_client_tool_duration_seconds", "MCP tool call latency seen by the agent", ("server", "tool", "outcome")
+)
+MCP_TOOL_ERRORS = REGISTRY.counter("mcp_client_tool_errors", "MCP tool calls that raised or returned an error",
+                                   ("server", "tool"))
+
+
+class InstrumentedClient(Client):
+    """fastmcp Client that records latency and errors for every tool call"""
+
+    def __init__(self, server: str, url: str):
+        super().__init__(url)
+        self.server = server
+
+    async def call_tool(self, name, arguments=None, *args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await super().call_tool(name, arguments, *args, **kwargs)
+            outcome = "error" if tool_result_failed(result) else "success"
+            return result
+        finally:
+            MCP_TOOL_SECONDS.observe(time.perf_counter() - start, self.server, name, outcome)
+            if outcome == "error":
+                MCP_TOOL_ERRORS.inc(self.server, name)
+
+
+k8s = InstrumentedClient("k8s", "http://127.0.0.1:9000/mcp")
+aws = InstrumentedClient("aws", "http://127.0.0.1:9001/mcp")
+github = InstrumentedClient("github", "http://127.0.0.1:9002/mcp")
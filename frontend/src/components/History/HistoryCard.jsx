@@ -4,6 +4,8 @@ import { Clock, CheckCircle, AlertTriangle, XCircle } from "lucide-react";
 
 const HistoryCard = ({ analysis }) => {
   const navigate = useNavigate();
+  // Stored records nest the result under `analysis`; in-memory ones are flat
+  const result = analysis.analysis || analysis;
 
   const getStatusIcon = (status) => {
     switch (String(status).toUpperCase()) {
@@ -17,12 +19,12 @@ const HistoryCard = ({ analysis }) => {
   return (
     <div
       className="border border-gray-200 bg-white rounded-xl p-4 hover:shadow cursor-pointer transition"
-      onClick={() => navigate(`/analysis/${analysis.id}`)} // ✅ OPEN BY ID
+      onClick={() => navigate(`/analysis/${result.id || analysis._id}`)} // ✅ OPEN BY ID
     >
       <div className="flex items-center justify-between">
         <div className="flex items-center space-x-2">
-          {getStatusIcon(analysis.overall_status)}
-          <p className="font-semibold text-gray-800">{analysis.overall_status}</p>
+          {getStatusIcon(result.overall_status)}
+          <p className="font-semibold text-gray-800">{result.overall_status}</p>
         </div>
         <p className="text-sm text-gray-500">{new Date(analysis.timestamp).toLocaleString()}</p>
       </div>
@@ -9,7 +9,7 @@ import {
   CheckCircle,
   XCircle,
 } from "lucide-react";
-import { getAnalysisHistory } from "../services/api";
+import { getAnalysisHistoryPage, subscribeEvents } from "../services/api";
 // import LoadingSpinner from "../components/Common/LoadingSpinner";
 // import LoadingSpinner from "../components/common/LoadingSpinner";
 import LoadingSpinner from "../components/Common/LoadingSpinner";
@@ -19,6 +19,8 @@ import HistoryCard from "../components/History/HistoryCard";
 
 const AnalysisHistory = () => {
   const [analyses, setAnalyses] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState("");
@@ -27,13 +29,18 @@ const AnalysisHistory = () => {
 
   useEffect(() => {
     loadHistory();
+    // New analyses arrive as summaries instead of re-polling the history
+    return subscribeEvents({
+      analysis: (summary) => setAnalyses((prev) => [summary, ...prev]),
+    });
   }, []);
 
   const loadHistory = async () => {
     try {
       setLoading(true);
-      const data = await getAnalysisHistory(50);
-      setAnalyses(data);
+      const page = await getAnalysisHistoryPage({ limit: 50 });
+      setAnalyses(page.items);
+      setNextCursor(page.next_cursor);
     } catch (err) {
       setError(err.message);
     } finally {
@@ -41,6 +48,19 @@ const AnalysisHistory = () => {
     }
   };
 
+  const loadOlder = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getAnalysisHistoryPage({ limit: 50, cursor: nextCursor });
+      setAnalyses((prev) => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const filteredAnalyses = analyses.filter((analysis) => {
     const matchesSearch =
       analysis.query?.toLowerCase().includes(searchTerm.toLowerCase()) ||
@@ -293,6 +313,15 @@ const AnalysisHistory = () => {
             <HistoryCard key={analysis._id} analysis={analysis} />
           ))
         )}
+        {nextCursor && (
+          <button
+            onClick={loadOlder}
+            disabled={loadingMore}
+            className="w-full py-2 text-sm text-gray-600 border border-gray-200 rounded-lg hover:bg-gray-50 disabled:opacity-50"
+          >
+            {loadingMore ? "Loading..." : "Load older analyses"}
+          </button>
+        )}
       </div>
     </div>
   );
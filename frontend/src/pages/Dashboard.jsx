@@ -5,7 +5,7 @@ import ServiceCard from '../components/Dashboard/ServiceCard';
 // import MetricsChart from '../components/Dashboard/MetricsChart';
 import MetricsChart from '../components/Dashboard/MetricsChat'
 import StatusBadge from '../components/Dashboard/StatusBadge';
-import { getSystemMetrics } from '../services/api';
+import { getSystemMetrics, subscribeEvents } from '../services/api';
 
 const Dashboard = () => {
   const [metrics, setMetrics] = useState(null);
@@ -13,20 +13,31 @@ const Dashboard = () => {
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    loadMetrics();
-  }, []);
+    // One-shot snapshot, so the page renders even if the stream is slow to
+    // connect or unavailable; it never overwrites a frame already received
+    getSystemMetrics()
+      .then((data) => setMetrics((prev) => prev || data))
+      .catch((err) => setError(err.message))
+      .finally(() => setLoading(false));
 
-  const loadMetrics = async () => {
-    try {
-      setLoading(true);
-      const data = await getSystemMetrics();
-      setMetrics(data);
-    } catch (err) {
-      setError(err.message);
-    } finally {
+    // The first metrics frame is the full snapshot; later ones carry only
+    // the services that changed
+    return subscribeEvents({
+      metrics: (data) => {
+        const { changed, ...rest } = data;
+        setMetrics((prev) => ({
+          ...prev,
+          ...rest,
+          services: { ...prev?.services, ...(rest.services || changed) },
+        }));
+        setError(null);
+        setLoading(false);
+      },
+    }, () => {
+      setError('Live updates disconnected, reconnecting...');
       setLoading(false);
-    }
-  };
+    });
+  }, []);
 
   const services = [
     {
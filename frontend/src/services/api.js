@@ -142,14 +142,97 @@ export const analyzeIncident = async (requestData) => {
   });
 };
 
+// Streaming analysis over Server-Sent Events. onEvent(eventName, data) is
+// called for routing, service, cache, token, analysis and error events.
+export const streamAnalysis = async (requestData, onEvent) => {
+  const request = {
+    query: requestData.query,
+    priority: requestData.priority || 'medium',
+  };
+
+  if (requestData.services) {
+    request.services = requestData.services;
+  }
+
+  const response = await fetch(`${API_BASE_URL}/analyze-incident/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(request),
+  });
+
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = 'message';
+      let data = '';
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+
+      const parsed = data ? JSON.parse(data) : null;
+      if (eventName === 'analysis') result = parsed;
+      onEvent?.(eventName, parsed);
+    }
+  }
+
+  return result;
+};
+
+// Live dashboard events over Server-Sent Events. handlers maps event names
+// (metrics, analysis, resync) to callbacks; returns a function that closes
+// the stream. The server ends the stream of a client that falls behind and
+// EventSource reconnects on its own, receiving a full metrics frame again.
+// onError is called when the connection drops or cannot be opened.
+export const subscribeEvents = (handlers, onError) => {
+  const source = new EventSource(`${API_BASE_URL}/events`);
+  for (const [eventName, handler] of Object.entries(handlers)) {
+    source.addEventListener(eventName, (event) => handler(JSON.parse(event.data)));
+  }
+  if (onError) source.onerror = onError;
+  return () => source.close();
+};
+
 export const getAnalysisHistory = async (limit = 20) => {
   return await apiCall(`/analysis/history?limit=${limit}`);
 };
 
+// Keyset-paginated history: returns { items, next_cursor }. Pass next_cursor
+// back as `cursor` for the following page; it is null on the last page.
+export const getAnalysisHistoryPage = async ({ limit = 20, cursor, service, severity, status } = {}) => {
+  const params = new URLSearchParams({ limit });
+  if (cursor) params.append('cursor', cursor);
+  if (service) params.append('service', service);
+  if (severity) params.append('severity', severity);
+  if (status) params.append('status', status);
+  return await apiCall(`/analysis/history/page?${params}`);
+};
+
 export const getAnalysisById = async (analysisId) => {
   return await apiCall(`/analysis/${analysisId}`);
 };
 
+// Raw service data is fetched on demand via the raw_ref in each service health
+export const getRawData = async (ref) => {
+  return await apiCall(`/analysis/raw/${ref}`);
+};
+
 // Service-specific analysis
 export const analyzeK8s = async (query, namespace = null) => {
   const params = new URLSearchParams({ query });
@@ -277,8 +360,12 @@ export default {
   
   // Analysis methods
   analyzeIncident,
+  streamAnalysis,
+  subscribeEvents,
   getAnalysisHistory,
+  getAnalysisHistoryPage,
   getAnalysisById,
+  getRawData,
   analyzeK8s,
   analyzeAWS,
   analyzeGitHub,
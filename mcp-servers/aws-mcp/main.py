@@ -6,6 +6,7 @@ import datetime
 from dotenv import load_dotenv
 import os
 from pathlib import Path
+import sys
 
 # Robustly find .env file (2 directories up)
 env_path = Path(__file__).resolve().parents[2] / ".env"
@@ -14,6 +15,14 @@ load_dotenv(env_path)
 
 mcp = FastMCP("aws-cloudwatch-logs")
 
+# Shared Prometheus instrumentation and logging live in the repo's agent package
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from agent.metrics import instrument_mcp_server
+from agent.log import setup_logging, add_log_level_route
+instrument_mcp_server(mcp, "aws")
+logger = setup_logging("aws-mcp")
+add_log_level_route(mcp)
+
 
 # Explicitly set AWS_DEFAULT_REGION if not set, as some boto3 versions prefer it
 if os.getenv("AWS_REGION") and not os.getenv("AWS_DEFAULT_REGION"):
@@ -37,6 +46,25 @@ def _now():
     return datetime.datetime.utcnow().isoformat()
 
 
+# -----------------------------
+# CONNECTIVITY
+# -----------------------------
+@mcp.tool()
+def ping() -> Dict[str, Any]:
+    """
+    Cheap connectivity check: one describe_log_groups call with limit=1.
+    """
+    try:
+        client = _cw()
+        client.describe_log_groups(limit=1)
+        return {"success": True, "region": client.meta.region_name, "checked_at": _now()}
+    except ClientError as e:
+        logger.warning("CloudWatch Logs ping failed: %s", e)
+        return {"success": False, "error": e.response["Error"]["Message"], "code": e.response["Error"]["Code"]}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 # -----------------------------
 # LOG GROUPS
 # -----------------------------
@@ -73,6 +101,7 @@ def list_log_groups(prefix: Optional[str] = None) -> Dict[str, Any]:
         }
 
     except ClientError as e:
+        logger.warning("CloudWatch Logs call failed: %s", e)
         return {"success": False, "error": e.response["Error"]["Message"], "code": e.response["Error"]["Code"]}
 
 
@@ -108,6 +137,7 @@ def list_log_streams(log_group: str) -> Dict[str, Any]:
         }
 
     except ClientError as e:
+        logger.warning("CloudWatch Logs call failed: %s", e)
         return {"success": False, "error": e.response["Error"]["Message"], "code": e.response["Error"]["Code"]}
 
 
@@ -153,8 +183,10 @@ def get_log_events(log_group: str, log_stream: str, limit: int = 200) -> Dict[st
         }
 
     except ClientError as e:
+        logger.warning("CloudWatch Logs call failed: %s", e)
         return {"success": False, "error": e.response["Error"]["Message"], "code": e.response["Error"]["Code"]}
 
 
 if __name__ == "__main__":
+    logger.info("Starting AWS MCP Server...")
     mcp.run(transport="http", host="0.0.0.0", port=9001)
@@ -1,12 +1,21 @@
 from fastmcp import FastMCP
-import os, requests, base64
+import os, sys, requests, base64
+from pathlib import Path
 from github import Github, GithubException
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 load_dotenv()
 mcp = FastMCP("github-actions")
 
+# Shared Prometheus instrumentation and logging live in the repo's agent package
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from agent.metrics import instrument_mcp_server
+from agent.log import setup_logging, add_log_level_route
+instrument_mcp_server(mcp, "github")
+logger = setup_logging("github-mcp")
+add_log_level_route(mcp)
+
 # ----------------------------
 # AUTH HELPERS
 # ----------------------------
@@ -33,6 +42,107 @@ def _req(method, endpoint, **kwargs):
     except:
         return r.text
 
+def _graphql(query, variables=None):
+    token = os.getenv("GITHUB_TOKEN")
+    headers = {"Authorization": f"bearer {token}"}
+    r = requests.post(
+        "https://api.github.com/graphql",
+        json={"query": query, "variables": variables or {}},
+        headers=headers
+    )
+    if not r.ok:
+        raise Exception(f"{r.status_code} {r.text}")
+    body = r.json()
+    if body.get("errors") and not body.get("data"):
+        raise Exception("; ".join(e.get("message", "unknown error") for e in body["errors"]))
+    return body
+
+
+# Commit history with check suites/runs for one repository. Each repo gets
+# its own alias (r0, r1, ...) so N repos still cost a single round trip.
+_CI_REPO_FRAGMENT = """
+  r%(i)d: repository(owner: $owner%(i)d, name: $name%(i)d) {
+    nameWithOwner
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $first, after: $after%(i)d) {
+            pageInfo { hasNextPage endCursor }
+            nodes {
+              oid
+              messageHeadline
+              committedDate
+              url
+              author { name user { login } }
+              checkSuites(first: 10) {
+                nodes {
+                  status
+                  conclusion
+                  app { slug }
+                  workflowRun {
+                    databaseId
+                    runNumber
+                    event
+                    createdAt
+                    url
+                    workflow { name }
+                  }
+                  checkRuns(first: 20) {
+                    nodes { name status conclusion startedAt completedAt detailsUrl }
+                  }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+"""
+
+_CI_RATE_LIMIT = "rateLimit { cost remaining limit resetAt }"
+
+# GitHub caps connection pages at 100 nodes
+_CI_PAGE_SIZE = 100
+
+
+def _ci_commit(node):
+    suites = []
+    for suite in (node.get("checkSuites") or {}).get("nodes", []):
+        run = suite.get("workflowRun") or {}
+        suites.append({
+            "app": (suite.get("app") or {}).get("slug"),
+            "status": (suite.get("status") or "").lower(),
+            "conclusion": (suite.get("conclusion") or "").lower() or None,
+            "workflow": (run.get("workflow") or {}).get("name"),
+            "run_id": run.get("databaseId"),
+            "run_number": run.get("runNumber"),
+            "event": run.get("event"),
+            "created_at": run.get("createdAt"),
+            "url": run.get("url"),
+            "check_runs": [
+                {
+                    "name": cr["name"],
+                    "status": (cr.get("status") or "").lower(),
+                    "conclusion": (cr.get("conclusion") or "").lower() or None,
+                    "started_at": cr.get("startedAt"),
+                    "completed_at": cr.get("completedAt"),
+                    "url": cr.get("detailsUrl"),
+                }
+                for cr in (suite.get("checkRuns") or {}).get("nodes", [])
+            ]
+        })
+
+    author = node.get("author") or {}
+    return {
+        "sha": node["oid"],
+        "message": node.get("messageHeadline"),
+        "committed_at": node.get("committedDate"),
+        "author": (author.get("user") or {}).get("login") or author.get("name"),
+        "url": node.get("url"),
+        "check_suites": suites
+    }
+
 
 # ----------------------------
 # CORE TOOLS
@@ -63,6 +173,22 @@ def gh_list_workflow_runs(owner: str, repo: str, limit: int = 5) -> Dict[str, An
     }
 
 
+@mcp.tool()
+def gh_ping(owner: Optional[str] = None, repo: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Cheap connectivity check: validates the token and, if given, repo access.
+    """
+    try:
+        if owner and repo:
+            data = _req("GET", f"/repos/{owner}/{repo}")
+            return {"success": True, "repo": data.get("full_name"), "private": data.get("private")}
+        # /rate_limit does not count against the rate limit
+        core = _req("GET", "/rate_limit").get("resources", {}).get("core", {})
+        return {"success": True, "rate_limit_remaining": core.get("remaining")}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 @mcp.tool()
 def gh_check_workflow_health(owner: str, repo: str) -> Dict[str, Any]:
     """
@@ -102,6 +228,94 @@ def gh_check_workflow_health(owner: str, repo: str) -> Dict[str, Any]:
     return {"status": "success"}
 
 
+@mcp.tool()
+def gh_ci_overview(repos: List[str], commits: int = 10) -> Dict[str, Any]:
+    """
+    Fetch check suites, check runs and commit metadata for the last N commits
+    of each "owner/repo" in one batched GraphQL query (paginated past 100).
+    """
+    targets = {}
+    for i, full_name in enumerate(repos):
+        owner, _, name = full_name.partition("/")
+        if not owner or not name:
+            return {"success": False, "error": f"Invalid repository '{full_name}', expected owner/repo"}
+        targets[i] = {"owner": owner, "name": name, "full_name": full_name, "after": None, "commits": []}
+
+    cost = {"queries": 0, "total_cost": 0, "remaining": None, "limit": None, "reset_at": None}
+    pending = dict(targets)
+
+    while pending:
+        first = min(_CI_PAGE_SIZE, max(commits - min(len(t["commits"]) for t in pending.values()), 1))
+        declarations = ["$first: Int!"]
+        variables = {"first": first}
+        fragments = []
+        for i, t in pending.items():
+            declarations += [f"$owner{i}: String!", f"$name{i}: String!", f"$after{i}: String"]
+            variables.update({f"owner{i}": t["owner"], f"name{i}": t["name"], f"after{i}": t["after"]})
+            fragments.append(_CI_REPO_FRAGMENT % {"i": i})
+
+        query = f"query({', '.join(declarations)}) {{{''.join(fragments)}  {_CI_RATE_LIMIT}\n}}"
+        data = _graphql(query, variables)["data"]
+
+        rate = data.get("rateLimit") or {}
+        cost["queries"] += 1
+        cost["total_cost"] += rate.get("cost", 0)
+        cost.update(remaining=rate.get("remaining"), limit=rate.get("limit"), reset_at=rate.get("resetAt"))
+
+        for i in list(pending):
+            t = pending[i]
+            repo_data = data.get(f"r{i}") or {}
+            target = (repo_data.get("defaultBranchRef") or {}).get("target") or {}
+            history = target.get("history") or {}
+            t["commits"].extend(_ci_commit(n) for n in history.get("nodes", []))
+            page = history.get("pageInfo") or {}
+            if len(t["commits"]) >= commits or not page.get("hasNextPage"):
+                del pending[i]
+            else:
+                t["after"] = page.get("endCursor")
+
+    results = {}
+    for t in targets.values():
+        commit_list = t["commits"][:commits]
+        runs = [
+            {
+                "id": s["run_id"],
+                "name": s["workflow"],
+                "event": s["event"],
+                "status": s["status"],
+                "conclusion": s["conclusion"],
+                "created_at": s["created_at"],
+                "head_sha": c["sha"],
+                "failed_checks": [cr["name"] for cr in s["check_runs"] if cr["conclusion"] == "failure"]
+            }
+            for c in commit_list for s in c["check_suites"] if s["run_id"]
+        ]
+        runs.sort(key=lambda r: r["created_at"] or "", reverse=True)
+
+        # Same rule as gh_check_workflow_health: latest completed run decides
+        status, failed_run = "success", None
+        for run in runs:
+            if run["status"] == "completed" and run["conclusion"] in ("success", "failure"):
+                if run["conclusion"] == "failure":
+                    status, failed_run = "failure", run
+                break
+
+        results[t["full_name"]] = {
+            "status": status,
+            "failed_run": failed_run,
+            "commits": commit_list,
+            "runs": runs
+        }
+
+    return {
+        "success": True,
+        "count": len(results),
+        "repos": results,
+        "query_cost": cost,
+        "retrieved_at": datetime.utcnow().isoformat()
+    }
+
+
 @mcp.tool()
 def gh_get_failure_logs(owner: str, repo: str, run_id: int) -> Dict[str, Any]:
     """
@@ -169,4 +383,5 @@ def gh_create_issue(owner: str, repo: str, title: str, body: str) -> Dict[str, A
 
 
 if __name__ == "__main__":
+    logger.info("Starting GitHub MCP Server...")
     mcp.run(transport="http", host="0.0.0.0", port=9002)
@@ -7,6 +7,7 @@ import datetime
 from dotenv import load_dotenv
 import os
 from pathlib import Path
+import sys
 
 # Robustly find .env file (2 directories up)
 env_path = Path(__file__).resolve().parents[2] / ".env"
@@ -15,6 +16,14 @@ load_dotenv(env_path)
 
 mcp = FastMCP("k8s-observability")
 
+# Shared Prometheus instrumentation and logging live in the repo's agent package
+sys.path.append(str(Path(__file__).resolve().parents[2]))
+from agent.metrics import instrument_mcp_server
+from agent.log import setup_logging, add_log_level_route
+instrument_mcp_server(mcp, "k8s")
+logger = setup_logging("k8s-mcp")
+add_log_level_route(mcp)
+
 def _core() -> client.CoreV1Api:
     """Load kube config automatically for local or in-cluster use."""
     try:
@@ -51,7 +60,7 @@ def list_pods(namespace: Optional[str] = None) -> List[Dict[str, Any]]:
         else:
             pods = core.list_pod_for_all_namespaces()
         
-        print(f"DEBUG: Found {len(pods.items)} pods")
+        logger.debug("Found %d pods", len(pods.items))
         
         results = []
         for p in pods.items:
@@ -105,15 +114,14 @@ def list_pods(namespace: Optional[str] = None) -> List[Dict[str, Any]]:
             pod_info["annotations"] = p.metadata.annotations or {}
             
             results.append(pod_info)
-            print(f"DEBUG: Pod {p.metadata.name} - Phase: {p.status.phase}")
 
         return results
 
     except ApiException as e:
-        print(f"ERROR: Failed to list pods: {e}")
+        logger.error("Failed to list pods: %s", e)
         return [{"error": f"Failed to list pods: {e.reason}", "status_code": e.status}]
     except Exception as e:
-        print(f"ERROR: Unexpected error listing pods: {e}")
+        logger.exception("Unexpected error listing pods: %s", e)
         return [{"error": f"Unexpected error: {str(e)}"}]
 
 @mcp.tool()
@@ -125,7 +133,7 @@ def get_nodes() -> List[Dict[str, Any]]:
     
     try:
         nodes = core.list_node()
-        print(f"DEBUG: Found {len(nodes.items)} nodes")
+        logger.debug("Found %d nodes", len(nodes.items))
         
         results = []
         for node in nodes.items:
@@ -172,15 +180,15 @@ def get_nodes() -> List[Dict[str, Any]]:
                 })
             
             results.append(node_info)
-            print(f"DEBUG: Node {node.metadata.name} - Ready: {ready_status}")
+            logger.debug("Node %s ready=%s", node.metadata.name, ready_status)
 
         return results
 
     except ApiException as e:
-        print(f"ERROR: Failed to list nodes: {e}")
+        logger.error("Failed to list nodes: %s", e)
         return [{"error": f"Failed to list nodes: {e.reason}", "status_code": e.status}]
     except Exception as e:
-        print(f"ERROR: Unexpected error listing nodes: {e}")
+        logger.exception("Unexpected error listing nodes: %s", e)
         return [{"error": f"Unexpected error: {str(e)}"}]
 
 # Add a simple health check tool
@@ -203,6 +211,16 @@ def health_check() -> Dict[str, Any]:
             "timestamp": datetime.datetime.utcnow().isoformat()
         }
 
+@mcp.tool()
+def ping() -> Dict[str, Any]:
+    """Cheap connectivity check: fetch the API server version."""
+    try:
+        _core()  # loads kube config
+        version = client.VersionApi().get_code()
+        return {"success": True, "server_version": version.git_version, "timestamp": datetime.datetime.utcnow().isoformat()}
+    except Exception as e:
+        return {"success": False, "error": str(e), "timestamp": datetime.datetime.utcnow().isoformat()}
+
 if __name__ == "__main__":
-    print("Starting K8s MCP Server...")
+    logger.info("Starting K8s MCP Server...")
     mcp.run(transport="http", host="0.0.0.0", port=9000)
\ No newline at end of file